@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is the persistent store of the per-file outputs of the analysis scripts, so a run only
+analyses the experiment files that are new or changed since the previous run and rebuilds its
+aggregates from the stored partials.
+
+Every output is keyed by the analysis, the fingerprint of the parameters it was computed with, the
+content hash of its file (see dataset_cache.py) and an optional item, such as the column of a
+Granger Causality pair. Outputs computed with other parameters are kept side by side, and the
+parameters of every fingerprint are recorded so the store can be inspected:
+
+    sqlite3 .analysis_store.sqlite "SELECT analysis, fingerprint, params FROM parameters"
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import json
+import sqlite3
+import hashlib
+
+STORE_PATH = '.analysis_store.sqlite'
+STORE_VERSION = 1
+MAX_QUERY_VARIABLES = 500
+
+
+def _to_json(value):
+    # NumPy scalars and arrays, as returned by the analyses
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def fingerprint(analysis, params):
+    """
+    Returns the fingerprint of the parameters of an analysis, a hex digest of their canonical JSON.
+    """
+    payload = json.dumps({'analysis': analysis, 'version': STORE_VERSION, 'params': params}, sort_keys=True,
+                         default=_to_json)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class AnalysisStore:
+    """
+    SQLite store of JSON encoded per-file outputs keyed by (analysis, fingerprint, file hash, item).
+    Every put is committed immediately, so an interrupted run keeps the files it finished.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (analysis TEXT, fingerprint TEXT, file_hash TEXT, item TEXT, "
+                "result TEXT, PRIMARY KEY (analysis, fingerprint, file_hash, item))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS parameters (fingerprint TEXT PRIMARY KEY, analysis TEXT, params TEXT)"
+            )
+
+    def register(self, analysis, params):
+        """
+        Record the parameters of an analysis and return their fingerprint.
+        """
+        key = fingerprint(analysis, params)
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO parameters VALUES (?, ?, ?)",
+                                    (key, analysis, json.dumps(params, sort_keys=True, default=_to_json)))
+        return key
+
+    def get(self, analysis, key, file_hashes):
+        """
+        Returns the stored outputs of the given files, as a dict from (file hash, item) to output.
+        """
+        file_hashes = list(dict.fromkeys(file_hashes))
+        results = {}
+        for start in range(0, len(file_hashes), MAX_QUERY_VARIABLES):
+            chunk = file_hashes[start:start + MAX_QUERY_VARIABLES]
+            rows = self.connection.execute(
+                f"SELECT file_hash, item, result FROM results WHERE analysis = ? AND fingerprint = ? "
+                f"AND file_hash IN ({', '.join('?' * len(chunk))})",
+                (analysis, key, *chunk),
+            )
+            results.update({(file_hash, item): json.loads(result) for file_hash, item, result in rows})
+        return results
+
+    def put(self, analysis, key, entries):
+        """
+        Store (file hash, item, output) entries of an analysis.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                [(analysis, key, file_hash, item, json.dumps(result, default=_to_json))
+                 for file_hash, item, result in entries],
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
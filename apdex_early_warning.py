@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script is a long-running early-warning stage built on the VAR forecaster of forecast.py.
+Metric samples with the schema of the datasets are ingested one at a time, kept in a bounded
+ring buffer per service, and every sample emits the next TEST_SIZE Apdex forecasts and a
+THRESHOLD breach flag as a JSON line.
+
+The fitted model of a service is cached and only refit every REFIT_EVERY samples. At each
+refit the TEST_SIZE step forecast is reduced to a single matrix, so a sample costs one
+matrix-vector product. A dataset CSV can be replayed from a file (optionally following
+appended lines, like tail -f) or from stdin to benchmark the stage offline:
+
+    python apdex_early_warning.py --follow "datasets/cpu_experiments/<file>.csv"
+    cat <file>.csv | python apdex_early_warning.py --service checkout
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+import forecast
+
+FEATURES = ['latency', 'traffic', 'average.cpuPercent_x', 'average.cpuPercent_y',
+            'average.memoryUsedPercent_x', 'average.memoryUsedPercent_y', 'apdex']
+BUFFER_SIZE = 120  # One hour of 30 second samples
+REFIT_EVERY = 20
+POLL_INTERVAL_SECONDS = 0.5
+
+logging.basicConfig(level=logging.INFO)
+
+
+class RingBuffer:
+    """Fixed-capacity buffer of the most recent samples of one service."""
+
+    def __init__(self, capacity, width):
+        self.values = np.empty((capacity, width))
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0
+
+    def append(self, row):
+        self.values[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def latest(self, count):
+        """The last count samples, most recent first."""
+        return self.values[(self.head - 1 - np.arange(count)) % self.capacity]
+
+    def to_array(self):
+        """All buffered samples in chronological order."""
+        return self.latest(self.size)[::-1]
+
+
+class ServiceForecaster:
+    """Ring buffer and cached forecast map of one service."""
+
+    def __init__(self, buffer_size=BUFFER_SIZE, refit_every=REFIT_EVERY):
+        self.buffer = RingBuffer(buffer_size, len(FEATURES))
+        self.refit_every = refit_every
+        self.samples_since_refit = 0
+        self.lag_order = None
+        self.forecast_map = None
+
+    def refit(self):
+        """
+        Select the lag order and fit the VAR on the buffered samples, then fold the TEST_SIZE
+        step forecast recursion into a matrix acting on [1, y_t, ..., y_{t-p+1}].
+        """
+        values = self.buffer.to_array()
+        lag_order = forecast.select_lag_order(values, 0, len(values))
+        model = forecast.IncrementalVAR(lag_order, len(FEATURES)).fit(values, lag_order, len(values))
+
+        n_vars = len(FEATURES)
+        size = 1 + n_vars * max(lag_order, 1)
+        transition = np.zeros((size, size))
+        transition[0, 0] = 1.0
+        transition[1:1 + n_vars, :1 + n_vars * lag_order] = model.params.T
+        transition[1 + n_vars:, 1:size - n_vars] = np.eye(size - 1 - n_vars)
+
+        apdex = FEATURES.index('apdex')
+        power = np.eye(size)
+        rows = []
+        for _ in range(forecast.TEST_SIZE):
+            power = transition @ power
+            rows.append(power[1 + apdex])
+
+        self.lag_order = lag_order
+        self.forecast_map = np.array(rows)
+        self.samples_since_refit = 0
+
+    def ingest(self, row):
+        """Buffer a sample and return its Apdex forecasts, or None until enough samples arrived."""
+        self.buffer.append(row)
+        self.samples_since_refit += 1
+
+        if self.buffer.size < forecast.MIN_TRAIN_SIZE:
+            return None
+        if self.forecast_map is None or self.samples_since_refit >= self.refit_every:
+            self.refit()
+
+        state = np.concatenate(([1.0], self.buffer.latest(max(self.lag_order, 1)).ravel()))
+        return self.forecast_map @ state
+
+
+class ApdexEarlyWarning:
+    """Routes samples to the forecaster of their service and flags predicted THRESHOLD breaches."""
+
+    def __init__(self, buffer_size=BUFFER_SIZE, refit_every=REFIT_EVERY):
+        self.buffer_size = buffer_size
+        self.refit_every = refit_every
+        self.services = {}
+
+    def ingest(self, service, timestamp, sample):
+        """
+        Ingest one sample, a mapping of at least the FEATURES to their values.
+
+        Returns:
+            dict: The service, timestamp, TEST_SIZE Apdex forecasts and breach flag, or None while
+                  the service is warming up.
+        """
+        forecaster = self.services.get(service)
+        if forecaster is None:
+            forecaster = self.services[service] = ServiceForecaster(self.buffer_size, self.refit_every)
+
+        y_pred = forecaster.ingest([float(sample[feature]) for feature in FEATURES])
+        if y_pred is None:
+            return None
+        return {
+            'service': service,
+            'timestamp': timestamp,
+            'forecast': y_pred.tolist(),
+            'breach': bool((y_pred < forecast.THRESHOLD).any()),
+        }
+
+
+def read_samples(stream, follow=False):
+    """
+    Yield (timestamp, sample) pairs from a dataset CSV stream. With follow, keep polling the
+    stream for appended lines instead of stopping at its end.
+    """
+    header = next(csv.reader([stream.readline()]))
+    while True:
+        line = stream.readline()
+        if not line:
+            if not follow:
+                return
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+        if not line.endswith('\n') and follow:
+            # Wait for the writer to finish the line
+            while not line.endswith('\n'):
+                time.sleep(POLL_INTERVAL_SECONDS)
+                line += stream.readline()
+        values = next(csv.reader([line]))
+        sample = dict(zip(header, values))
+        yield sample.pop(header[0]), sample
+
+
+def run(stream, service, follow=False, output=sys.stdout):
+    """
+    Feed the samples of the stream through the early-warning stage, writing every emitted
+    forecast as a JSON line, and log the per-sample latency once the stream ends.
+    """
+    stage = ApdexEarlyWarning()
+    latencies = []
+
+    for timestamp, sample in read_samples(stream, follow):
+        started = time.perf_counter()
+        result = stage.ingest(service, timestamp, sample)
+        latencies.append(time.perf_counter() - started)
+        if result is not None:
+            output.write(json.dumps(result) + '\n')
+
+    if latencies:
+        latencies_ms = np.array(latencies) * 1000
+        logging.info(f"Ingested {len(latencies_ms)} samples, latency per sample: "
+                     f"mean {latencies_ms.mean():.4f} ms, p50 {np.percentile(latencies_ms, 50):.4f} ms, "
+                     f"p99 {np.percentile(latencies_ms, 99):.4f} ms, max {latencies_ms.max():.4f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream Apdex forecasts and breach flags from metric samples.")
+    parser.add_argument('file', nargs='?', help="Dataset CSV to replay, stdin if omitted")
+    parser.add_argument('--service', default=None, help="Service name of the samples, defaults to the file name")
+    parser.add_argument('--follow', action='store_true', help="Keep reading lines appended to the file")
+    args = parser.parse_args()
+
+    if args.file is None:
+        run(sys.stdin, args.service or 'stdin')
+    else:
+        with open(args.file) as stream:
+            run(stream, args.service or os.path.basename(args.file), args.follow)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script benchmarks the stages of the analysis pipeline (loading, ADF, VAR fit, Granger,
+correlation and forecasting) on synthetic chaos experiments from synthetic_datasets.py.
+
+Every stage runs over all generated files. Wall and CPU time are the best of --repeat runs,
+and the peak memory is traced in a separate run so tracing does not skew the timings. The
+results can be saved as a JSON baseline, and compared against one to flag stages that got
+slower than the tolerance allows:
+
+    python benchmark.py --files 50 --rows 500 --save benchmarks.json
+    python benchmark.py --files 50 --rows 500 --compare benchmarks.json
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+import statsmodels
+from statsmodels.tsa.api import VAR
+from statsmodels.tsa.stattools import adfuller, grangercausalitytests
+
+import batched_var
+import causality
+import correlation
+import dataset_cache
+import forecast
+import synthetic_datasets
+
+# Smallest experiment on which a differenced series still allows causality.MAX_LAGS lags
+MIN_ROWS = 3 * causality.MAX_LAGS + 4
+# Chunk size of the streamed stages, small enough that the benchmark experiments span several chunks
+CHUNK_ROWS = 1000
+
+
+def stage_load_csv(file_paths, exclusion):
+    for file_path in file_paths:
+        pd.read_csv(file_path, index_col=0, parse_dates=True)
+
+
+def stage_load_cache(file_paths, exclusion):
+    for file_path in file_paths:
+        dataset_cache.load_experiment(file_path)
+
+
+def stage_adf(file_paths, exclusion):
+    for file_path in file_paths:
+        data = dataset_cache.load_experiment(file_path).drop(exclusion + ['apdex'], axis=1)
+        for column in data.columns:
+            adfuller(data[column].astype(np.float64))
+
+
+def stage_var_fit(file_paths, exclusion):
+    for file_path in file_paths:
+        data = dataset_cache.load_experiment(file_path).astype(np.float64)
+        for column in data.columns.drop(exclusion + ['apdex']):
+            VAR(data[[column, 'apdex']].to_numpy()).fit(maxlags=causality.MAX_LAGS, ic='aic')
+
+
+def stage_granger(file_paths, exclusion):
+    for file_path in file_paths:
+        data = dataset_cache.load_experiment(file_path).astype(np.float64)
+        for column in data.columns.drop(exclusion + ['apdex']):
+            grangercausalitytests(data[[column, 'apdex']].to_numpy(), maxlag=causality.MAX_LAGS, verbose=False)
+
+
+def stage_causality(file_paths, exclusion):
+    for file_path in file_paths:
+        causality.perform_granger_causality_tests(file_path, exclusion)
+
+
+def stage_causality_streamed(file_paths, exclusion):
+    for file_path in file_paths:
+        causality.perform_granger_causality_tests(file_path, exclusion, chunk_rows=CHUNK_ROWS)
+
+
+def stage_correlation(file_paths, exclusion):
+    correlation.aggregate_file_correlations(file_paths, 'apdex', [c for c in exclusion if c != 'errors'])
+
+
+def stage_correlation_streamed(file_paths, exclusion):
+    columns_to_exclude = [c for c in exclusion if c != 'errors']
+    correlation.aggregate_partials(file_paths, correlation.correlate_files(
+        file_paths, 'apdex', columns_to_exclude, chunk_rows=CHUNK_ROWS))
+
+
+def stage_forecast(file_paths, exclusion):
+    for file_path in file_paths:
+        df = dataset_cache.load_experiment(file_path).drop(exclusion, axis=1).astype(np.float64)
+        train = df.iloc[:-forecast.TEST_SIZE]
+        results, lag_order = forecast.fit_VAR_model(train)
+        forecast.forecast_VAR(results, lag_order, train)
+
+
+def stage_forecast_batched(file_paths, exclusion):
+    trains = [dataset_cache.load_experiment(file_path).drop(exclusion, axis=1).astype(np.float64).iloc[:-forecast.TEST_SIZE]
+              for file_path in file_paths]
+    batches = {}
+    for train in trains:
+        batches.setdefault(train.shape, []).append(train.to_numpy())
+    for batch in batches.values():
+        batched_var.fit_batch(np.stack(batch), forecast.TEST_SIZE).forecast(forecast.TEST_SIZE)
+
+
+def stage_forecast_walk_forward(file_paths, exclusion):
+    for file_path in file_paths:
+        df = dataset_cache.load_experiment(file_path).drop(exclusion, axis=1)
+        forecast.walk_forward_forecast(df)
+
+
+STAGES = {
+    'load_csv': stage_load_csv,
+    'load_cache': stage_load_cache,
+    'adf': stage_adf,
+    'var_fit': stage_var_fit,
+    'granger': stage_granger,
+    'causality': stage_causality,
+    'causality_streamed': stage_causality_streamed,
+    'correlation': stage_correlation,
+    'correlation_streamed': stage_correlation_streamed,
+    'forecast': stage_forecast,
+    'forecast_batched': stage_forecast_batched,
+    'forecast_walk_forward': stage_forecast_walk_forward,
+}
+
+
+def measure(stage, file_paths, exclusion, repeat):
+    """
+    Returns the best wall and CPU time over repeat runs of the stage and its traced peak memory.
+    """
+    wall_times = []
+    cpu_times = []
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        stage(file_paths, exclusion)
+        wall_times.append(time.perf_counter() - wall_start)
+        cpu_times.append(time.process_time() - cpu_start)
+
+    tracemalloc.start()
+    try:
+        stage(file_paths, exclusion)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_seconds': min(wall_times),
+        'cpu_seconds': min(cpu_times),
+        'peak_memory_bytes': peak_memory,
+        'files': len(file_paths),
+        'wall_seconds_per_file': min(wall_times) / len(file_paths),
+    }
+
+
+def run_benchmarks(n_files, n_rows, experiment='cpu', seed=0, stages=tuple(STAGES), repeat=3):
+    """
+    Generate a synthetic campaign in a temporary folder and benchmark the given stages on it.
+
+    Returns:
+        dict: The benchmark parameters, environment and the results of every stage.
+    """
+    if n_rows < MIN_ROWS:
+        raise ValueError(f"The Granger stages need at least {MIN_ROWS} rows per experiment.")
+
+    exclusion = ['tsr', 'errors', experiment]
+    results = {}
+    with tempfile.TemporaryDirectory() as folder_path:
+        file_paths = synthetic_datasets.generate_campaign(folder_path, n_files, n_rows, experiment, seed=seed)
+        for file_path in file_paths:
+            dataset_cache.ensure_cached(file_path)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for name in stages:
+                results[name] = measure(STAGES[name], file_paths, exclusion, repeat)
+                print(f"{name:>24}: {results[name]['wall_seconds']:.4f} s wall, "
+                      f"{results[name]['cpu_seconds']:.4f} s CPU, "
+                      f"{results[name]['peak_memory_bytes'] / 2 ** 20:.2f} MiB peak", file=sys.stderr)
+
+    return {
+        'parameters': {'files': n_files, 'rows': n_rows, 'experiment': experiment, 'seed': seed, 'repeat': repeat},
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'statsmodels': statsmodels.__version__,
+            'machine': platform.machine(),
+        },
+        'stages': results,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Returns the (stage, baseline seconds, current seconds) of every stage whose wall time grew
+    by more than the tolerance fraction over the baseline.
+    """
+    regressions = []
+    for name, stage in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous and stage['wall_seconds'] > previous['wall_seconds'] * (1 + tolerance):
+            regressions.append((name, previous['wall_seconds'], stage['wall_seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on synthetic chaos experiments.")
+    parser.add_argument('--files', type=int, default=28)
+    parser.add_argument('--rows', type=int, default=75)
+    parser.add_argument('--experiment', choices=['cpu', 'io'], default='cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--save', help="Write the results as a JSON baseline to this path")
+    parser.add_argument('--compare', help="Compare the results against the JSON baseline at this path")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed fractional wall time increase over the baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.files, args.rows, args.experiment, args.seed, args.stages, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != results['parameters']:
+            print(f"Baseline parameters {baseline['parameters']} differ from {results['parameters']}.", file=sys.stderr)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for name, previous, current in regressions:
+            print(f"Regression in {name}: {previous:.4f} s -> {current:.4f} s", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
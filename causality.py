@@ -1,57 +1,478 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-This script uses the statsmodels library to perform Granger Causality tests to check if one time series is 
+This script uses the statsmodels library to perform Granger Causality tests to check if one time series is
 useful in forecasting another.
 
+The (file, column) pairs of a campaign can be tested in a process pool with `run_granger_causality_batch`.
+The outcome of every pair is kept in the analysis store (analysis_store.py) keyed by the content hash of its
+file, so re-runs and runs with different exclusions only recompute the pairs that changed. The lag order selection and the F-tests
+are computed for all columns of a file at once by the NumPy kernel in granger_kernel.py.
+
+Set MODE to 'all-pairs' to discover the directed causal graph between all metrics instead. One joint VAR is
+fitted per file, every pairwise and conditional Granger test is derived from it, and the significant edges
+are counted across the files into a weighted edge list written to GRAPH_PATH.
+
+Set CHUNK_ROWS to analyse experiments too long to load at once. They are then streamed from the dataset cache
+in chunks of that many rows, and the ADF decisions, lag orders and F-tests are solved from streamed
+cross-product matrices (see streaming.py), with the same results as the in-memory path.
+
 Author: dhruvshetty213@gmail.com
 """
 
-import os
-import pandas as pd
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 from statsmodels.tsa.api import VAR
 from statsmodels.tsa.stattools import adfuller, grangercausalitytests
 
+import analysis_store
+import change_points
+import dataset_cache
+import granger_kernel
+import profiling
+import streaming
+
+CACHE_PATH = analysis_store.STORE_PATH
+MAX_LAGS = 20
+SIGNIFICANCE_LEVEL = 0.05
+MODE = 'apdex'  # Change to 'all-pairs' for the causal graph between all metrics
+GRAPH_TESTS = ('conditional', 'pairwise')
+GRAPH_PATH = 'causal_graph.csv'
+CHUNK_ROWS = None  # E.g. streaming.CHUNK_ROWS to stream the experiments instead of loading them
+MIN_ROWS = 4  # Fewest rows adfuller can test, files with shorter phases are skipped
+SKIPPED_PAIR = {'differenced': None, 'k_ar': 0, 'min_p_value': None}
+
+
+def evaluate_column_pair(data, column):
+    """
+    Run the ADF check, VAR lag order selection and Granger Causality tests for a single column against 'apdex'.
+    This is the statsmodels reference implementation of `evaluate_columns`.
+
+    Parameters:
+        data (DataFrame): The time series data of one experiment.
+        column (str): The name of the column to test against the 'apdex' column.
+
+    Returns:
+        dict: The differencing decision ('differenced'), the selected lag order ('k_ar') and the minimum
+              rounded p-value of the SSR F-tests ('min_p_value', None when no lag was selected).
+    """
+    data_orig = data[[column, "apdex"]].astype(np.float64)
+
+    with profiling.stage('adfuller'):
+        result_adf = adfuller(data_orig[column])
+    differenced = bool(result_adf[1] >= 0.05)
+    if differenced:
+        data_orig = data_orig.diff().dropna()
+
+    with profiling.stage('VAR.fit'):
+        model = VAR(data_orig)
+        results = model.fit(maxlags=MAX_LAGS, ic='aic')
+
+    min_p_value = None
+    if results.k_ar > 0:
+        with profiling.stage('grangercausalitytests'):
+            result = grangercausalitytests(data_orig, maxlag=results.k_ar, verbose=False)
+        p_values = [round(result[i+1][0]['ssr_ftest'][1],4) for i in range(results.k_ar)]
+        min_p_value = float(np.min(p_values))
+
+    return {'differenced': differenced, 'k_ar': int(results.k_ar), 'min_p_value': min_p_value}
+
+
+def evaluate_columns(data, columns, file_path=None):
+    """
+    Run the ADF check, VAR lag order selection and Granger Causality tests for the given columns against 'apdex'.
+
+    The columns sharing a differencing decision are stacked and handed to granger_kernel in one batch. On series
+    too short for MAX_LAGS, such as a single phase of an experiment, the largest estimable lag order is used.
+    Pairs that cannot be tested, as the data has fewer than MIN_ROWS rows or one of the series is constant, get
+    SKIPPED_PAIR as their result and a logged warning.
+
+    Parameters:
+        data (DataFrame): The time series data of one experiment.
+        columns (list): The names of the columns to test against the 'apdex' column.
+        file_path (str): The file of the data, named in the warnings.
+
+    Returns:
+        dict: A dictionary mapping each column to its result, in the format of `evaluate_column_pair`.
+    """
+    data = data.astype(np.float64)
+    constant = [column for column in columns + ['apdex'] if not data[column].max() > data[column].min()]
+    pair_results = _untestable_pairs(len(data), columns, constant, file_path)
+    tested = [column for column in columns if column not in pair_results]
+
+    with profiling.stage('adfuller'):
+        differenced = {column: bool(adfuller(data[column])[1] >= 0.05) for column in tested}
+
+    for differenced_group in (False, True):
+        group = [column for column in tested if differenced[column] == differenced_group]
+        if not group:
+            continue
+
+        stacked = np.stack([data[[column, "apdex"]].to_numpy(dtype=float) for column in group])
+        if differenced_group:
+            stacked = np.diff(stacked, axis=1)
+
+        maxlags = min(MAX_LAGS, (stacked.shape[1] - 3) // 3)
+        with profiling.stage('granger_kernel'):
+            k_ar, min_p_values = granger_kernel.min_granger_p_values(stacked, maxlags)
+        for column, column_k_ar, min_p_value in zip(group, k_ar, min_p_values):
+            pair_results[column] = {
+                'differenced': differenced_group,
+                'k_ar': int(column_k_ar),
+                'min_p_value': None if np.isnan(min_p_value) else float(min_p_value),
+            }
+
+    return {column: pair_results[column] for column in columns}
+
+
+def _untestable_pairs(n_rows, columns, constant, file_path=None):
+    """
+    Returns the SKIPPED_PAIR results of the columns whose pair with 'apdex' cannot be tested, as there are fewer
+    than MIN_ROWS rows or one of the series is in the given constant columns, and logs a warning for each.
+    """
+    source = f" of {file_path}" if file_path else ""
+    if n_rows < MIN_ROWS:
+        logging.warning(f"Skipping the Granger Causality tests{source}: {n_rows} rows, fewer than {MIN_ROWS}.")
+        return {column: dict(SKIPPED_PAIR) for column in columns}
+
+    skipped = {}
+    for column in columns:
+        reason = next((f"'{name}' is constant" for name in (column, 'apdex') if name in constant), None)
+        if reason:
+            logging.warning(f"Skipping the Granger Causality test of '{column}' and 'apdex'{source}: {reason}.")
+            skipped[column] = dict(SKIPPED_PAIR)
+    return skipped
+
+
+def evaluate_columns_streamed(file_path, columns, phases=None, chunk_rows=streaming.CHUNK_ROWS):
+    """
+    Out-of-core `evaluate_columns` for experiments too long to load, streamed in chunks of chunk_rows rows.
+
+    A first pass over the chunks takes the ADF decisions and finds the constant series. A second pass accumulates
+    the cross-products of the VAR of every differencing group, [columns, 'apdex'], from which the lag order and
+    F-tests of every column are solved on its pair of variables. Untestable pairs are skipped like in
+    `evaluate_columns`.
+
+    Parameters:
+        file_path (str): The location of the CSV file containing the time series data.
+        columns (list): The names of the columns to test against the 'apdex' column.
+        phases (list): The phases of the experiment to test on (see change_points.py), defaults to all rows.
+        chunk_rows (int): The number of rows of a chunk.
+
+    Returns:
+        dict: A dictionary mapping each column to its result, in the format of `evaluate_column_pair`.
+    """
+    n = streaming.count_rows(file_path, phases)
+    if n < MIN_ROWS:
+        return _untestable_pairs(n, columns, [], file_path)
+
+    all_columns = columns
+    with profiling.stage('adfuller'):
+        tests = streaming.adf_tests(streaming.iter_chunks(file_path, columns + ['apdex'], phases, chunk_rows),
+                                    len(columns) + 1, n)
+        constant = [column for column, test in zip(columns + ['apdex'], tests) if test.constant]
+        pair_results = _untestable_pairs(n, columns, constant, file_path)
+        tests = [test for column, test in zip(columns, tests) if column not in pair_results]
+        columns = [column for column in columns if column not in pair_results]
+        differenced = [bool(test.pvalue() >= 0.05) for test in tests]
+
+    groups = {}
+    for differenced_group in (False, True):
+        group = [i for i, column_differenced in enumerate(differenced) if column_differenced == differenced_group]
+        if group:
+            maxlags = min(MAX_LAGS, (n - differenced_group - 3) // 3)
+            groups[differenced_group] = (group, streaming.LaggedCrossProducts(len(group) + 1, max(maxlags, 0)),
+                                         streaming.ChunkDifferencer([differenced_group] * (len(group) + 1)))
+
+    with profiling.stage('cross_products'):
+        for chunk in streaming.iter_chunks(file_path, columns + ['apdex'], phases, chunk_rows):
+            for group, cross_products, differencer in groups.values():
+                cross_products.update(differencer.apply(chunk[:, group + [len(columns)]]))
+
+    with profiling.stage('granger_kernel'):
+        for differenced_group, (group, cross_products, _) in groups.items():
+            for i, column in enumerate(group):
+                variables = [i, len(group)]
+                k_ar = streaming.select_lag_order(cross_products, variables)
+                min_p_value = None
+                if k_ar > 0:
+                    p_values = [granger_kernel.pairwise_pvalues_from_cross_products(
+                        cross_products.standardized(lag, lag, variables), cross_products.nobs(lag), 2, lag)[1, 0]
+                        for lag in range(1, k_ar + 1)]
+                    min_p_value = float(np.min(np.round(p_values, 4)))
+                pair_results[columns[column]] = {'differenced': differenced_group, 'k_ar': k_ar,
+                                                 'min_p_value': min_p_value}
+
+    return {column: pair_results[column] for column in all_columns}
+
+
+def is_causal(pair_result):
+    """
+    Returns True if the result of `evaluate_column_pair` is significant at SIGNIFICANCE_LEVEL.
+    """
+    return pair_result['min_p_value'] is not None and pair_result['min_p_value'] < SIGNIFICANCE_LEVEL
+
 
-def perform_granger_causality_tests(file_path, columns_to_exclude):
+@profiling.profiled(file_arg='file_path')
+def perform_granger_causality_tests(file_path, columns_to_exclude, phases=None, chunk_rows=CHUNK_ROWS):
     """
     Perform Granger Causality tests on the time series data in the given file.
 
     Parameters:
         file_path (str): The location of the CSV file containing the time series data.
         columns_to_exclude (list): The list of column names to exclude from the data before performing tests.
+        phases (list): The phases of the experiment to test on (see change_points.py), defaults to all rows.
+        chunk_rows (int): Stream the experiment in chunks of this many rows instead of loading it, if set.
 
     Returns:
         dict: A dictionary where the keys are the names of the columns that Granger cause the 'apdex' column,
               and the values are the counts of such occurrences.
     """
-    data = pd.read_csv(file_path, index_col=0, parse_dates=True)
-    data_caus = data.drop(columns_to_exclude, axis=1).copy()
+    columns = _tested_columns(file_path, columns_to_exclude)
+    if chunk_rows:
+        pair_results = evaluate_columns_streamed(file_path, columns, phases, chunk_rows)
+    else:
+        pair_results = evaluate_columns(change_points.load_phases(file_path, phases), columns, file_path)
 
     causality_counts = {}
 
-    for column in data_caus.columns.drop("apdex"):
-        data_orig = data[[column, "apdex"]].copy()
+    for column, pair_result in pair_results.items():
+        if is_causal(pair_result):
+            if column in causality_counts:
+                causality_counts[column] += 1
+            else:
+                causality_counts[column] = 1
 
-        result_adf = adfuller(data_orig[column])
-        if result_adf[1] >= 0.05:
-            data_orig = data_orig.diff().dropna()
+    return causality_counts
 
-        model = VAR(data_orig)
-        results = model.fit(maxlags=20, ic='aic')
 
-        if results.k_ar > 0:
-            result = grangercausalitytests(data_orig, maxlag=results.k_ar, verbose=False)
-            p_values = [round(result[i+1][0]['ssr_ftest'][1],4) for i in range(results.k_ar)]
-            min_p_value = np.min(p_values)
-            if min_p_value < 0.05:
-                if column in causality_counts:
-                    causality_counts[column] += 1
-                else:
-                    causality_counts[column] = 1
+def _tested_columns(file_path, columns_to_exclude):
+    return list(dataset_cache.experiment_columns(file_path).drop(columns_to_exclude).drop("apdex"))
 
-    return causality_counts
+
+@profiling.profiled('evaluate_file', file_arg='file_path')
+def _evaluate_file_task(file_path, columns, phases=None, chunk_rows=None):
+    if chunk_rows:
+        return file_path, evaluate_columns_streamed(file_path, columns, phases, chunk_rows)
+    data = change_points.load_phases(file_path, phases)
+    return file_path, evaluate_columns(data, columns, file_path)
+
+
+@profiling.profiled()
+def run_granger_causality_batch(file_paths, columns_to_exclude, max_workers=None, cache_path=CACHE_PATH, phases=None,
+                                chunk_rows=CHUNK_ROWS):
+    """
+    Perform Granger Causality tests for every (file, column) pair of the given files in a process pool.
+    The pending pairs of a file are evaluated by one worker, so the kernel can batch them.
+
+    The result of every pair is kept in the analysis store keyed by the content hash of its file and the
+    fingerprint of MAX_LAGS and the phases, so only pairs of new or modified files, or columns that were
+    previously excluded, are computed. The counts are rebuilt from the stored results.
+
+    Parameters:
+        file_paths (list): The locations of the CSV files containing the time series data.
+        columns_to_exclude (list): The list of column names to exclude from the data before performing tests.
+        max_workers (int): The number of worker processes, defaults to the number of CPUs.
+        cache_path (str): The location of the analysis store (see analysis_store.py), or None to disable it.
+        phases (list): The phases of the experiments to test on (see change_points.py), defaults to all rows.
+        chunk_rows (int): Stream the experiments in chunks of this many rows instead of loading them, if set.
+
+    Returns:
+        dict: The aggregated causality counts over all files, as computed by `perform_granger_causality_tests`.
+    """
+    store = analysis_store.AnalysisStore(cache_path) if cache_path else None
+    try:
+        key = store.register('granger_apdex', {'max_lags': MAX_LAGS, 'phases': phases}) if store else None
+        hashes = {file_path: dataset_cache.content_hash(file_path) for file_path in file_paths}
+        results = store.get('granger_apdex', key, hashes.values()) if store else {}
+
+        pairs = []
+        pending = {}
+        for file_path in file_paths:
+            for column in _tested_columns(file_path, columns_to_exclude):
+                pairs.append((hashes[file_path], column))
+                if (hashes[file_path], column) not in results:
+                    pending.setdefault(file_path, []).append(column)
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [profiling.submit(executor, _evaluate_file_task, file_path, columns, phases, chunk_rows)
+                           for file_path, columns in pending.items()]
+                for future in futures:
+                    file_path, pair_results = profiling.result(future)
+                    entries = [(hashes[file_path], column, pair_result) for column, pair_result in pair_results.items()]
+                    results.update({(file_hash, column): pair_result for file_hash, column, pair_result in entries})
+                    if store:
+                        store.put('granger_apdex', key, entries)
+    finally:
+        if store:
+            store.close()
+
+    causality_counts_aggregate = {}
+    for pair in pairs:
+        if is_causal(results[pair]):
+            column = pair[1]
+            causality_counts_aggregate[column] = causality_counts_aggregate.get(column, 0) + 1
+
+    return causality_counts_aggregate
+
+
+def evaluate_causal_graph(data, columns, file_path=None):
+    """
+    Fit one joint VAR on the given columns and derive the Granger Causality tests between all of them.
+
+    Constant columns cannot be tested and are left out with a logged warning, and data with fewer than MIN_ROWS
+    rows is skipped altogether. Every column failing the ADF check is differenced, and the first row of the
+    others is dropped to keep the series aligned. The lag order is selected by AIC up to MAX_LAGS, or up to the
+    largest order the joint VAR can estimate if that is smaller.
+
+    Parameters:
+        data (DataFrame): The time series data of one experiment.
+        columns (list): The names of the columns to include in the graph.
+        file_path (str): The file of the data, named in the warnings.
+
+    Returns:
+        dict: The tested columns ('columns'), the differenced ones ('differenced'), the selected lag order
+              ('k_ar') and, per test in GRAPH_TESTS, the matrix of rounded p-values where [i][j] tests column i
+              Granger causing column j (None when no lag was selected).
+    """
+    data = data[columns].astype(np.float64)
+    if len(data) < MIN_ROWS:
+        return _skipped_graph(len(data), file_path)
+    columns = _non_constant(columns, [column for column in columns if not data[column].std() > 0], file_path)
+    with profiling.stage('adfuller'):
+        differenced = [column for column in columns if adfuller(data[column])[1] >= 0.05]
+
+    values = data[columns].to_numpy()
+    if differenced:
+        values = values[1:].copy()
+        diff_index = [columns.index(column) for column in differenced]
+        values[:, diff_index] = np.diff(data[differenced].to_numpy(), axis=0)
+
+    n, neqs = values.shape
+    maxlags = min(MAX_LAGS, (n - neqs - 1) // (1 + neqs))
+    with profiling.stage('select_lag_order'):
+        k_ar = int(granger_kernel.select_lag_order(values[None], maxlags)[0]) if maxlags > 0 else 0
+
+    graph = {'columns': columns, 'differenced': differenced, 'k_ar': k_ar}
+    for test in GRAPH_TESTS:
+        graph[test] = None
+        if k_ar > 0:
+            kernel = getattr(granger_kernel, f'{test}_granger_pvalues')
+            with profiling.stage(f'{test}_granger_pvalues'):
+                graph[test] = np.round(kernel(values, k_ar), 4).tolist()
+    return graph
+
+
+def evaluate_causal_graph_streamed(file_path, columns, phases=None, chunk_rows=streaming.CHUNK_ROWS):
+    """
+    Out-of-core `evaluate_causal_graph` for experiments too long to load, streamed in chunks of chunk_rows rows.
+    A first pass takes the ADF decisions and finds the constant columns, a second pass accumulates the
+    cross-products of the joint VAR, from which the lag order and all tests are solved.
+
+    Returns:
+        dict: The graph in the format of `evaluate_causal_graph`.
+    """
+    n_rows = streaming.count_rows(file_path, phases)
+    if n_rows < MIN_ROWS:
+        return _skipped_graph(n_rows, file_path)
+    with profiling.stage('adfuller'):
+        tests = streaming.adf_tests(streaming.iter_chunks(file_path, columns, phases, chunk_rows), len(columns), n_rows)
+        columns = _non_constant(columns, [column for column, test in zip(columns, tests) if test.constant], file_path)
+        tests = dict(zip(columns, (test for test in tests if not test.constant)))
+        differenced = [column for column in columns if tests[column].pvalue() >= 0.05]
+
+    n, neqs = n_rows - bool(differenced), len(columns)
+    maxlags = min(MAX_LAGS, (n - neqs - 1) // (1 + neqs))
+    cross_products = streaming.LaggedCrossProducts(neqs, max(maxlags, 0))
+    differencer = streaming.ChunkDifferencer([column in differenced for column in columns])
+    with profiling.stage('cross_products'):
+        for chunk in streaming.iter_chunks(file_path, columns, phases, chunk_rows):
+            cross_products.update(differencer.apply(chunk))
+
+    with profiling.stage('select_lag_order'):
+        k_ar = streaming.select_lag_order(cross_products) if maxlags > 0 else 0
+
+    graph = {'columns': columns, 'differenced': differenced, 'k_ar': k_ar}
+    for test in GRAPH_TESTS:
+        graph[test] = None
+        if k_ar > 0:
+            kernel = getattr(granger_kernel, f'{test}_pvalues_from_cross_products')
+            with profiling.stage(f'{test}_granger_pvalues'):
+                gram = cross_products.standardized(k_ar, k_ar)
+                graph[test] = np.round(kernel(gram, cross_products.nobs(k_ar), neqs, k_ar), 4).tolist()
+    return graph
+
+
+def _skipped_graph(n_rows, file_path=None):
+    source = f" of {file_path}" if file_path else ""
+    logging.warning(f"Skipping the causal graph{source}: {n_rows} rows, fewer than {MIN_ROWS}.")
+    return {'columns': [], 'differenced': [], 'k_ar': 0, **{test: None for test in GRAPH_TESTS}}
+
+
+def _non_constant(columns, constant, file_path=None):
+    source = f" of {file_path}" if file_path else ""
+    for column in constant:
+        logging.warning(f"Leaving the constant column '{column}' out of the causal graph{source}.")
+    return [column for column in columns if column not in constant]
+
+
+@profiling.profiled('causal_graph_file', file_arg='file_path')
+def _causal_graph_task(file_path, columns_to_exclude, phases=None, chunk_rows=None):
+    if chunk_rows:
+        columns = list(dataset_cache.experiment_columns(file_path).drop(columns_to_exclude))
+        return evaluate_causal_graph_streamed(file_path, columns, phases, chunk_rows)
+    data = change_points.load_phases(file_path, phases)
+    return evaluate_causal_graph(data, list(data.columns.drop(columns_to_exclude)), file_path)
+
+
+@profiling.profiled()
+def run_causal_graph_batch(file_paths, columns_to_exclude, test='conditional', max_workers=None, phases=None,
+                           chunk_rows=CHUNK_ROWS):
+    """
+    Discover the causal graph between all columns of every file in a process pool and count how often
+    each directed edge is significant at SIGNIFICANCE_LEVEL.
+
+    Parameters:
+        file_paths (list): The locations of the CSV files containing the time series data.
+        columns_to_exclude (list): The list of column names to exclude from the graph.
+        test (str): 'conditional' for the tests in the joint VAR, 'pairwise' for the bivariate tests.
+        max_workers (int): The number of worker processes, defaults to the number of CPUs.
+        phases (list): The phases of the experiments to test on (see change_points.py), defaults to all rows.
+        chunk_rows (int): Stream the experiments in chunks of this many rows instead of loading them, if set.
+
+    Returns:
+        DataFrame: One row per directed edge with the 'cause', the 'effect', the number of files where the edge
+                   is significant ('count'), the number of files where it could be tested ('tested') and their
+                   ratio ('weight'), sorted by count.
+    """
+    if test not in GRAPH_TESTS:
+        raise ValueError(f"Unknown test {test}, expected one of {GRAPH_TESTS}.")
+
+    counts = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [profiling.submit(executor, _causal_graph_task, file_path, columns_to_exclude, phases, chunk_rows)
+                   for file_path in file_paths]
+        for future in futures:
+            graph = profiling.result(future)
+            if graph[test] is None:
+                continue
+            p_values = np.array(graph[test])
+            for i, cause in enumerate(graph['columns']):
+                for j, effect in enumerate(graph['columns']):
+                    if i == j:
+                        continue
+                    edge = counts.setdefault((cause, effect), [0, 0])
+                    edge[0] += int(p_values[i, j] < SIGNIFICANCE_LEVEL)
+                    edge[1] += 1
+
+    edges = pd.DataFrame([(cause, effect, count, tested) for (cause, effect), (count, tested) in counts.items()],
+                         columns=['cause', 'effect', 'count', 'tested'])
+    edges['weight'] = edges['count'] / edges['tested']
+    return edges.sort_values(['count', 'weight'], ascending=False, ignore_index=True)
 
 
 if __name__ == "__main__":
@@ -59,18 +480,17 @@ if __name__ == "__main__":
     folder_path = '/path/to/datasets'
 
     # Get a list of all file paths in the folder
-    file_paths = [os.path.join(folder_path, f) for f in os.listdir(folder_path)]
+    file_paths = dataset_cache.list_experiment_files(folder_path)
 
-    columns_to_exclude = ['tsr', 'errors', 'cpu']   # Replace cpu with io for IO experiments dataset
+    if MODE == 'all-pairs':
+        # The chaos marker is excluded, errors and tsr take part in the graph
+        edges = run_causal_graph_batch(file_paths, ['cpu'])   # Replace cpu with io for IO experiments dataset
+        edges.to_csv(GRAPH_PATH, index=False)
+        print(edges[edges['count'] > 0].to_string(index=False))
+    else:
+        columns_to_exclude = ['tsr', 'errors', 'cpu']   # Replace cpu with io for IO experiments dataset
 
-    # Run Granger causality test for each file
-    causality_counts_aggregate = {}
-    for file_path in file_paths:
-        causality_counts = perform_granger_causality_tests(file_path, columns_to_exclude)
-        for key, value in causality_counts.items():
-            if key in causality_counts_aggregate:
-                causality_counts_aggregate[key] += value
-            else:
-                causality_counts_aggregate[key] = value
+        # Run Granger causality test for each (file, column) pair in parallel, reusing cached pairs
+        causality_counts_aggregate = run_granger_causality_batch(file_paths, columns_to_exclude)
 
-    print(causality_counts_aggregate)
+        print(causality_counts_aggregate)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module detects the chaos windows and Apdex regime changes of the experiments and keeps them as
+a precomputed segment index next to each dataset, so the analysis scripts can restrict themselves to
+the pre-fault, in-fault or recovery part of an experiment without scanning the raw series again.
+
+The injection onsets and offsets are the transitions of the 'cpu' or 'io' chaos marker. The Apdex
+regime changes are found with PELT (pruned exact linear time) on a Gaussian change-in-mean cost, which
+is evaluated from cumulative sums for all candidate segment starts at once. Segments are at least
+MIN_SEGMENT_SIZE rows long, so the short dips of Apdex that follow every chaos burst are not reported
+as regimes of their own.
+
+The phases are contiguous: 'pre-fault' runs up to the first onset, 'in-fault' from the first onset
+to the last offset, including the pauses between bursts, and 'recovery' from the last offset on.
+The index of `<folder>/<name>.csv` is `<folder>/.dataset_cache/<name>/segments.json`, and it is
+rebuilt whenever the content hash of the CSV changes.
+
+    python change_points.py /path/to/datasets
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import sys
+import json
+
+import numpy as np
+
+import dataset_cache
+
+MARKER_COLUMNS = ['cpu', 'io']
+PHASES = ('pre-fault', 'in-fault', 'recovery')
+PENALTY_SCALE = 2.0  # Penalty of a change point, in units of log(n) noise variances
+MIN_SEGMENT_SIZE = 10  # Five minutes of 30 second rows, so the Apdex dip after a single chaos burst is no regime
+INDEX_VERSION = 2
+
+
+def marker_windows(marker):
+    """
+    Returns the (onset, offset) row pairs of the runs where the chaos marker is on. The offset is
+    the first row after the run, so a window covers rows onset to offset - 1.
+    """
+    on = np.concatenate(([0], (np.asarray(marker) > 0).astype(np.int8), [0]))
+    transitions = np.flatnonzero(np.diff(on))
+    return list(zip(transitions[::2].tolist(), transitions[1::2].tolist()))
+
+
+def phase_bounds(n_rows, windows):
+    """
+    Returns the (phase, start, stop) rows of the contiguous phases of an experiment. Phases that
+    would be empty are left out, and without any window the whole experiment is 'pre-fault'.
+    """
+    if not windows:
+        return [('pre-fault', 0, n_rows)]
+    bounds = [('pre-fault', 0, windows[0][0]), ('in-fault', windows[0][0], windows[-1][1]),
+              ('recovery', windows[-1][1], n_rows)]
+    return [(phase, start, stop) for phase, start, stop in bounds if stop > start]
+
+
+def noise_variance(values):
+    """
+    Robust estimate of the noise variance of a piecewise constant series, from the median absolute
+    difference of consecutive values, so the level shifts themselves do not inflate it.
+    """
+    mad = np.median(np.abs(np.diff(values)))
+    if mad == 0:
+        mad = np.mean(np.abs(np.diff(values)))
+    return (mad / 0.6745) ** 2 / 2
+
+
+def pelt(values, penalty=None, min_size=MIN_SEGMENT_SIZE):
+    """
+    Find the change points of the mean of a series with PELT.
+
+    Parameters:
+        values (ndarray): The series.
+        penalty (float): The cost of adding a change point, defaults to PENALTY_SCALE * log(n) times
+                         the robust noise variance.
+        min_size (int): The minimum number of rows of a segment.
+
+    Returns:
+        list: The rows where a new segment starts, in increasing order.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n < 2 * min_size:
+        return []
+    if penalty is None:
+        penalty = PENALTY_SCALE * np.log(n) * noise_variance(values)
+    if penalty == 0:
+        penalty = np.finfo(np.float64).eps
+
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    squares = np.concatenate(([0.0], np.cumsum(values ** 2)))
+
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    last_change = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.array([0])
+
+    for t in range(min_size, n + 1):
+        # The segments [s, t) of every candidate start s, scored together from the cumulative sums
+        lengths = t - candidates
+        costs = squares[t] - squares[candidates] - (sums[t] - sums[candidates]) ** 2 / lengths
+        totals = best[candidates] + costs + penalty
+        i = np.argmin(totals)
+        best[t] = totals[i]
+        last_change[t] = candidates[i]
+
+        # A start that is already worse than the optimum can never become optimal again
+        candidates = candidates[best[candidates] + costs <= best[t]]
+        if t + 1 - min_size >= min_size:
+            candidates = np.append(candidates, t + 1 - min_size)
+
+    change_points = []
+    t = last_change[n]
+    while t > 0:
+        change_points.append(int(t))
+        t = last_change[t]
+    return change_points[::-1]
+
+
+def build_segment_index(file_path):
+    """
+    Detect the chaos windows, phases and Apdex change points of an experiment.
+
+    Returns:
+        dict: The content hash of the file ('sha256'), the marker column ('marker', None when the file has
+              none), the 'windows' with their onset and offset rows and timestamps, the 'phases' as
+              (phase, start, stop) rows and the rows starting a new Apdex regime ('apdex_change_points').
+    """
+    data = dataset_cache.load_experiment(file_path)
+    timestamps = data.index.strftime('%Y-%m-%dT%H:%M:%SZ')
+    marker = next((column for column in MARKER_COLUMNS if column in data.columns), None)
+
+    windows = marker_windows(data[marker].to_numpy()) if marker else []
+    apdex_change_points = pelt(data['apdex'].to_numpy()) if 'apdex' in data.columns else []
+
+    return {
+        'version': INDEX_VERSION,
+        'sha256': dataset_cache.content_hash(file_path),
+        'marker': marker,
+        'windows': [{'onset': onset, 'offset': offset, 'onset_time': timestamps[onset],
+                     'offset_time': timestamps[offset] if offset < len(data) else None}
+                    for onset, offset in windows],
+        'phases': [list(bounds) for bounds in phase_bounds(len(data), windows)],
+        'apdex_change_points': apdex_change_points,
+    }
+
+
+def index_path(file_path):
+    return os.path.join(dataset_cache.cache_entry_dir(file_path), 'segments.json')
+
+
+def load_segment_index(file_path):
+    """
+    Returns the segment index of an experiment, building and storing it if it is missing or stale.
+    """
+    path = index_path(file_path)
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION and index['sha256'] == dataset_cache.content_hash(file_path):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = build_segment_index(file_path)
+    dataset_cache._write_atomic(path, lambda f: f.write(json.dumps(index).encode()))
+    return index
+
+
+def phase_mask(index, n_rows, phases):
+    """
+    Returns the boolean row mask of the given phases of an indexed experiment.
+    """
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        raise ValueError(f"Unknown phases {sorted(unknown)}, expected some of {PHASES}.")
+    mask = np.zeros(n_rows, dtype=bool)
+    for phase, start, stop in index['phases']:
+        if phase in phases:
+            mask[start:stop] = True
+    return mask
+
+
+def load_phases(file_path, phases=None, columns=None):
+    """
+    Load an experiment like `dataset_cache.load_experiment`, restricted to the rows of the given phases.
+    Without phases the whole experiment is returned.
+    """
+    data = dataset_cache.load_experiment(file_path, columns)
+    if phases is None:
+        return data
+    return data[phase_mask(load_segment_index(file_path), len(data), phases)]
+
+
+def main():
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else '/path/to/datasets'
+    for file_path in dataset_cache.list_experiment_files(folder_path):
+        index = load_segment_index(file_path)
+        phases = ', '.join(f"{phase} {start}-{stop}" for phase, start, stop in index['phases'])
+        print(f"{os.path.basename(file_path)}: {len(index['windows'])} windows, {phases}, "
+              f"Apdex changes at {index['apdex_change_points']}")
+
+
+if __name__ == "__main__":
+    main()
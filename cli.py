@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This script is the single command line entry point of the analysis scripts. The dataset folder,
+experiment type, excluded columns and phases are arguments instead of constants edited in the scripts:
+
+    python cli.py list datasets/cpu_experiments
+    python cli.py causality datasets/io_experiments --mode all-pairs --phases in-fault
+    python cli.py correlation datasets/cpu_experiments --workers 4
+    python cli.py causality datasets/long_runs --chunk-rows 100000
+    python cli.py forecast datasets/cpu_experiments --mode walk-forward
+    python cli.py significance datasets/cpu_experiments --test granger --resamples 2000
+    python cli.py extract 2023-06-27T08:49:00Z/2023-06-27T09:23:00Z --experiment cpu
+
+Only the standard library is imported up front. NumPy, pandas, statsmodels and scikit-learn are
+imported by the subcommand that needs them, so --help and the dataset listing start instantly.
+With --profile, the stage timings of the run are written as JSON or collapsed stacks (see profiling.py).
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import sys
+import argparse
+
+EXPERIMENTS = ['cpu', 'io']
+PHASES = ['pre-fault', 'in-fault', 'recovery']  # Mirrors change_points.PHASES without importing NumPy
+
+
+def list_datasets(folder_path):
+    """
+    Returns the sorted experiment CSV file paths of a folder, like dataset_cache.list_experiment_files.
+    """
+    return sorted(
+        os.path.join(folder_path, f) for f in os.listdir(folder_path)
+        if f.endswith('.csv') and os.path.isfile(os.path.join(folder_path, f))
+    )
+
+
+def infer_experiment(file_paths):
+    """
+    Returns the experiment type from the file name prefix of the datasets, 'cpu' if there is none.
+    """
+    for experiment in EXPERIMENTS:
+        if file_paths and all(os.path.basename(f).startswith(f'{experiment}_') for f in file_paths):
+            return experiment
+    return 'cpu'
+
+
+def get_file_paths(args):
+    file_paths = list_datasets(args.folder)
+    if not file_paths:
+        sys.exit(f"No files found in {args.folder}. Please check the folder path.")
+    args.experiment = args.experiment or infer_experiment(file_paths)
+    return file_paths
+
+
+def exclusion(args, default):
+    """
+    Returns the excluded columns: the given ones or the subcommand's default, plus the chaos marker.
+    """
+    columns = list(default if args.exclude is None else args.exclude)
+    return columns + [args.experiment] if args.experiment not in columns else columns
+
+
+def cmd_list(args):
+    for file_path in list_datasets(args.folder):
+        with open(file_path) as f:
+            header = f.readline().rstrip('\n').split(',')
+            rows = sum(1 for _ in f)
+        marker = next((column for column in EXPERIMENTS if column in header), '-')
+        print(f"{rows:>6} rows  {marker:<3}  {os.path.basename(file_path)}")
+
+
+def cmd_causality(args):
+    import causality
+
+    file_paths = get_file_paths(args)
+    if args.mode == 'all-pairs':
+        edges = causality.run_causal_graph_batch(file_paths, exclusion(args, []), args.test, args.workers, args.phases,
+                                                 args.chunk_rows)
+        if args.output:
+            edges.to_csv(args.output, index=False)
+        print(edges[edges['count'] > 0].to_string(index=False))
+    else:
+        cache_path = None if args.no_store else causality.CACHE_PATH
+        print(causality.run_granger_causality_batch(
+            file_paths, exclusion(args, ['tsr', 'errors']), args.workers, cache_path, args.phases, args.chunk_rows))
+
+
+def cmd_correlation(args):
+    import correlation
+
+    file_paths = get_file_paths(args)
+    correlation.config['metrics_to_exclude'] = exclusion(args, ['tsr']) + [
+        metric for metric in args.metrics if args.exclude is None or metric not in args.exclude]
+    correlation.config['phases'] = args.phases
+    correlation.config['chunk_rows'] = args.chunk_rows
+    if args.no_store:
+        correlation.config['store_path'] = None
+    for metric in args.metrics:
+        correlation.calculate_correlation(file_paths, metric, args.workers)
+
+
+def cmd_forecast(args):
+    import forecast
+
+    file_paths = get_file_paths(args)
+    column_exclusion = exclusion(args, ['tsr', 'errors'])
+    if args.mode == 'walk-forward':
+        forecast.walk_forward_main(file_paths, args.phases, column_exclusion, args.predictions_dir)
+    else:
+        forecast.main(file_paths, args.workers, args.results, args.plot_dir is not None, args.plot_dir,
+                      args.phases, column_exclusion, args.batched,
+                      None if args.no_store else forecast.STORE_PATH)
+
+
+def cmd_segments(args):
+    import change_points
+
+    for file_path in get_file_paths(args):
+        index = change_points.load_segment_index(file_path)
+        phases = ', '.join(f"{phase} {start}-{stop}" for phase, start, stop in index['phases'])
+        print(f"{os.path.basename(file_path)}: {len(index['windows'])} windows, {phases}, "
+              f"Apdex changes at {index['apdex_change_points']}")
+
+
+def cmd_significance(args):
+    import resampling
+
+    file_paths = get_file_paths(args)
+    options = dict(n_resamples=args.resamples, block_length=args.block_length, correction=args.correction,
+                   seed=args.seed, max_workers=args.workers, phases=args.phases)
+    if args.test == 'granger':
+        table = resampling.granger_significance(file_paths, exclusion(args, ['tsr', 'errors']), **options)
+        if args.output:
+            table.to_csv(args.output, index=False)
+        for label, p_value_column in (('Uncorrected', 'min_p_value'), (f'{args.correction}', 'min_p_corrected'),
+                                      ('Permutation', 'permutation_p_value'),
+                                      (f'Permutation {args.correction}', 'permutation_p_corrected')):
+            print(f"{label}: {resampling.significance_counts(table, p_value_column)}")
+    else:
+        for metric in args.metrics:
+            excluded = exclusion(args, ['tsr', 'errors'])
+            intervals = resampling.correlation_intervals(file_paths, metric, [c for c in excluded if c != metric],
+                                                         confidence=args.confidence, **options)
+            if args.output:
+                intervals.to_csv(args.output, index=False, mode='a' if metric != args.metrics[0] else 'w',
+                                 header=metric == args.metrics[0])
+            print(f"Correlations with '{metric}':")
+            print(intervals.to_string(index=False))
+
+
+def cmd_extract(args):
+    import general_metrics_extractor
+
+    general_metrics_extractor.main(args.extractor_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Analyse chaos engineering experiment datasets.")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="Record the stage timings and write them as JSON (.json) or collapsed stacks")
+    parser.add_argument('--profile-memory', action='store_true', help="Also trace the peak memory of the stages")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_dataset_command(name, help_text, handler):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('folder', help="Folder of the experiment CSV files")
+        subparser.add_argument('--experiment', choices=EXPERIMENTS,
+                               help="Chaos marker column, inferred from the file names by default")
+        subparser.add_argument('--exclude', nargs='*', metavar='COLUMN',
+                               help="Columns to exclude besides the chaos marker, defaults per subcommand")
+        subparser.add_argument('--phases', nargs='+', choices=PHASES,
+                               help="Only analyse these phases of the experiments")
+        subparser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+        subparser.set_defaults(handler=handler)
+        return subparser
+
+    subparser = subparsers.add_parser('list', help="List the experiment datasets of a folder")
+    subparser.add_argument('folder', help="Folder of the experiment CSV files")
+    subparser.set_defaults(handler=cmd_list)
+
+    subparser = add_dataset_command('causality', "Granger causality counts or the causal graph", cmd_causality)
+    subparser.add_argument('--mode', choices=['apdex', 'all-pairs'], default='apdex')
+    subparser.add_argument('--test', choices=['conditional', 'pairwise'], default='conditional',
+                           help="Test of the all-pairs mode")
+    subparser.add_argument('--output', help="Write the all-pairs edge list to this CSV file")
+    subparser.add_argument('--no-store', '--no-cache', dest='no_store', action='store_true',
+                           help="Do not read or write the analysis store")
+    subparser.add_argument('--chunk-rows', type=int, default=None,
+                           help="Stream the experiments in chunks of this many rows instead of loading them")
+
+    subparser = add_dataset_command('correlation', "Pearson and Spearman correlations", cmd_correlation)
+    subparser.add_argument('--metrics', nargs='+', default=['apdex'])
+    subparser.add_argument('--no-store', action='store_true', help="Do not read or write the analysis store")
+    subparser.add_argument('--chunk-rows', type=int, default=None,
+                           help="Stream the experiments in chunks of this many rows instead of loading them")
+
+    subparser = add_dataset_command('forecast', "VAR forecasts of Apdex", cmd_forecast)
+    subparser.add_argument('--mode', choices=['holdout', 'walk-forward'], default='holdout')
+    subparser.add_argument('--results', default='forecast_results.csv', help="Append-only results table")
+    subparser.add_argument('--plot-dir', help="Save a plot per experiment to this folder")
+    subparser.add_argument('--predictions-dir', default='walk_forward_predictions',
+                           help="Save the walk-forward predictions of every experiment to this folder")
+    subparser.add_argument('--no-store', action='store_true', help="Do not read or write the analysis store")
+    subparser.add_argument('--batched', action='store_true',
+                           help="Fit the VARs of equal-shaped experiments together in one process")
+
+    subparser = add_dataset_command('significance', "Resampled confidence intervals and corrected significance",
+                                    cmd_significance)
+    subparser.add_argument('--test', choices=['granger', 'correlation'], default='granger')
+    subparser.add_argument('--metrics', nargs='+', default=['apdex'], help="Metrics of the correlation test")
+    subparser.add_argument('--resamples', type=int, default=2000)
+    subparser.add_argument('--block-length', type=int, default=None, help="Defaults to the cube root of the rows")
+    subparser.add_argument('--confidence', type=float, default=0.95)
+    subparser.add_argument('--correction', default='fdr_bh', help="Method of statsmodels' multipletests")
+    subparser.add_argument('--seed', type=int, default=0)
+    subparser.add_argument('--output', help="Write the table to this CSV file")
+
+    add_dataset_command('segments', "Chaos windows, phases and Apdex change points", cmd_segments)
+
+    subparser = subparsers.add_parser('extract', help="Export experiment windows from New Relic",
+                                      add_help=False)
+    subparser.add_argument('extractor_args', nargs=argparse.REMAINDER,
+                           help="Arguments of general_metrics_extractor.py")
+    subparser.set_defaults(handler=cmd_extract)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'extract':
+        # Options of the extractor, --help included, are passed through untouched
+        args.extractor_args = extra + args.extractor_args
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    if args.profile:
+        import profiling
+
+        profiling.enable(args.profile_memory)
+        try:
+            args.handler(args)
+        finally:
+            profiling.save(args.profile)
+            print(profiling.report(), file=sys.stderr)
+    else:
+        args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,93 +5,309 @@
 This script calculates and displays the Pearson and Spearman correlations of the
 specified metrics ('tsr', 'apdex') across multiple data files.
 
+Set 'chunk_rows' to stream experiments too long to load at once in chunks of that many
+rows (see streaming.py). The Pearson correlations are then merged from the moments of
+the chunks and the Spearman ones are ranked one column at a time.
+
 Author: dhruvshetty213@gmail.com
 """
 
 import numpy as np
 import pandas as pd
-import os
 import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import analysis_store
+import change_points
+import dataset_cache
+import profiling
+import streaming
 
 # Configuration
 config = {
     'folder_path': '/path/to/datasets/',
     'metrics': ['apdex'],
     'metrics_to_exclude': ['tsr', 'apdex', 'cpu'], # Change cpu to io for I/O CE experiments
+    'max_workers': 1, # Set above 1 to aggregate the files in parallel worker processes
+    'phases': None, # E.g. ['in-fault'] to only correlate that phase of the experiments (see change_points.py)
+    'store_path': analysis_store.STORE_PATH, # Per-file correlations of earlier runs (see analysis_store.py), None to disable
+    'chunk_rows': None, # E.g. streaming.CHUNK_ROWS to stream the experiments instead of loading them
 }
+MIN_ROWS = 3  # Fewest rows to correlate, files whose selected phases are shorter are left out of the aggregate
 
 # Logging config
 logging.basicConfig(level=logging.INFO)
 
+class MetricNotFoundError(KeyError):
+    """
+    Raised when the metric to correlate is missing from a data file, with the file and its columns.
+    """
+
+    def __init__(self, file_path, columns):
+        super().__init__(file_path, columns)
+        self.file_path = file_path
+        self.columns = columns
+
 def get_file_paths(folder_path):
     """
-    Returns a list of all file paths in the specified folder.
+    Returns a list of all experiment CSV file paths in the specified folder.
     """
-    return [os.path.join(folder_path, f) for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
+    return dataset_cache.list_experiment_files(folder_path)
 
-def calculate_correlation(file_paths, metric):
+def rank_columns(values):
     """
-    Calculates and logs the Pearson and Spearman correlations of the specified metric
-    across multiple data files.
+    Returns the column-wise ranks of a 2-D array, averaging the ranks of ties like pandas does.
+    A single argsort over all columns is used.
     """
-    # Rest of the columns apart from the one for which the correlation test is done should be removed
-    columns_to_exclude = config['metrics_to_exclude'].copy()
-    columns_to_exclude.remove(metric)
+    n = values.shape[0]
+    order = np.argsort(values, axis=0, kind='mergesort')
+    sorted_values = np.take_along_axis(values, order, axis=0)
+
+    positions = np.broadcast_to(np.arange(n)[:, None], values.shape)
+    changes = sorted_values[1:] != sorted_values[:-1]
+    is_first = np.vstack([np.ones((1, values.shape[1]), dtype=bool), changes])
+    is_last = np.vstack([changes, np.ones((1, values.shape[1]), dtype=bool)])
+
+    # Every element of a tie group gets the mean of the first and last position of its group
+    first = np.maximum.accumulate(np.where(is_first, positions, 0), axis=0)
+    last = np.minimum.accumulate(np.where(is_last, positions, n)[::-1], axis=0)[::-1]
+
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=0)
+    return ranks
+
+def correlate_with_column(values, target):
+    """
+    Returns the Pearson correlations of every column of a 2-D array with the given target column,
+    computed as a single dot product of the centered data. Constant columns yield NaN.
+    """
+    centered = values - values.mean(axis=0)
+    centered_target = centered[:, target]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return centered.T @ centered_target / (np.linalg.norm(centered, axis=0) * np.linalg.norm(centered_target))
+
+def metric_correlations(data, metric):
+    """
+    Returns the Pearson and Spearman correlations of every column of the data with the specified metric,
+    as the `metric` column of `data.corr(method='pearson')` and `data.corr(method='spearman')`.
+    """
+    if data.isna().any().any():
+        # Missing values need pairwise complete observations per column, leave these to pandas
+        return (data.corrwith(data[metric], method='pearson').to_numpy(),
+                data.corrwith(data[metric], method='spearman').to_numpy())
+
+    values = data.to_numpy(dtype=np.float64)
+    target = data.columns.get_loc(metric)
+    return correlate_with_column(values, target), correlate_with_column(rank_columns(values), target)
+
+def streamed_metric_correlations(file_path, columns, metric, phases=None, chunk_rows=streaming.CHUNK_ROWS):
+    """
+    Returns the correlations of `metric_correlations` between the given columns of an experiment and the
+    specified metric, streaming the experiment in chunks of chunk_rows rows instead of loading it.
+    """
+    target = columns.index(metric)
+    moments = streaming.PairwiseMoments(len(columns))
+    for chunk in streaming.iter_chunks(file_path, columns, phases, chunk_rows):
+        moments.update(chunk, chunk[:, target])
+
+    # Ranks need the whole column, so only the metric and one other column are held at a time
+    metric_values = streaming.column_values(file_path, metric, phases)
+    spearman = np.empty(len(columns))
+    for i, column in enumerate(columns):
+        values = metric_values if i == target else streaming.column_values(file_path, column, phases)
+        present = ~np.isnan(values) & ~np.isnan(metric_values)
+        ranks = rank_columns(np.column_stack([values[present], metric_values[present]]))
+        spearman[i] = correlate_with_column(ranks, 1)[0]
+
+    return moments.correlation(), spearman
+
+class CorrelationAggregate:
+    """
+    Running mean, min and max of the correlations of a metric with every feature across data files.
+    Memory use does not depend on the number of files, and partial aggregates can be merged.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.count = 0
+        self.sums = {method: np.zeros(len(self.features)) for method in ('pearson', 'spearman')}
+        self.mins = {method: np.full(len(self.features), np.inf) for method in ('pearson', 'spearman')}
+        self.maxs = {method: np.full(len(self.features), -np.inf) for method in ('pearson', 'spearman')}
+
+    def update(self, pearson, spearman):
+        for method, coeff in (('pearson', pearson), ('spearman', spearman)):
+            self.sums[method] += coeff
+            # np.minimum and np.maximum propagate NaN like np.min and np.max over stacked files do
+            self.mins[method] = np.minimum(self.mins[method], coeff)
+            self.maxs[method] = np.maximum(self.maxs[method], coeff)
+        self.count += 1
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.features = list(other.features)
+            self.count = other.count
+            self.sums = {method: sums.copy() for method, sums in other.sums.items()}
+            self.mins = {method: mins.copy() for method, mins in other.mins.items()}
+            self.maxs = {method: maxs.copy() for method, maxs in other.maxs.items()}
+            return self
+        if other.features != self.features:
+            raise ValueError(f"Cannot merge correlations of features {other.features} into {self.features}.")
+
+        for method in self.sums:
+            self.sums[method] = self.sums[method] + other.sums[method]
+            self.mins[method] = np.minimum(self.mins[method], other.mins[method])
+            self.maxs[method] = np.maximum(self.maxs[method], other.maxs[method])
+        self.count += other.count
+        return self
+
+    def mean(self, method):
+        return pd.Series(self.sums[method] / self.count, index=self.features)
 
-    pearson_series_list = []
-    spearman_series_list = []
+    def min(self, method):
+        return pd.Series(self.mins[method], index=self.features)
 
-    for file_path in file_paths:
-        data = pd.read_csv(file_path)
+    def max(self, method):
+        return pd.Series(self.maxs[method], index=self.features)
+
+def file_correlations(file_path, metric, columns_to_exclude, phases=None, chunk_rows=None):
+    """
+    Returns the feature names and the Pearson and Spearman correlations of the specified metric with them
+    in one data file, optionally restricted to the given phases of the experiment, and streamed in chunks
+    of chunk_rows rows if set. Raises a MetricNotFoundError if the metric is missing from it, and returns
+    None with a logged warning if it has fewer than MIN_ROWS rows.
+    """
+    with profiling.stage('correlate_file', file_path):
+        if chunk_rows:
+            columns = dataset_cache.experiment_columns(file_path)
+            if metric not in columns:
+                raise MetricNotFoundError(file_path, list(columns))
+            n_rows = streaming.count_rows(file_path, phases)
+            if n_rows < MIN_ROWS:
+                return _skipped_file(file_path, n_rows)
+            features = list(columns.drop(columns_to_exclude))
+            return (features, *streamed_metric_correlations(file_path, features, metric, phases, chunk_rows))
+
+        data = change_points.load_phases(file_path, phases)
         if metric not in data.columns:
-            logging.error(f"Metric '{metric}' not found in file {file_path}. Available columns are: {', '.join(data.columns)}.")
-            return
+            raise MetricNotFoundError(file_path, list(data.columns))
+        if len(data) < MIN_ROWS:
+            return _skipped_file(file_path, len(data))
 
         # Columns to visualize correlations
         data_corr = data.drop(columns_to_exclude, axis=1)
+        pearson, spearman = metric_correlations(data_corr, metric)
+        return list(data_corr.columns), pearson, spearman
+
+def _skipped_file(file_path, n_rows):
+    logging.warning(f"Leaving {file_path} out of the correlations: {n_rows} rows, fewer than {MIN_ROWS}.")
+    return None
 
-        # Calculate correlation coefficients
-        pearson_coeff = data_corr.corr(method='pearson')
-        spearman_coeff = data_corr.corr(method='spearman')
+def correlate_files(file_paths, metric, columns_to_exclude, phases=None, chunk_rows=None):
+    return [file_correlations(file_path, metric, columns_to_exclude, phases, chunk_rows) for file_path in file_paths]
 
-        # Append the series (correlations with the metric) to the respective lists
-        pearson_series_list.append(pearson_coeff[metric])
-        spearman_series_list.append(spearman_coeff[metric])
+def aggregate_partials(file_paths, partials):
+    """
+    Aggregates the (features, pearson, spearman) correlations of the given data files, in order.
+    Files without correlations (None) are left out.
+    """
+    aggregate = None
+    for file_path, partial in zip(file_paths, partials):
+        if partial is None:
+            continue
+        features, pearson, spearman = partial
+        if aggregate is None:
+            aggregate = CorrelationAggregate(features)
+        elif list(features) != aggregate.features:
+            raise ValueError(f"Columns of {file_path} do not match the columns of the previous files.")
+        aggregate.update(np.asarray(pearson, dtype=float), np.asarray(spearman, dtype=float))
 
-    # Concatenate all the series along a new axis
-    pearson_2d = np.stack([s.values for s in pearson_series_list])
-    spearman_2d = np.stack([s.values for s in spearman_series_list])
+    return aggregate if aggregate is not None else CorrelationAggregate([])
 
-    # Compute the mean, min and max correlation along the new axis
-    pearson_mean = np.mean(pearson_2d, axis=0)
-    spearman_mean = np.mean(spearman_2d, axis=0)
+def aggregate_file_correlations(file_paths, metric, columns_to_exclude, phases=None):
+    """
+    Aggregates the correlations of the specified metric over the given data files, one file at a time,
+    optionally restricted to the given phases of the experiments.
+    Raises a MetricNotFoundError if the metric is missing from one of them.
+    """
+    return aggregate_partials(file_paths, correlate_files(file_paths, metric, columns_to_exclude, phases))
 
-    pearson_min = np.min(pearson_2d, axis=0)
-    spearman_min = np.min(spearman_2d, axis=0)
+def load_partials(file_paths, metric, columns_to_exclude, max_workers, store_path=None, phases=None, chunk_rows=None):
+    """
+    Returns the correlations of every file, reading those of unchanged files from the analysis store and
+    computing the others, split between max_workers worker processes if there are several, and streamed
+    in chunks of chunk_rows rows if set. Files too short to correlate have None and are not stored.
+    """
+    store = analysis_store.AnalysisStore(store_path) if store_path else None
+    try:
+        params = {'metric': metric, 'columns_to_exclude': sorted(columns_to_exclude), 'phases': phases,
+                  'min_rows': MIN_ROWS}
+        key = store.register('correlation', params) if store else None
+        hashes = [dataset_cache.content_hash(file_path) for file_path in file_paths]
+        stored = store.get('correlation', key, hashes) if store else {}
+        partials = {file_hash: (r['features'], r['pearson'], r['spearman'])
+                    for (file_hash, _), r in stored.items()}
+        pending = [file_path for file_path, file_hash in zip(file_paths, hashes) if file_hash not in partials]
 
-    pearson_max = np.max(pearson_2d, axis=0)
-    spearman_max = np.max(spearman_2d, axis=0)
+        if max_workers > 1 and len(pending) > 1:
+            chunks = [pending[i::max_workers] for i in range(max_workers) if pending[i::max_workers]]
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                futures = [profiling.submit(executor, correlate_files, chunk, metric, columns_to_exclude, phases,
+                                            chunk_rows)
+                           for chunk in chunks]
+                computed = dict(zip([f for chunk in chunks for f in chunk],
+                                    [partial for future in futures for partial in profiling.result(future)]))
+        else:
+            computed = dict(zip(pending, correlate_files(pending, metric, columns_to_exclude, phases, chunk_rows)))
 
-    # Use index from one of the correlation series
-    index = pearson_series_list[0].index
+        entries = []
+        for file_path, file_hash in zip(file_paths, hashes):
+            if file_path in computed:
+                partials[file_hash] = computed[file_path]
+                if computed[file_path] is None:
+                    continue
+                features, pearson, spearman = computed[file_path]
+                entries.append((file_hash, '', {'features': features, 'pearson': pearson, 'spearman': spearman}))
+        if store and entries:
+            store.put('correlation', key, entries)
+    finally:
+        if store:
+            store.close()
 
-    # Convert the numpy arrays back to series
-    pearson_mean_s = pd.Series(pearson_mean, index=index)
-    spearman_mean_s = pd.Series(spearman_mean, index=index)
+    return [partials[file_hash] for file_hash in hashes]
 
-    pearson_min_s = pd.Series(pearson_min, index=index)
-    spearman_min_s = pd.Series(spearman_min, index=index)
+@profiling.profiled()
+def calculate_correlation(file_paths, metric, max_workers=None):
+    """
+    Calculates and logs the Pearson and Spearman correlations of the specified metric
+    across multiple data files. With more than one worker, the files are split between
+    worker processes. The correlations of every file are kept in the analysis store, so
+    only new or changed files are computed and the aggregate is rebuilt from the stored ones.
+    """
+    # Rest of the columns apart from the one for which the correlation test is done should be removed
+    columns_to_exclude = config['metrics_to_exclude'].copy()
+    columns_to_exclude.remove(metric)
 
-    pearson_max_s = pd.Series(pearson_max, index=index)
-    spearman_max_s = pd.Series(spearman_max, index=index)
+    max_workers = max_workers or config['max_workers']
+    try:
+        partials = load_partials(file_paths, metric, columns_to_exclude, max_workers, config['store_path'],
+                                 config['phases'], config['chunk_rows'])
+    except MetricNotFoundError as e:
+        logging.error(f"Metric '{metric}' not found in file {e.file_path}. "
+                      f"Available columns are: {', '.join(e.columns)}.")
+        return
+    aggregate = aggregate_partials(file_paths, partials)
 
     # Log the results
-    logging.info(f"Pearson mean correlation with '{metric}':\n{pearson_mean_s}")
-    logging.info(f"Spearman mean correlation with '{metric}':\n{spearman_mean_s}")
-    logging.info(f"Pearson min correlation with '{metric}':\n{pearson_min_s}")
-    logging.info(f"Spearman min correlation with '{metric}':\n{spearman_min_s}")
-    logging.info(f"Pearson max correlation with '{metric}':\n{pearson_max_s}")
-    logging.info(f"Spearman max correlation with '{metric}':\n{spearman_max_s}")
+    logging.info(f"Pearson mean correlation with '{metric}':\n{aggregate.mean('pearson')}")
+    logging.info(f"Spearman mean correlation with '{metric}':\n{aggregate.mean('spearman')}")
+    logging.info(f"Pearson min correlation with '{metric}':\n{aggregate.min('pearson')}")
+    logging.info(f"Spearman min correlation with '{metric}':\n{aggregate.min('spearman')}")
+    logging.info(f"Pearson max correlation with '{metric}':\n{aggregate.max('pearson')}")
+    logging.info(f"Spearman max correlation with '{metric}':\n{aggregate.max('spearman')}")
+
+    return aggregate
 
 def main():
     file_paths = get_file_paths(config['folder_path'])
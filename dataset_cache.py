@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is the shared dataset loader of the analysis scripts. Each experiment CSV is converted
+once into a compact columnar cache (float32 metrics plus an int64 epoch index in nanoseconds) that
+is memory-mapped on later loads, so repeated analysis passes skip CSV and timestamp parsing. The CSV
+is parsed in chunks of CSV_CHUNK_ROWS rows written straight into the cache arrays, so converting a
+long experiment never holds more than one chunk of it in memory.
+
+The cache of `<folder>/<name>.csv` lives in `<folder>/.dataset_cache/<name>/`. An entry is rebuilt
+when the size of its CSV changes, or when the modification time changes and the content hash no
+longer matches.
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import profiling
+
+CACHE_DIR_NAME = '.dataset_cache'
+METRICS_DTYPE = np.float32
+CACHE_VERSION = 1
+CSV_CHUNK_ROWS = 100000
+
+
+def list_experiment_files(folder_path):
+    """
+    Returns the sorted list of experiment CSV file paths in the specified folder.
+    """
+    return sorted(
+        os.path.join(folder_path, f) for f in os.listdir(folder_path)
+        if f.endswith('.csv') and os.path.isfile(os.path.join(folder_path, f))
+    )
+
+
+def sha256_file(file_path):
+    """
+    Returns the SHA-256 hex digest of the contents of the given file.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_entry_dir(file_path):
+    """
+    Returns the directory holding the cache entry of the given CSV file.
+    """
+    folder, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(folder, CACHE_DIR_NAME, os.path.splitext(name)[0])
+
+
+def _write_atomic(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_meta(entry_dir, meta):
+    _write_atomic(os.path.join(entry_dir, 'meta.json'), lambda f: f.write(json.dumps(meta).encode()))
+
+
+def _read_meta(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == CACHE_VERSION else None
+
+
+def count_csv_rows(file_path):
+    """
+    Returns the number of data rows of a CSV file, its lines without the header, without parsing it.
+    """
+    lines, last = 0, b'\n'
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    # A last line without a newline is a row too
+    return max(lines - 1 + (last != b'\n'), 0)
+
+
+def _create_array(entry_dir, shape, dtype):
+    fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+    os.close(fd)
+    return tmp_path, np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+
+
+def _finish_array(tmp_path, array, rows, path):
+    try:
+        if rows < len(array):
+            # pandas skipped blank lines, keep the parsed rows only
+            _write_atomic(path, lambda f: np.save(f, array[:rows]))
+        else:
+            array.flush()
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+@profiling.profiled(file_arg='file_path')
+def build_cache_entry(file_path):
+    """
+    Parse the given CSV file chunk by chunk and write its columnar cache entry.
+
+    Returns:
+        dict: The metadata of the new entry.
+    """
+    stat = os.stat(file_path)
+    entry_dir = cache_entry_dir(file_path)
+    os.makedirs(entry_dir, exist_ok=True)
+
+    n_rows = count_csv_rows(file_path)
+    arrays = {}
+    header = None
+    filled = 0
+    try:
+        with profiling.stage('read_csv'):
+            for chunk in pd.read_csv(file_path, index_col=0, parse_dates=True, chunksize=CSV_CHUNK_ROWS):
+                if not isinstance(chunk.index, pd.DatetimeIndex):
+                    raise ValueError(f"The first column of {file_path} could not be parsed as timestamps.")
+                if header is None:
+                    header = {'index_name': chunk.index.name,
+                              'tz': None if chunk.index.tz is None else str(chunk.index.tz),
+                              'columns': list(chunk.columns)}
+                    arrays['index'] = _create_array(entry_dir, (n_rows,), np.int64)
+                    arrays['metrics'] = _create_array(entry_dir, (n_rows, chunk.shape[1]), METRICS_DTYPE)
+                arrays['index'][1][filled:filled + len(chunk)] = chunk.index.as_unit('ns').asi8
+                arrays['metrics'][1][filled:filled + len(chunk)] = chunk.to_numpy(dtype=METRICS_DTYPE)
+                filled += len(chunk)
+        if header is None:
+            raise ValueError(f"The first column of {file_path} could not be parsed as timestamps.")
+
+        for name in list(arrays):
+            _finish_array(*arrays.pop(name), filled, os.path.join(entry_dir, f'{name}.npy'))
+    finally:
+        for tmp_path, _ in arrays.values():
+            os.unlink(tmp_path)
+
+    # The metadata is written last, so it only ever describes complete arrays
+    meta = {
+        'version': CACHE_VERSION,
+        **header,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256_file(file_path),
+    }
+    _write_meta(entry_dir, meta)
+    return meta
+
+
+def ensure_cached(file_path):
+    """
+    Make sure the cache entry of the given CSV file exists and is up to date.
+
+    Returns:
+        tuple: The entry directory and its metadata.
+    """
+    entry_dir = cache_entry_dir(file_path)
+    meta = _read_meta(entry_dir)
+    stat = os.stat(file_path)
+
+    if meta is None or meta['size'] != stat.st_size:
+        return entry_dir, build_cache_entry(file_path)
+
+    if meta['mtime_ns'] != stat.st_mtime_ns:
+        if meta['sha256'] != sha256_file(file_path):
+            return entry_dir, build_cache_entry(file_path)
+        # The file was touched without changing, remember the new mtime to skip hashing next time
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_meta(entry_dir, meta)
+
+    return entry_dir, meta
+
+
+def content_hash(file_path):
+    """
+    Returns the SHA-256 hex digest of the given CSV file, reusing the digest of its cache entry.
+    """
+    return ensure_cached(file_path)[1]['sha256']
+
+
+def experiment_columns(file_path):
+    """
+    Returns the metric column names of the given CSV file without loading its data.
+    """
+    return pd.Index(ensure_cached(file_path)[1]['columns'])
+
+
+def load_arrays(file_path):
+    """
+    Returns the memory-mapped arrays of an experiment CSV file: the epoch index in nanoseconds, the
+    float32 metrics of shape (rows, columns) and the metadata of its cache entry. Slicing rows of the
+    metrics only reads those rows from disk.
+    """
+    entry_dir, meta = ensure_cached(file_path)
+    index = np.load(os.path.join(entry_dir, 'index.npy'), mmap_mode='r')
+    metrics = np.load(os.path.join(entry_dir, 'metrics.npy'), mmap_mode='r')
+    return index, metrics, meta
+
+
+@profiling.profiled(file_arg='file_path')
+def load_experiment(file_path, columns=None):
+    """
+    Load an experiment CSV file through its columnar cache.
+
+    Parameters:
+        file_path (str): The location of the CSV file containing the time series data.
+        columns (list): The metric columns to load, defaults to all of them.
+
+    Returns:
+        DataFrame: The float32 metrics indexed by timestamp, as `pd.read_csv(file_path, index_col=0,
+                   parse_dates=True)` would return them. Without a column selection the values are a
+                   read-only view of the memory-mapped cache.
+    """
+    index, metrics, meta = load_arrays(file_path)
+
+    timestamps = pd.to_datetime(np.asarray(index), unit='ns', utc=meta['tz'] is not None)
+    if meta['tz'] is not None:
+        timestamps = timestamps.tz_convert(meta['tz'])
+    timestamps.name = meta['index_name']
+
+    all_columns = meta['columns']
+    if columns is not None:
+        metrics = metrics[:, [all_columns.index(column) for column in columns]]
+        all_columns = list(columns)
+
+    return pd.DataFrame(metrics, index=timestamps, columns=all_columns, copy=False)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This script runs closed-loop chaos experiments on a single Linux box and records their datasets. For
+every experiment it starts the Locust load (loadsimulator/), waits for a warm-up, and then injects
+local CPU or I/O faults following the chaos marker of synthetic_datasets.py: a fault-free baseline
+followed by on and off bursts. Every SAMPLE_SECONDS the metrics of the window are sampled and
+appended to the dataset, which is finally named and laid out like the exported ones, e.g.
+`cpu_chaos_<start>_<end>_30 second.csv`, with the 'cpu' or 'io' marker column.
+
+The transaction metrics (errors, latency, traffic, tsr, apdex) come from the requests of the load
+generator, counted by loadsimulator/metrics_probe.py. The host metrics of the system under test,
+which runs on the same box, are the '_x' columns, and those of the Locust process the '_y' columns.
+
+    python experiment_runner.py --host http://localhost:8080 --experiments cpu io --count 10 --output datasets/local
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone, timedelta
+
+import psutil
+
+import synthetic_datasets
+from general_metrics_extractor import dataset_file_name, format_timestamp
+
+LOADSIMULATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loadsimulator')
+LOCUSTFILES = ['locustfile.py', 'user_profiles.py', 'metrics_probe.py']
+SAMPLE_SECONDS = 30
+N_ROWS = 70
+BASELINE_ROWS = synthetic_datasets.BASELINE_ROWS
+BURST_ROWS = synthetic_datasets.BURST_ROWS
+WARMUP_SECONDS = 60
+COOLDOWN_SECONDS = 120
+IO_BLOCK_BYTES = 4 * 2 ** 20
+IO_FILE_BYTES = 256 * 2 ** 20
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _burn_cpu(stop):
+    while not stop.is_set():
+        for _ in range(100000):
+            pass
+
+
+def _stress_io(stop, directory):
+    block = os.urandom(IO_BLOCK_BYTES)
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.io_stress')
+    try:
+        while not stop.is_set():
+            os.write(fd, block)
+            os.fsync(fd)
+            if os.lseek(fd, 0, os.SEEK_CUR) >= IO_FILE_BYTES:
+                os.lseek(fd, 0, os.SEEK_SET)
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+
+class FaultInjector:
+    """
+    Local CPU burner or I/O stress processes that can be switched on and off. The CPU fault keeps
+    every core busy, the I/O fault writes and fsyncs blocks to a file in io_dir from every worker.
+    """
+
+    def __init__(self, kind, workers=None, io_dir=None):
+        if kind not in ('cpu', 'io'):
+            raise ValueError(f"Unknown fault {kind}, expected 'cpu' or 'io'.")
+        self.kind = kind
+        self.workers = workers or os.cpu_count()
+        self.io_dir = io_dir or tempfile.gettempdir()
+        self.stop_event = None
+        self.processes = []
+
+    @property
+    def active(self):
+        return bool(self.processes)
+
+    def start(self):
+        if self.active:
+            return
+        self.stop_event = multiprocessing.Event()
+        target, args = (_burn_cpu, (self.stop_event,)) if self.kind == 'cpu' else \
+            (_stress_io, (self.stop_event, self.io_dir))
+        self.processes = [multiprocessing.Process(target=target, args=args, daemon=True) for _ in range(self.workers)]
+        for process in self.processes:
+            process.start()
+
+    def stop(self):
+        if not self.active:
+            return
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+        self.processes = []
+
+    def set(self, active):
+        self.start() if active else self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class MetricsSampler:
+    """
+    Differences consecutive snapshots of the probe totals and of the host and load generator
+    resource usage into the metric columns of one sample window.
+    """
+
+    def __init__(self, metrics_path, load_pid):
+        self.metrics_path = metrics_path
+        self.load_process = psutil.Process(load_pid)
+        self.previous = self.read_totals()
+        psutil.cpu_percent(interval=None)
+        self.load_process.cpu_percent(interval=None)
+
+    def read_totals(self):
+        try:
+            with open(self.metrics_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'requests': 0, 'failures': 0, 'response_time_seconds': 0.0, 'satisfied': 0, 'tolerating': 0}
+
+    def sample(self):
+        totals = self.read_totals()
+        window = {key: totals[key] - self.previous[key] for key in totals}
+        self.previous = totals
+
+        requests = window['requests']
+        nan = float('nan')
+        return {
+            'errors': 100 * window['failures'] / requests if requests else nan,
+            'latency': window['response_time_seconds'] / requests if requests else nan,
+            'traffic': requests,
+            'average.cpuPercent_x': psutil.cpu_percent(interval=None),
+            'average.cpuPercent_y': self.load_process.cpu_percent(interval=None) / psutil.cpu_count(),
+            'average.memoryUsedPercent_x': psutil.virtual_memory().percent,
+            'average.memoryUsedPercent_y': self.load_process.memory_percent(),
+            'tsr': 100 * (requests - window['failures']) / requests if requests else nan,
+            'apdex': round((window['satisfied'] + window['tolerating'] / 2) / requests, 2) if requests else nan,
+        }
+
+
+def start_load(host, metrics_path, locustfiles=LOCUSTFILES, extra_args=()):
+    """
+    Start Locust headless in a subprocess, with the metrics probe writing to metrics_path.
+    """
+    env = dict(os.environ, LOAD_METRICS_PATH=metrics_path)
+    files = ','.join(os.path.join(LOADSIMULATOR_DIR, f) if not os.path.isabs(f) else f for f in locustfiles)
+    command = [sys.executable, '-m', 'locust', '-f', files, '--headless', '--host', host,
+               '--loglevel', 'WARNING', *extra_args]
+    return subprocess.Popen(command, env=env, cwd=LOADSIMULATOR_DIR, stdout=subprocess.DEVNULL)
+
+
+def stop_load(process, timeout=30):
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def sleep_until(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+def run_experiment(experiment, folder_path, host, n_rows=N_ROWS, sample_seconds=SAMPLE_SECONDS,
+                   baseline_rows=BASELINE_ROWS, burst_rows=BURST_ROWS, warmup_seconds=WARMUP_SECONDS,
+                   locustfiles=LOCUSTFILES, locust_args=(), fault_workers=None):
+    """
+    Run one experiment: load, warm-up, then n_rows sample windows with the fault switched on and off
+    following the chaos marker, each appended to the dataset as soon as it is sampled.
+
+    Returns:
+        str: The path of the written dataset.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    marker = synthetic_datasets.chaos_marker(n_rows, baseline_rows, burst_rows)
+    columns = synthetic_datasets.COLUMNS + [experiment]
+
+    with tempfile.TemporaryDirectory() as work_dir, FaultInjector(experiment, fault_workers) as injector:
+        metrics_path = os.path.join(work_dir, 'metrics.json')
+        load = start_load(host, metrics_path, locustfiles, locust_args)
+        try:
+            time.sleep(warmup_seconds)
+
+            # Align the windows to the sample rate like the TIMESERIES buckets of the exported datasets
+            now = datetime.now(timezone.utc)
+            start = datetime.fromtimestamp((now.timestamp() // sample_seconds + 1) * sample_seconds, timezone.utc)
+            time.sleep((start - now).total_seconds())
+            started = time.monotonic()
+
+            partial_path = os.path.join(folder_path, f".{experiment}_chaos_{format_timestamp(start)}.csv.partial")
+            sampler = MetricsSampler(metrics_path, load.pid)
+            with open(partial_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['timestamp'] + columns)
+                for row in range(n_rows):
+                    injector.set(marker[row] > 0)
+                    sleep_until(started + (row + 1) * sample_seconds)
+                    if load.poll() is not None:
+                        raise RuntimeError(f"Locust exited with code {load.returncode} during the experiment.")
+
+                    metrics = sampler.sample()
+                    metrics[experiment] = marker[row]
+                    timestamp = format_timestamp(start + timedelta(seconds=row * sample_seconds))
+                    writer.writerow([timestamp] + [metrics[column] for column in columns])
+                    f.flush()
+        finally:
+            injector.stop()
+            stop_load(load)
+
+    end = start + timedelta(seconds=n_rows * sample_seconds)
+    file_path = os.path.join(folder_path, dataset_file_name(experiment, start, end, f"{sample_seconds} second"))
+    os.replace(partial_path, file_path)
+    return file_path
+
+
+def run_campaign(experiments, count, folder_path, host, cooldown_seconds=COOLDOWN_SECONDS, **experiment_options):
+    """
+    Run count rounds of the given experiment types back-to-back, cooling down between experiments.
+
+    Returns:
+        list: The paths of the written datasets.
+    """
+    file_paths = []
+    for round_index in range(count):
+        for experiment in experiments:
+            if file_paths:
+                time.sleep(cooldown_seconds)
+            file_path = run_experiment(experiment, folder_path, host, **experiment_options)
+            logging.info(f"Experiment {len(file_paths) + 1}/{count * len(experiments)} written to {file_path}")
+            file_paths.append(file_path)
+    return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local chaos experiments under load and record their datasets.")
+    parser.add_argument('--host', required=True, help="Base URL of the system under test")
+    parser.add_argument('--experiments', nargs='+', choices=['cpu', 'io'], default=['cpu'])
+    parser.add_argument('--count', type=int, default=1, help="Rounds of the experiments to run")
+    parser.add_argument('--output', default='.', help="Folder to write the datasets to")
+    parser.add_argument('--rows', type=int, default=N_ROWS)
+    parser.add_argument('--sample-seconds', type=int, default=SAMPLE_SECONDS)
+    parser.add_argument('--baseline-rows', type=int, default=BASELINE_ROWS)
+    parser.add_argument('--burst-rows', type=int, default=BURST_ROWS)
+    parser.add_argument('--warmup', type=float, default=WARMUP_SECONDS, help="Seconds of load before the first sample")
+    parser.add_argument('--cooldown', type=float, default=COOLDOWN_SECONDS, help="Seconds between experiments")
+    parser.add_argument('--fault-workers', type=int, default=None, help="Fault processes, defaults to the CPU count")
+    parser.add_argument('--locustfiles', nargs='+', default=LOCUSTFILES,
+                        help="Locust files relative to loadsimulator/, the metrics probe must be among them")
+    args, locust_args = parser.parse_known_args()
+
+    file_paths = run_campaign(
+        args.experiments, args.count, args.output, args.host, args.cooldown, n_rows=args.rows,
+        sample_seconds=args.sample_seconds, baseline_rows=args.baseline_rows, burst_rows=args.burst_rows,
+        warmup_seconds=args.warmup, locustfiles=args.locustfiles, locust_args=locust_args,
+        fault_workers=args.fault_workers)
+    for file_path in file_paths:
+        print(file_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,87 @@
 This script uses the Multivariate Vector Autoregression model
 from the Statsmodels package to forecast Apdex scores.
 
+The experiments are forecast in parallel worker processes, and the per-file metrics are
+appended to the RESULTS_PATH table, so they can be queried later with load_results. The
+metrics of every file are also kept in the analysis store (see analysis_store.py), so later
+runs with the same parameters only forecast new or changed files.
+Plots are only drawn when PLOT is set.
+
+Set MODE to 'walk-forward' to forecast from every 30 second step instead of only the
+last TEST_SIZE steps. In that mode the VAR normal equations are updated one observation
+at a time and the lag order is only re-selected every RESELECT_EVERY steps, and the
+predictions of every file are saved as a CSV in PREDICTIONS_DIR.
+
+Set BATCHED to fit the VARs of all experiments of the same shape together in one process with
+batched_var.py instead of one statsmodels VAR per file in worker processes.
+
 Author: dhruvshetty213@gmail.com
 """
 import os
+import time
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 from statsmodels.tsa.api import VAR
 from sklearn.metrics import r2_score, confusion_matrix
 from sklearn.preprocessing import MinMaxScaler
 
+import analysis_store
+import batched_var
+import change_points
+import dataset_cache
+import granger_kernel
+import profiling
+
 COLUMN_EXCLUSION = ['tsr', 'errors', 'cpu']  # Change 'cpu' to 'io' for I/O experiments
 FOLDER_PATH = '/path/to/datasets'
 TEST_SIZE = 6
 THRESHOLD = 0.6
+MODE = 'holdout'  # Change to 'walk-forward' for rolling-origin forecasts at every step
+MIN_TRAIN_SIZE = 30  # Fewest train steps to fit on, files or phases shorter than this plus TEST_SIZE are skipped
+RESELECT_EVERY = 10
+WINDOW = None  # Number of most recent steps to fit on in walk-forward mode, None for an expanding window
+PREDICTIONS_DIR = 'walk_forward_predictions'  # Walk-forward predictions of every file, None to not save them
+MAX_WORKERS = None  # Defaults to the number of CPUs
+BATCHED = False
+PLOT = False
+PLOT_DIR = None  # Save the plots of the parallel driver to this folder instead of showing them
+RESULTS_PATH = 'forecast_results.csv'
+STORE_PATH = analysis_store.STORE_PATH  # Metrics of files forecast in earlier runs, None to recompute every file
+PHASES = None  # E.g. ['pre-fault', 'in-fault'] to only forecast those phases of the experiments (see change_points.py)
+RESULT_COLUMNS = ['run_started', 'file', 'lag_order', 'train_r2', 'test_r2', 'true_breach', 'pred_breach', 'fit_seconds']
+
+# Logging config
+logging.basicConfig(level=logging.INFO)
+
+@profiling.profiled(file_arg='file_path')
+def read_and_preprocess(file_path, phases=None, column_exclusion=None):
+    df = change_points.load_phases(file_path, phases)
+    return df.drop(column_exclusion or COLUMN_EXCLUSION, axis=1).astype('float64')
+
+def is_forecastable(df, file_path=None):
+    """
+    Check that the experiment has at least MIN_TRAIN_SIZE train steps before its TEST_SIZE test steps,
+    and log a warning that it is skipped if not.
+    """
+    if len(df) >= MIN_TRAIN_SIZE + TEST_SIZE:
+        return True
+    source = f" {file_path}" if file_path else " the experiment"
+    logging.warning(f"Skipping the forecast of{source}: {len(df)} rows, fewer than {MIN_TRAIN_SIZE + TEST_SIZE}.")
+    return False
 
-def read_and_preprocess(file_path):
-    df = pd.read_csv(file_path, index_col=0, parse_dates=True)
-    return df.drop(COLUMN_EXCLUSION, axis=1)
+def max_lag_order(n_obs, n_vars):
+    """Largest lag order up to TEST_SIZE that a VAR with a constant can estimate from n_obs observations."""
+    return max(0, min(TEST_SIZE, (n_obs - n_vars - 1) // (1 + n_vars)))
+
+def breach_matrix(true_breach, pred_breach):
+    """Confusion matrix of the true and predicted breaches, all zeros if nothing was forecast."""
+    if len(true_breach) == 0:
+        return np.zeros((2, 2), dtype=int)
+    return confusion_matrix(true_breach, pred_breach, labels=[0, 1])
 
 def scale_data(train, test):
     scalers = {}
@@ -31,66 +96,405 @@ def scale_data(train, test):
         scalers[column] = scaler
     return train, test, scalers['apdex']
 
+@profiling.profiled()
 def fit_VAR_model(train):
     model = VAR(train)
-    results = model.fit(maxlags=TEST_SIZE, ic='aic')
+    results = model.fit(maxlags=max_lag_order(*train.shape), ic='aic')
     return results, results.k_ar
 
+@profiling.profiled()
 def forecast_VAR(results, lag_order, train):
+    if lag_order == 0:
+        # statsmodels cannot forecast a VAR(0), whose forecast is its intercept
+        return np.tile(results.params.iloc[0].to_numpy(), (TEST_SIZE, 1))
     prior = train.iloc[-lag_order:][train.columns].to_numpy()
     return results.forecast(prior, TEST_SIZE)
 
 def compute_r2(df, train_idx, test_idx, lag_order):
-    y_pred_train = df.loc[train_idx, 'Train Pred Apdex']
+    y_pred_train = df.loc[train_idx, 'Train Pred Apdex'].iloc[lag_order:]
     y_true_train = df.loc[train_idx, 'ScaledApdex'].iloc[lag_order:]
-    print("Apdex VAR Train R^2:", r2_score(y_true_train, y_pred_train))
+    train_r2 = r2_score(y_true_train, y_pred_train)
 
     y_pred_test = df.loc[test_idx, 'Test Pred Apdex']
     y_true_test = df.loc[test_idx, 'ScaledApdex']
-    print("Apdex VAR Test R^2:", r2_score(y_true_test, y_pred_test))
+    test_r2 = r2_score(y_true_test, y_pred_test)
+    return train_r2, test_r2
 
-def plot_data(df):
+@profiling.profiled()
+def plot_data(df, any_true_below_threshold, any_pred_below_threshold, file_path=None):
     plot_cols = ['ScaledApdex', 'Train Pred Apdex', 'Test Pred Apdex']
     ax = df.iloc[-100:][plot_cols].plot(figsize=(15, 5))
     ax.set_title(f"True value: {any_true_below_threshold}, Predicted value: {any_pred_below_threshold}")
+    if file_path:
+        ax.figure.savefig(file_path)
+        ax.figure.clf()
+
+class IncrementalVAR:
+    """
+    VAR(p) model with a constant whose normal equations are updated with rank-one
+    outer products as observations are added to or removed from its sample.
+    """
+
+    def __init__(self, lag_order, n_vars):
+        self.lag_order = lag_order
+        self.n_vars = n_vars
+        size = 1 + n_vars * lag_order
+        self.gram = np.zeros((size, size))
+        self.cross = np.zeros((size, n_vars))
+        self.nobs = 0
+        self._params = None
+
+    def regressors(self, values, t):
+        """Constant and lags 1 to p of every variable for observation t, ordered like statsmodels."""
+        return np.concatenate(([1.0], values[t - self.lag_order:t][::-1].ravel()))
+
+    def fit(self, values, start, stop):
+        """Reset the sample to observations start to stop - 1 of values."""
+        p = self.lag_order
+        lags = granger_kernel.lag_matrix(values[None, start - p:stop], p)[0]
+        design = np.column_stack([np.ones(stop - start), lags])
+        self.gram = design.T @ design
+        self.cross = design.T @ values[start:stop]
+        self.nobs = stop - start
+        self._params = None
+        return self
+
+    def update(self, values, t, weight=1):
+        """Add observation t of values to the sample, or remove it with weight=-1."""
+        z = self.regressors(values, t)
+        self.gram += weight * np.outer(z, z)
+        self.cross += weight * np.outer(z, values[t])
+        self.nobs += weight
+        self._params = None
+
+    @property
+    def params(self):
+        if self._params is None:
+            try:
+                self._params = np.linalg.solve(self.gram, self.cross)
+            except np.linalg.LinAlgError:
+                self._params = np.linalg.lstsq(self.gram, self.cross, rcond=None)[0]
+        return self._params
+
+    def forecast(self, prior, steps):
+        """Forecast steps ahead from the last lag_order observations in prior."""
+        history = list(prior[len(prior) - self.lag_order:])
+        forecasts = np.empty((steps, self.n_vars))
+        for h in range(steps):
+            z = np.concatenate(([1.0], np.ravel(history[::-1]))) if self.lag_order else np.ones(1)
+            forecasts[h] = z @ self.params
+            history = history[1:] + [forecasts[h]]
+        return forecasts
+
+def select_lag_order(values, start, stop):
+    """Lag order minimizing the AIC on observations start to stop - 1, as fit_VAR_model selects it."""
+    maxlags = max_lag_order(stop - start, values.shape[1])
+    if maxlags < 1:
+        return 0
+    return int(granger_kernel.select_lag_order(values[None, start:stop], maxlags)[0])
+
+@profiling.profiled()
+def walk_forward_forecast(df, window=WINDOW, reselect_every=RESELECT_EVERY, min_train_size=MIN_TRAIN_SIZE):
+    """
+    Forecast the next TEST_SIZE Apdex scores from every origin of the experiment, fitting
+    on all previous steps or on the last window steps.
+
+    Returns the walk-forward predictions indexed by the first forecast timestamp, with the
+    lag order and the true and predicted THRESHOLD breaches of every origin, and the
+    confusion matrix of the breaches.
+    """
+    values = df.to_numpy(dtype=np.float64)
+    n, n_vars = values.shape
+    apdex = df.columns.get_loc('apdex')
+
+    model = None
+    start = 0
+    rows = []
+    for step, origin in enumerate(range(min_train_size, n - TEST_SIZE + 1)):
+        new_start = 0 if window is None else max(0, origin - window)
+        if model is not None:
+            # Slide the sample forward by one observation instead of refitting
+            model.update(values, origin - 1)
+            if new_start > start:
+                model.update(values, start + model.lag_order, weight=-1)
+        start = new_start
+
+        if model is None or step % reselect_every == 0:
+            lag_order = select_lag_order(values, start, origin)
+            if model is None or lag_order != model.lag_order:
+                model = IncrementalVAR(lag_order, n_vars).fit(values, start + lag_order, origin)
+
+        y_pred = model.forecast(values[:origin], TEST_SIZE)[:, apdex]
+        y_true = values[origin:origin + TEST_SIZE, apdex]
+        rows.append([model.lag_order, *y_pred, int((y_true < THRESHOLD).any()), int((y_pred < THRESHOLD).any())])
+
+    columns = ['Lag Order'] + [f'Pred Apdex t+{h + 1}' for h in range(TEST_SIZE)] + ['True Breach', 'Pred Breach']
+    predictions = pd.DataFrame(rows, index=df.index[min_train_size:n - TEST_SIZE + 1], columns=columns)
+    matrix = breach_matrix(predictions['True Breach'], predictions['Pred Breach'])
+    return predictions, matrix
+
+def walk_forward_main(file_paths=None, phases=PHASES, column_exclusion=None, predictions_dir=PREDICTIONS_DIR):
+    """
+    Forecast every experiment from every origin, save the predictions of each file as a CSV named
+    after it in predictions_dir, if set, and print the confusion matrices of the breaches.
+
+    Returns:
+        dict: The walk-forward predictions of every file that is not too short to forecast, by file path.
+    """
+    file_paths = file_paths or dataset_cache.list_experiment_files(FOLDER_PATH)
+    aggregated_matrix = np.zeros((2, 2), dtype=int)
+    if predictions_dir:
+        os.makedirs(predictions_dir, exist_ok=True)
+
+    all_predictions = {}
+    for file_path in file_paths:
+        df = read_and_preprocess(file_path, phases, column_exclusion)
+        if not is_forecastable(df, file_path):
+            continue
+        predictions, matrix = walk_forward_forecast(df)
+        if predictions_dir:
+            predictions.to_csv(os.path.join(predictions_dir, os.path.basename(file_path)))
+        all_predictions[file_path] = predictions
+        print(file_path)
+        print(matrix)
+        aggregated_matrix += matrix
+
+    print(aggregated_matrix)
+    return all_predictions
+
+def prepare_experiment(file_path, phases=None, column_exclusion=None):
+    """
+    Read an experiment and split it into the scaled train and the last TEST_SIZE test steps.
+
+    Returns:
+        tuple: The experiment with its 'ScaledApdex', the scaled train and test sets, the train and
+               test row masks and the Apdex scaler, or None if the experiment is too short to forecast.
+    """
+    df = read_and_preprocess(file_path, phases, column_exclusion)
+    if not is_forecastable(df, file_path):
+        return None
+
+    train = df.iloc[:-TEST_SIZE].copy()
+    test = df.iloc[-TEST_SIZE:].copy()
+    train, test, scaler = scale_data(train, test)
+    df['ScaledApdex'] = pd.concat([train['apdex'], test['apdex']])
+
+    train_idx = df.index <= train.index[-1]
+    test_idx = df.index > train.index[-1]
+    return df, train, test, train_idx, test_idx, scaler
+
+def score_experiment(file_path, df, train_idx, test_idx, scaler, lag_order, fitted_apdex, forecast_apdex, fit_seconds,
+                     plot=False, plot_dir=None):
+    """
+    Score the fitted and forecast Apdex of an experiment and return its metrics as a dict with the
+    RESULT_COLUMNS other than 'run_started'.
+    """
+    df.loc[train_idx, 'Train Pred Apdex'] = fitted_apdex
+    df.loc[test_idx, 'Test Pred Apdex'] = forecast_apdex
+
+    train_r2, test_r2 = compute_r2(df, train_idx, test_idx, lag_order)
+
+    y_pred_test = df.loc[test_idx, 'Test Pred Apdex']
+    y_true_test = df.loc[test_idx, 'ScaledApdex']
+
+    y_pred_original = scaler.inverse_transform(y_pred_test.values.reshape(-1, 1))
+    y_true_original = scaler.inverse_transform(y_true_test.values.reshape(-1, 1))
+
+    any_true_below_threshold = int((y_true_original < THRESHOLD).any())
+    any_pred_below_threshold = int((y_pred_original < THRESHOLD).any())
+
+    if plot:
+        plot_path = None
+        if plot_dir:
+            plot_path = os.path.join(plot_dir, os.path.splitext(os.path.basename(file_path))[0] + '.png')
+        plot_data(df, any_true_below_threshold, any_pred_below_threshold, plot_path)
+
+    return {
+        'file': file_path,
+        'lag_order': lag_order,
+        'train_r2': train_r2,
+        'test_r2': test_r2,
+        'true_breach': any_true_below_threshold,
+        'pred_breach': any_pred_below_threshold,
+        'fit_seconds': fit_seconds,
+    }
+
+@profiling.profiled(file_arg='file_path')
+def forecast_experiment(file_path, plot=False, plot_dir=None, phases=None, column_exclusion=None):
+    """
+    Fit the VAR on all but the last TEST_SIZE steps of an experiment, forecast those steps and
+    return the metrics of the file as a dict with the RESULT_COLUMNS other than 'run_started',
+    or None if the experiment is too short to forecast.
+    """
+    prepared = prepare_experiment(file_path, phases, column_exclusion)
+    if prepared is None:
+        return None
+    df, train, test, train_idx, test_idx, scaler = prepared
+
+    fit_started = time.perf_counter()
+    results, lag_order = fit_VAR_model(train)
+    fit_seconds = time.perf_counter() - fit_started
+    forecast = forecast_VAR(results, lag_order, train)
+
+    # The fitted values start after the first lag_order train steps and are aligned by index
+    fitted_apdex = results.fittedvalues['apdex'].reindex(train.index)
+    return score_experiment(file_path, df, train_idx, test_idx, scaler, lag_order, fitted_apdex.to_numpy(),
+                            forecast[:, train.columns.get_loc('apdex')], fit_seconds, plot, plot_dir)
+
+@profiling.profiled()
+def forecast_experiments_batched(file_paths, plot=False, plot_dir=None, phases=None, column_exclusion=None):
+    """
+    Forecast the experiments like forecast_experiment, but fit the VARs of all experiments whose
+    train sets have the same shape together with batched_var.BatchedVAR in this process. The
+    fit_seconds of a file is its share of the fitting time of its batch.
+
+    Returns:
+        list: The metrics of every file that is not too short to forecast, in the order of file_paths.
+    """
+    prepared = [prepare_experiment(file_path, phases, column_exclusion) for file_path in file_paths]
+    batches = {}
+    for position, experiment in enumerate(prepared):
+        if experiment is not None:
+            batches.setdefault(experiment[1].shape, []).append(position)
+
+    rows = [None] * len(file_paths)
+    for (n_obs, neqs), positions in batches.items():
+        fit_started = time.perf_counter()
+        with profiling.stage('BatchedVAR.fit'):
+            results = batched_var.BatchedVAR(len(positions), n_obs, neqs, max_lag_order(n_obs, neqs)).fit(
+                np.stack([prepared[position][1].to_numpy() for position in positions]))
+            forecasts = results.forecast(TEST_SIZE)
+        fit_seconds = (time.perf_counter() - fit_started) / len(positions)
+
+        for batch_index, position in enumerate(positions):
+            df, train, _, train_idx, test_idx, scaler = prepared[position]
+            apdex = train.columns.get_loc('apdex')
+            rows[position] = score_experiment(
+                file_paths[position], df, train_idx, test_idx, scaler, int(results.k_ar[batch_index]),
+                results.fittedvalues[batch_index, :, apdex], forecasts[batch_index, :, apdex], fit_seconds,
+                plot, plot_dir)
+    return [row for row in rows if row is not None]
+
+def append_results(rows, results_path=RESULTS_PATH):
+    """
+    Append result rows to the results table, writing the header if the table is new.
+    """
+    pd.DataFrame(rows, columns=RESULT_COLUMNS).to_csv(
+        results_path, mode='a', index=False, header=not os.path.exists(results_path))
+
+def load_results(results_path=RESULTS_PATH, latest_run_only=False):
+    """
+    Load the results table, optionally only the rows of the most recent run.
+    """
+    results = pd.read_csv(results_path)
+    if latest_run_only:
+        results = results[results['run_started'] == results['run_started'].max()]
+    return results
+
+def forecast_params(phases=None, column_exclusion=None):
+    """
+    Returns the parameters the metrics of a file depend on, fingerprinted by the analysis store.
+    """
+    return {'test_size': TEST_SIZE, 'threshold': THRESHOLD, 'phases': phases,
+            'column_exclusion': sorted(column_exclusion or COLUMN_EXCLUSION)}
+
+def stored_rows(store, key, file_paths):
+    """
+    Returns the stored metrics of the unchanged files, as a dict from file path to row.
+    """
+    hashes = {file_path: dataset_cache.content_hash(file_path) for file_path in file_paths}
+    stored = store.get('forecast', key, hashes.values())
+    return {file_path: {**stored[(file_hash, '')], 'file': file_path}
+            for file_path, file_hash in hashes.items() if (file_hash, '') in stored}
+
+def store_rows(store, key, rows):
+    store.put('forecast', key, [(dataset_cache.content_hash(row['file']), '',
+                                 {column: row[column] for column in RESULT_COLUMNS if column != 'run_started'})
+                                for row in rows])
+
+@profiling.profiled()
+def run_forecasts(file_paths, max_workers=MAX_WORKERS, results_path=RESULTS_PATH, plot=PLOT, plot_dir=PLOT_DIR,
+                  phases=PHASES, column_exclusion=None, run_started=None, store=None, store_key=None):
+    """
+    Forecast the experiments in worker processes and append each file's metrics to the results
+    table, and to the analysis store if one is given, as soon as it finishes. Files too short to forecast
+    are skipped. The phases and column exclusion are handed to the workers, which do not see changes made
+    to the module constants at run time.
+
+    Returns:
+        tuple: The metrics of every file as a DataFrame and the confusion matrix of the breaches.
+    """
+    run_started = run_started or datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [profiling.submit(executor, forecast_experiment, file_path, plot, plot_dir, phases, column_exclusion)
+                   for file_path in file_paths]
+        for future in futures:
+            metrics = profiling.result(future)
+            if metrics is None:
+                continue
+            row = {'run_started': run_started, **metrics}
+            if results_path:
+                append_results([row], results_path)
+            if store:
+                store_rows(store, store_key, [row])
+            rows.append(row)
+
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    matrix = breach_matrix(results['true_breach'], results['pred_breach'])
+    return results, matrix
+
+def main(file_paths=None, max_workers=MAX_WORKERS, results_path=RESULTS_PATH, plot=PLOT, plot_dir=PLOT_DIR,
+         phases=PHASES, column_exclusion=None, batched=BATCHED, store_path=STORE_PATH):
+    file_paths = file_paths or dataset_cache.list_experiment_files(FOLDER_PATH)
+    run_started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    store = analysis_store.AnalysisStore(store_path) if store_path else None
+    try:
+        key = store.register('forecast', forecast_params(phases, column_exclusion)) if store else None
+        # Plots are only drawn for the files that are forecast, so plotting runs forecast every file
+        stored = stored_rows(store, key, file_paths) if store and not plot else {}
+        pending = [file_path for file_path in file_paths if file_path not in stored]
+
+        rows = [{'run_started': run_started, **row} for row in stored.values()]
+        if results_path and rows:
+            append_results(rows, results_path)
+
+        in_process = batched or (plot and plot_dir is None)
+        if batched:
+            computed = [{'run_started': run_started, **row}
+                        for row in forecast_experiments_batched(pending, plot, plot_dir, phases, column_exclusion)]
+        elif plot and plot_dir is None:
+            # Plots are shown interactively, which only works in this process
+            metrics = [forecast_experiment(file_path, True, None, phases, column_exclusion) for file_path in pending]
+            computed = [{'run_started': run_started, **row} for row in metrics if row is not None]
+        else:
+            # The workers' rows are appended and stored by run_forecasts as soon as each file finishes
+            computed = run_forecasts(pending, max_workers, results_path, plot, plot_dir, phases, column_exclusion,
+                                     run_started, store, key)[0].to_dict('records') if pending else []
+        if in_process and computed:
+            if results_path:
+                append_results(computed, results_path)
+            if store:
+                store_rows(store, key, computed)
+    finally:
+        if store:
+            store.close()
+
+    rows_by_file = {row['file']: row for row in rows + computed}
+    results = pd.DataFrame([rows_by_file[file_path] for file_path in file_paths if file_path in rows_by_file],
+                           columns=RESULT_COLUMNS)
+    matrix = breach_matrix(results['true_breach'], results['pred_breach'])
+
+    for row in results.itertuples():
+        print(row.file)
+        print("Apdex VAR Train R^2:", row.train_r2)
+        print("Apdex VAR Test R^2:", row.test_r2)
 
-def main():
-    file_paths = [os.path.join(FOLDER_PATH, f) for f in os.listdir(FOLDER_PATH)]
-    aggregated_y_pred = []
-    aggregated_y_true = []
-
-    for count, file_path in enumerate(file_paths):
-        df = read_and_preprocess(file_path)
-        
-        train = df.iloc[:-TEST_SIZE].copy()
-        test = df.iloc[-TEST_SIZE:].copy()
-        train, test, scaler = scale_data(train, test)
-        
-        train_idx = df.index <= train.index[-1]
-        test_idx = df.index > train.index[-1]
-        results, lag_order = fit_VAR_model(train)
-        forecast = forecast_VAR(results, lag_order, train)
-        
-        df.loc[train_idx, 'Train Pred Apdex'] = results.fittedvalues['apdex']
-        df.loc[test_idx, 'Test Pred Apdex'] = forecast[:,6]
-        
-        compute_r2(df, train_idx, test_idx, lag_order)
-        
-        y_pred_test = df.loc[test_idx, 'Test Pred Apdex']
-        y_true_test = df.loc[test_idx, 'ScaledApdex']
-        
-        y_pred_original = scaler.inverse_transform(y_pred_test.values.reshape(-1, 1))
-        y_true_original = scaler.inverse_transform(y_true_test.values.reshape(-1, 1))
-        
-        any_true_below_threshold = int((y_true_original < THRESHOLD).any())
-        any_pred_below_threshold = int((y_pred_original < THRESHOLD).any())
-
-        plot_data(df)
-        aggregated_y_true.append(any_true_below_threshold)
-        aggregated_y_pred.append(any_pred_below_threshold)
-
-    matrix = confusion_matrix(aggregated_y_true, aggregated_y_pred)
     print(matrix)
 
 if __name__ == "__main__":
-    main()
+    if MODE == 'walk-forward':
+        walk_forward_main()
+    else:
+        main()
@@ -5,26 +5,78 @@
 This is a general example script that shows querying the
 Golden signals and Apdex score from the New Relic APM endpoint.
 
+Besides the blocking helpers, `AsyncMetricsCollector` exports whole experiment windows:
+the NRQL queries of all signals are batched into aliased GraphQL requests, long windows
+are split into chunks of at most MAX_BUCKETS buckets, requests run concurrently over one
+pooled HTTP client, and the results are merged into the dataset CSV schema. Point
+NEW_RELIC_ENDPOINT at the local stand-in of metrics_backend.py to run it offline.
+
+Exports are incremental: query results are cached on disk per (account, NRQL, sample rate,
+time bucket) as soon as they arrive, so only missing buckets are fetched and an interrupted
+export resumes where it stopped. Rows of an already exported window are appended to its
+dataset file, which is then renamed to its new end time.
+
 Author: dhruvshetty213@gmail.com
 """
 
 import requests
 import json
 import os
+import re
+import glob
+import time
+import sqlite3
+import asyncio
+import argparse
 import pandas as pd
 from datetime import datetime, timezone, timedelta
 
+import profiling
+
 # Constants
-ENDPOINT = "https://api.eu.newrelic.com/graphql"
+ENDPOINT = os.environ.get('NEW_RELIC_ENDPOINT', "https://api.eu.newrelic.com/graphql")
 HEADERS = {'API-Key': os.environ.get('NEW_RELIC_API_KEY')}
 ACCOUNT_ID = os.environ.get('ACCOUNT_ID')
 APP_NAME = os.environ.get('APP_NAME')
+OTHER_APP_NAME = os.environ.get('OTHER_APP_NAME')
+
+MAX_CONCURRENCY = 8
+QUERIES_PER_REQUEST = 10
+MAX_BUCKETS = 366  # Largest number of TIMESERIES buckets New Relic returns per query
+MAX_RETRIES = 3
+CACHE_PATH = '.nrql_cache.sqlite'
+CACHE_BUCKET_SECONDS = 3600
+SETTLE_SECONDS = 300  # Buckets this close to now may still receive data and are not cached
+
+# Signals of the dataset schema: (column, event type, NRQL select, result key, WHERE clause).
+# The _x and _y columns are the infrastructure metrics of the hosts of the two services of the experiment.
+def build_signals(app_name, other_app_name):
+    """
+    Returns the signals of the dataset schema for the given names of the two services of the experiment.
+    """
+    web_transactions = f"appName = '{app_name}' AND transactionType = 'Web'"
+    return [
+        ('errors', 'Transaction', "percentage(count(*), where error is true)", 'percentage', web_transactions),
+        ('latency', 'Transaction', "average(duration)", 'average.duration', web_transactions),
+        ('traffic', 'Transaction', "count(*)", 'count', web_transactions),
+        ('average.cpuPercent_x', 'SystemSample', "average(cpuPercent)", 'average.cpuPercent', f"apmApplicationNames LIKE '%|{app_name}|%'"),
+        ('average.cpuPercent_y', 'SystemSample', "average(cpuPercent)", 'average.cpuPercent', f"apmApplicationNames LIKE '%|{other_app_name}|%'"),
+        ('average.memoryUsedPercent_x', 'SystemSample', "average(memoryUsedPercent)", 'average.memoryUsedPercent', f"apmApplicationNames LIKE '%|{app_name}|%'"),
+        ('average.memoryUsedPercent_y', 'SystemSample', "average(memoryUsedPercent)", 'average.memoryUsedPercent', f"apmApplicationNames LIKE '%|{other_app_name}|%'"),
+        ('tsr', 'Transaction', "percentage(count(*), where error is false)", 'percentage', web_transactions),
+        ('apdex', 'Transaction', "apdex(duration, t: 0.5)", 'score', web_transactions),
+    ]
+
+SIGNALS = build_signals(APP_NAME, OTHER_APP_NAME)
+
+SESSION = requests.Session()
 
+@profiling.profiled()
 def execute_query(query):
     """
     Execute the given NRQL query and return results.
     """
-    response = requests.post(ENDPOINT, headers=HEADERS, json={"query": query})
+    response = SESSION.post(ENDPOINT, headers=HEADERS, json={"query": query})
     response.raise_for_status()  # This will raise an HTTPError if the HTTP request returned an error status code
     data = json.loads(response.content)
     return data['data']['actor']['account']['nrql']['results']
@@ -39,6 +91,12 @@ def create_dataframe_from_query(query, column_to_rename, new_column_name):
     df = df.rename(columns={column_to_rename: new_column_name})
     return df
 
+def get_nrql(metric, start, end, sample_rate, where, event_type="Transaction"):
+    """
+    Get the NRQL timeseries query for the given metric and WHERE clause.
+    """
+    return f"FROM {event_type} SELECT {metric} WHERE {where} SINCE {start} UNTIL {end} TIMESERIES {sample_rate}"
+
 def get_timeseries_query(metric, start, end, sample_rate, additional_conditions=""):
     """
     Get a timeseries query for the given metric and conditions.
@@ -56,5 +114,381 @@ def get_timeseries_query(metric, start, end, sample_rate, additional_conditions=
     """
 
 # Example query for errors percentage from New Relic APM:
-errors_query = get_timeseries_query("percentage(count(*), where error is true)", start, end, sample_rate, "AND transactionType = 'Web'")
-df_errors = create_dataframe_from_query(errors_query, 'percentage', 'errors')
+# errors_query = get_timeseries_query("percentage(count(*), where error is true)", start, end, sample_rate, "AND transactionType = 'Web'")
+# df_errors = create_dataframe_from_query(errors_query, 'percentage', 'errors')
+
+def get_batched_query(nrql_queries, account_id=ACCOUNT_ID):
+    """
+    Get a single GraphQL query running all the given NRQL queries, aliased as q0, q1, ...
+    """
+    fields = "\n".join(f"q{i}: nrql(query: {json.dumps(nrql)}) {{ results }}" for i, nrql in enumerate(nrql_queries))
+    return f"{{ actor {{ account(id: {account_id}) {{ {fields} }} }} }}"
+
+def parse_sample_rate(sample_rate):
+    """
+    Returns the length in seconds of a TIMESERIES sample rate such as '30 second' or '1 minute'.
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*(second|minute|hour|day)s?\s*", sample_rate)
+    if not match:
+        raise ValueError(f"Unsupported sample rate '{sample_rate}'.")
+    unit_seconds = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+    return int(match.group(1)) * unit_seconds[match.group(2)]
+
+def split_window(start, end, sample_rate, max_buckets=MAX_BUCKETS):
+    """
+    Split the window [start, end) into chunks of at most max_buckets buckets, aligned to the sample rate.
+    """
+    chunk = timedelta(seconds=parse_sample_rate(sample_rate) * max_buckets)
+    chunks = []
+    while start < end:
+        chunks.append((start, min(start + chunk, end)))
+        start += chunk
+    return chunks
+
+def to_epoch_millis(moment):
+    return int(moment.timestamp() * 1000)
+
+def format_timestamp(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def dataset_file_name(experiment, start, end, sample_rate):
+    """
+    Returns the dataset file name of an experiment window, e.g. cpu_chaos_<start>_<end>_30 second.csv
+    """
+    return f"{experiment}_chaos_{format_timestamp(start)}_{format_timestamp(end)}_{sample_rate}.csv"
+
+def merge_signal_results(signal_results, chaos_column=None, chaos_windows=(), signals=SIGNALS):
+    """
+    Merge the results of every signal into one dataframe in the dataset CSV schema.
+
+    Parameters:
+        signal_results (dict): The TIMESERIES results of each dataset column.
+        chaos_column (str): The chaos marker column ('cpu' or 'io') to add, if any.
+        chaos_windows (list): The (start, end) datetimes during which chaos was injected.
+        signals (list): The signal definitions the results were queried with.
+
+    Returns:
+        DataFrame: The signals indexed by 'timestamp', in the column order of SIGNALS.
+    """
+    columns = {}
+    for column, _, _, result_key, _ in signals:
+        if column not in signal_results:
+            continue
+        results = signal_results[column]
+        series = pd.Series(
+            [result.get(result_key) for result in results],
+            index=[result['beginTimeSeconds'] for result in results],
+            dtype='float64',
+        )
+        columns[column] = series[~series.index.duplicated(keep='last')]
+
+    df = pd.DataFrame(columns).sort_index()
+    timestamps = pd.to_datetime(df.index, unit='s', utc=True)
+
+    if chaos_column:
+        marker = pd.Series(0.0, index=df.index)
+        for chaos_start, chaos_end in chaos_windows:
+            marker[(timestamps >= chaos_start) & (timestamps < chaos_end)] = 1.0
+        df[chaos_column] = marker
+
+    df.index = timestamps.strftime('%Y-%m-%dT%H:%M:%SZ')
+    df.index.name = 'timestamp'
+    return df
+
+def signal_query_key(event_type, metric, where):
+    """
+    Returns the cache key of a signal: its NRQL without the time range, which includes the app name.
+    """
+    return f"FROM {event_type} SELECT {metric} WHERE {where}"
+
+def cache_bucket_seconds(sample_rate, max_buckets=MAX_BUCKETS):
+    """
+    Returns the length of the cache buckets of a sample rate: a multiple of the sample rate close to
+    CACHE_BUCKET_SECONDS that a single query can return.
+    """
+    sample_seconds = parse_sample_rate(sample_rate)
+    return sample_seconds * min(max(1, CACHE_BUCKET_SECONDS // sample_seconds), max_buckets)
+
+class QueryResultCache:
+    """
+    On-disk cache of TIMESERIES query results keyed by (account id, NRQL without time range,
+    sample rate, bucket start in epoch seconds). Every put is committed immediately.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_results (account TEXT, query TEXT, sample_rate TEXT, bucket INTEGER, "
+                "results TEXT, PRIMARY KEY (account, query, sample_rate, bucket))"
+            )
+
+    def get(self, account_id, query, sample_rate, buckets):
+        """Returns the cached results of the given buckets, as a dict from bucket to results."""
+        rows = self.connection.execute(
+            "SELECT bucket, results FROM query_results "
+            "WHERE account = ? AND query = ? AND sample_rate = ? AND bucket BETWEEN ? AND ?",
+            (str(account_id), query, sample_rate, min(buckets), max(buckets)),
+        )
+        return {bucket: json.loads(results) for bucket, results in rows}
+
+    def put(self, entries):
+        """Store (account_id, query, sample_rate, bucket, results) entries."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO query_results VALUES (?, ?, ?, ?, ?)",
+                [(str(account_id), query, sample_rate, bucket, json.dumps(results))
+                 for account_id, query, sample_rate, bucket, results in entries],
+            )
+
+    def close(self):
+        self.connection.close()
+
+class AsyncMetricsCollector:
+    """
+    Collects the signals of experiment windows with batched GraphQL requests over a pooled
+    aiohttp client, running at most max_concurrency requests at a time.
+
+    With a QueryResultCache, windows are fetched in aligned cache buckets and only the buckets
+    missing from the cache are queried.
+
+    Use as an async context manager:
+
+        async with AsyncMetricsCollector() as collector:
+            df = await collector.fetch_window(start, end, '30 second')
+    """
+
+    def __init__(self, endpoint=ENDPOINT, headers=HEADERS, account_id=ACCOUNT_ID, max_concurrency=MAX_CONCURRENCY,
+                 queries_per_request=QUERIES_PER_REQUEST, max_buckets=MAX_BUCKETS, signals=SIGNALS, cache=None):
+        self.endpoint = endpoint
+        self.headers = {k: v for k, v in headers.items() if v is not None}
+        self.account_id = account_id
+        self.max_concurrency = max_concurrency
+        self.queries_per_request = queries_per_request
+        self.max_buckets = max_buckets
+        self.signals = signals
+        self.cache = cache
+        self.requests_made = 0
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        import aiohttp
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    @profiling.profiled()
+    async def execute_batch(self, nrql_queries):
+        """
+        Run the NRQL queries in a single GraphQL request and return their results in order.
+        Rate limited and server errors are retried with exponential backoff.
+        """
+        import aiohttp
+        query = get_batched_query(nrql_queries, self.account_id)
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self._semaphore:
+                    self.requests_made += 1
+                    async with self._session.post(self.endpoint, json={"query": query}) as response:
+                        response.raise_for_status()
+                        data = await response.json(content_type=None)
+                break
+            except aiohttp.ClientResponseError as e:
+                if attempt == MAX_RETRIES or (e.status != 429 and e.status < 500):
+                    raise
+            except aiohttp.ClientConnectionError:
+                if attempt == MAX_RETRIES:
+                    raise
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+        if data.get('errors'):
+            raise RuntimeError(f"GraphQL errors: {[error.get('message') for error in data['errors']]}")
+        account = data['data']['actor']['account']
+        return [account[f"q{i}"]['results'] for i in range(len(nrql_queries))]
+
+    @profiling.profiled()
+    async def fetch_window(self, start, end, sample_rate, chaos_column=None, chaos_windows=()):
+        """
+        Fetch every signal over [start, end) and return them in the dataset CSV schema.
+        """
+        if self.cache is not None:
+            return await self.fetch_window_cached(start, end, sample_rate, chaos_column, chaos_windows)
+
+        chunks = split_window(start, end, sample_rate, self.max_buckets)
+        queries = [
+            (column, get_nrql(metric, to_epoch_millis(chunk_start), to_epoch_millis(chunk_end), sample_rate,
+                              where, event_type))
+            for chunk_start, chunk_end in chunks
+            for column, event_type, metric, _, where in self.signals
+        ]
+        batches = [queries[i:i + self.queries_per_request] for i in range(0, len(queries), self.queries_per_request)]
+        batch_results = await asyncio.gather(*(self.execute_batch([nrql for _, nrql in batch]) for batch in batches))
+
+        signal_results = {}
+        for batch, results in zip(batches, batch_results):
+            for (column, _), result in zip(batch, results):
+                signal_results.setdefault(column, []).extend(result)
+        return merge_signal_results(signal_results, chaos_column, chaos_windows, self.signals)
+
+    async def fetch_window_cached(self, start, end, sample_rate, chaos_column=None, chaos_windows=()):
+        """
+        Fetch every signal over [start, end) bucket by bucket, reusing the cached buckets and
+        caching each fetched batch of settled buckets as soon as it arrives.
+        """
+        bucket_seconds = cache_bucket_seconds(sample_rate, self.max_buckets)
+        first_bucket = int(start.timestamp()) // bucket_seconds * bucket_seconds
+        buckets = list(range(first_bucket, int(end.timestamp()), bucket_seconds))
+        settled_until = time.time() - SETTLE_SECONDS
+
+        signal_buckets = {}
+        queries = []
+        for column, event_type, metric, _, where in self.signals:
+            key = signal_query_key(event_type, metric, where)
+            signal_buckets[column] = self.cache.get(self.account_id, key, sample_rate, buckets)
+            for bucket in buckets:
+                if bucket not in signal_buckets[column]:
+                    nrql = get_nrql(metric, bucket * 1000, (bucket + bucket_seconds) * 1000, sample_rate, where, event_type)
+                    queries.append((column, key, bucket, nrql))
+
+        async def fetch_and_store(batch):
+            results = await self.execute_batch([nrql for _, _, _, nrql in batch])
+            self.cache.put([
+                (self.account_id, key, sample_rate, bucket, result)
+                for (_, key, bucket, _), result in zip(batch, results)
+                if bucket + bucket_seconds <= settled_until
+            ])
+            for (column, _, bucket, _), result in zip(batch, results):
+                signal_buckets[column][bucket] = result
+
+        batches = [queries[i:i + self.queries_per_request] for i in range(0, len(queries), self.queries_per_request)]
+        await asyncio.gather(*(fetch_and_store(batch) for batch in batches))
+
+        window = range(int(start.timestamp()), int(end.timestamp()))
+        signal_results = {
+            column: [result for bucket in buckets for result in results[bucket] if result['beginTimeSeconds'] in window]
+            for column, results in signal_buckets.items()
+        }
+        return merge_signal_results(signal_results, chaos_column, chaos_windows, self.signals)
+
+    async def fetch_windows(self, windows, sample_rate, chaos_column=None):
+        """
+        Fetch several (start, end, chaos_windows) experiment windows concurrently.
+        """
+        return await asyncio.gather(*(
+            self.fetch_window(start, end, sample_rate, chaos_column, chaos_windows)
+            for start, end, chaos_windows in windows
+        ))
+
+def find_dataset(folder_path, experiment, start, sample_rate):
+    """
+    Returns the path of an already exported dataset of the experiment window starting at start,
+    the one with the latest end time if there are several, or None.
+    """
+    pattern = os.path.join(glob.escape(folder_path), f"{experiment}_chaos_{format_timestamp(start)}_*_{sample_rate}.csv")
+    file_paths = sorted(glob.glob(pattern))
+    return file_paths[-1] if file_paths else None
+
+def truncate_to_last_complete_row(file_path):
+    """
+    Truncates a partial last line left behind by an interrupted append from a dataset file, and
+    returns the timestamp of its last complete row, or None if it has no rows.
+    """
+    with open(file_path, 'rb+') as f:
+        content = f.read()
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) != len(content):
+            f.truncate(len(complete))
+    lines = complete.splitlines()
+    if len(lines) < 2:
+        return None
+    return parse_time(lines[-1].split(b',', 1)[0].decode())
+
+def append_rows(file_path, df):
+    """
+    Append the rows of the dataframe to a dataset file in a single write.
+    """
+    with open(file_path, 'a') as f:
+        f.write(df.to_csv(header=False))
+        f.flush()
+        os.fsync(f.fileno())
+
+@profiling.profiled()
+async def export_windows(windows, folder_path, sample_rate, experiment, cache_path=CACHE_PATH, **collector_options):
+    """
+    Export experiment windows as dataset CSV files into the given folder. Windows that were
+    exported before only fetch and append the rows after the last exported one.
+
+    Parameters:
+        windows (list): The (start, end, chaos_windows) of each experiment.
+        folder_path (str): The folder to write the datasets to.
+        sample_rate (str): The TIMESERIES sample rate, e.g. '30 second'.
+        experiment (str): The chaos marker column and file name prefix, 'cpu' or 'io'.
+        cache_path (str): The location of the query result cache, or None to disable it.
+
+    Returns:
+        list: The paths of the written files.
+    """
+    step = timedelta(seconds=parse_sample_rate(sample_rate))
+    plans = []
+    for start, end, chaos_windows in windows:
+        existing = find_dataset(folder_path, experiment, start, sample_rate)
+        last = truncate_to_last_complete_row(existing) if existing else None
+        plans.append((existing, start if last is None else last + step))
+
+    cache = QueryResultCache(cache_path) if cache_path else None
+    try:
+        async with AsyncMetricsCollector(cache=cache, **collector_options) as collector:
+            frames = await asyncio.gather(*(
+                collector.fetch_window(fetch_start, end, sample_rate, experiment, chaos_windows)
+                for (start, end, chaos_windows), (_, fetch_start) in zip(windows, plans)
+                if fetch_start < end
+            ))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    frames = iter(frames)
+    file_paths = []
+    for (start, end, _), (existing, fetch_start) in zip(windows, plans):
+        if existing is not None and fetch_start >= end:
+            file_paths.append(existing)
+            continue
+        file_path = os.path.join(folder_path, dataset_file_name(experiment, start, end, sample_rate))
+        if fetch_start < end:
+            df = next(frames)
+            if existing is None:
+                df.to_csv(file_path)
+            else:
+                append_rows(existing, df)
+        if existing is not None and existing != file_path:
+            os.replace(existing, file_path)
+        file_paths.append(file_path)
+    return file_paths
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(timezone.utc)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export experiment windows from New Relic as dataset CSV files.")
+    parser.add_argument('windows', nargs='+', metavar='START/END[/CHAOS_START/CHAOS_END]',
+                        help="ISO 8601 bounds of an experiment window and optionally of its chaos injection")
+    parser.add_argument('--experiment', choices=['cpu', 'io'], default='cpu')
+    parser.add_argument('--sample-rate', default='30 second')
+    parser.add_argument('--output', default='.')
+    args = parser.parse_args(argv)
+
+    windows = []
+    for window in args.windows:
+        bounds = [parse_time(value) for value in window.split('/')]
+        windows.append((bounds[0], bounds[1], [tuple(bounds[2:4])] if len(bounds) == 4 else []))
+
+    for file_path in asyncio.run(export_windows(windows, args.output, args.sample_rate, args.experiment)):
+        print(file_path)
+
+if __name__ == "__main__":
+    main()
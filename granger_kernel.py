@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module contains a NumPy kernel for the VAR lag order selection and the Granger Causality
+SSR F-tests used in causality.py. It replaces the repeated statsmodels `VAR` fits and the
+restricted/unrestricted OLS refits of `grangercausalitytests` with a few batched QR factorizations.
+
+All functions work on stacked arrays of shape (pairs, observations, variables), so every column
+pair of an experiment file is processed at once. The results match `VAR.fit(maxlags, ic='aic')`
+and the 'ssr_ftest' of `grangercausalitytests` up to floating point round-off.
+
+The lag order selection and the joint VAR tests also have `*_from_cross_products` variants, which only
+need the cross-product matrix of the lagged design, such as the one streaming.py accumulates over
+chunks of an experiment too long to hold in memory.
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import numpy as np
+from scipy import stats
+
+
+def lag_matrix(data, maxlag):
+    """
+    Build the lagged design matrix of the given series.
+
+    Parameters:
+        data (ndarray): Array of shape (pairs, observations, variables).
+        maxlag (int): The number of lags to include.
+
+    Returns:
+        ndarray: Array of shape (pairs, observations - maxlag, variables * maxlag). The columns are ordered
+                 as lag 1 of every variable, then lag 2 of every variable and so on, like statsmodels does.
+                 With maxlag 0 the block has no columns, leaving a design of the constant only.
+    """
+    pairs, n, _ = data.shape
+    lags = [data[:, maxlag - lag:n - lag, :] for lag in range(1, maxlag + 1)]
+    return np.concatenate(lags, axis=2) if lags else np.empty((pairs, n, 0))
+
+
+def aic_by_lag_order(data, maxlags):
+    """
+    Compute the VAR Akaike information criterion of every lag order from 0 to maxlags.
+
+    Like statsmodels' `VAR.select_order`, every lag order is estimated on the same sample (the first
+    maxlags observations are dropped). As the design matrices of the lag orders are nested, a single
+    QR factorization of [constant, lags, responses] yields the residual cross-products of all of them.
+
+    Parameters:
+        data (ndarray): Array of shape (pairs, observations, variables).
+        maxlags (int): The largest lag order to consider.
+
+    Returns:
+        ndarray: Array of shape (pairs, maxlags + 1) with the AIC of each lag order.
+    """
+    pairs, n, neqs = data.shape
+    max_estimable = (n - neqs - 1) // (1 + neqs)
+    if maxlags > max_estimable:
+        raise ValueError(
+            "maxlags is too large for the number of observations and "
+            "the number of equations. The largest model cannot be "
+            "estimated."
+        )
+
+    nobs = n - maxlags
+    design = np.concatenate(
+        [np.ones((pairs, nobs, 1)), lag_matrix(data, maxlags), data[:, maxlags:, :]], axis=2)
+    return _aic_from_r(np.linalg.qr(design, mode='r'), nobs, neqs, maxlags)
+
+
+def aic_from_cross_products(gram, nobs, neqs, maxlags):
+    """
+    Compute the VAR AIC of every lag order from 0 to maxlags from the cross-product matrix of
+    [constant, lags, responses] on the common sample, as `aic_by_lag_order` does from the data.
+    Its Cholesky factor takes the place of the R factor of the QR factorization.
+
+    Parameters:
+        gram (ndarray): Square array of size 1 + neqs * (maxlags + 1), ordered like `var_cross_products`.
+        nobs (int): The number of observations of the common sample.
+        neqs (int): The number of variables.
+        maxlags (int): The largest lag order to consider.
+
+    Returns:
+        ndarray: Array of shape (maxlags + 1,) with the AIC of each lag order.
+    """
+    try:
+        r = np.linalg.cholesky(gram).T
+    except np.linalg.LinAlgError:
+        # Constant or collinear lags make the matrix singular, fall back to the residual cross-products of
+        # every lag order from the minimum norm solution like lstsq
+        aic = np.empty(maxlags + 1)
+        for lag_order in range(maxlags + 1):
+            q = 1 + neqs * lag_order
+            inverse = np.linalg.pinv(gram[:q, :q], rcond=1e-15, hermitian=True)
+            sigma_u_mle = (gram[-neqs:, -neqs:] - gram[-neqs:, :q] @ inverse @ gram[:q, -neqs:]) / nobs
+            aic[lag_order] = np.linalg.slogdet(sigma_u_mle)[1] + (2.0 / nobs) * (lag_order * neqs ** 2 + neqs)
+        return aic
+    return _aic_from_r(r[None], nobs, neqs, maxlags)[0]
+
+
+def _aic_from_r(r, nobs, neqs, maxlags):
+    # Rows of R beyond the first q regressors hold the residuals of the responses regressed on them
+    responses = r[:, :, -neqs:]
+    outer = responses[:, :, :, None] * responses[:, :, None, :]
+    tail_sums = np.cumsum(outer[:, ::-1], axis=1)[:, ::-1]
+
+    lag_orders = np.arange(maxlags + 1)
+    sigma_u_mle = tail_sums[:, 1 + neqs * lag_orders] / nobs
+    _, logdet = np.linalg.slogdet(sigma_u_mle)
+    free_params = lag_orders * neqs ** 2 + neqs
+    return logdet + (2.0 / nobs) * free_params
+
+
+def select_lag_order(data, maxlags):
+    """
+    Select the VAR lag order minimizing the AIC, as `VAR(data).fit(maxlags=maxlags, ic='aic').k_ar` does.
+
+    Returns:
+        ndarray: Array of shape (pairs,) with the selected lag order of each pair.
+    """
+    return np.argmin(aic_by_lag_order(data, maxlags), axis=1)
+
+
+def granger_ssr_ftest_pvalues(data, maxlag):
+    """
+    Compute the SSR based F-test p-values of `grangercausalitytests` for every lag from 1 to maxlag.
+
+    The null hypothesis is that the second variable does not Granger cause the first. For every lag
+    the restricted and unrestricted models share one QR factorization of [constant, own lags, other
+    lags, response], as the restricted design is a prefix of the unrestricted one.
+
+    Parameters:
+        data (ndarray): Array of shape (pairs, observations, 2).
+        maxlag (int): The largest lag to test.
+
+    Returns:
+        ndarray: Array of shape (pairs, maxlag) where column i holds the p-values for lag i + 1.
+    """
+    pairs, n, _ = data.shape
+    if n <= 3 * maxlag + 1:
+        raise ValueError(
+            f"Insufficient observations. Maximum allowable lag is {int((n - 1) / 3) - 1}"
+        )
+
+    p_values = np.empty((pairs, maxlag))
+    for lag in range(1, maxlag + 1):
+        nobs = n - lag
+        design = np.concatenate([
+            np.ones((pairs, nobs, 1)),
+            lag_matrix(data[:, :, :1], lag),
+            lag_matrix(data[:, :, 1:], lag),
+            data[:, lag:, :1],
+        ], axis=2)
+        residuals = np.linalg.qr(design, mode='r')[:, :, -1]
+
+        ssr_joint = residuals[:, -1] ** 2
+        ssr_own = ssr_joint + np.sum(residuals[:, 1 + lag:1 + 2 * lag] ** 2, axis=1)
+        df_resid = nobs - (2 * lag + 1)
+        f_stat = (ssr_own - ssr_joint) / ssr_joint / lag * df_resid
+        p_values[:, lag - 1] = stats.f.sf(f_stat, lag, df_resid)
+
+    return p_values
+
+
+def min_granger_p_values(data, maxlags):
+    """
+    Select the lag order of every pair and return the minimum rounded SSR F-test p-value over lags
+    1 to the selected order, as causality.py does with statsmodels.
+
+    Parameters:
+        data (ndarray): Array of shape (pairs, observations, 2).
+        maxlags (int): The largest lag order to consider.
+
+    Returns:
+        tuple: The selected lag orders and the minimum p-values (NaN where no lag was selected).
+    """
+    k_ar = select_lag_order(data, maxlags)
+    min_p_values = np.full(k_ar.shape, np.nan)
+
+    max_k_ar = int(k_ar.max(initial=0))
+    if max_k_ar > 0:
+        selected = k_ar > 0
+        p_values = np.round(granger_ssr_ftest_pvalues(data[selected], max_k_ar), 4)
+        # Only lags up to each pair's own selected order take part in its minimum
+        beyond_order = np.arange(1, max_k_ar + 1) > k_ar[selected, None]
+        min_p_values[selected] = np.where(beyond_order, np.inf, p_values).min(axis=1)
+
+    return k_ar, min_p_values
+
+
+def var_cross_products(data, lag_order):
+    """
+    Compute the cross-product matrix of [constant, lags, responses] of a joint VAR.
+
+    The columns are standardized first, which leaves every F-test unchanged but keeps the
+    cross-products well conditioned for metrics of very different scales.
+
+    Parameters:
+        data (ndarray): Array of shape (observations, variables).
+        lag_order (int): The number of lags of the VAR.
+
+    Returns:
+        ndarray: Square array of size 1 + variables * (lag_order + 1). The lag columns are ordered
+                 like `lag_matrix`, so lag l of variable j is column 1 + (l - 1) * variables + j.
+    """
+    standardized = (data - data.mean(axis=0)) / data.std(axis=0)
+    design = np.concatenate([
+        np.ones((data.shape[0] - lag_order, 1)),
+        lag_matrix(standardized[None], lag_order)[0],
+        standardized[lag_order:],
+    ], axis=1)
+    return design.T @ design
+
+
+def _inverse(matrix):
+    try:
+        return np.linalg.inv(matrix)
+    except np.linalg.LinAlgError:
+        # Constant or collinear lags make the design rank deficient, take the minimum norm solution like lstsq
+        return np.linalg.pinv(matrix, rcond=1e-15, hermitian=True)
+
+
+def _lag_columns(variable, neqs, lag_order):
+    return 1 + variable + neqs * np.arange(lag_order)
+
+
+def conditional_granger_pvalues(data, lag_order):
+    """
+    Compute the Granger Causality F-test p-value of every ordered pair of variables in one joint VAR,
+    conditional on the lags of all other variables.
+
+    Every test is a Wald test on the coefficients of one fit, as in statsmodels'
+    `VARResults.test_causality(caused, causing, kind='f')`, including its denominator degrees of
+    freedom of variables * df_resid.
+
+    Parameters:
+        data (ndarray): Array of shape (observations, variables).
+        lag_order (int): The lag order of the VAR, at least 1.
+
+    Returns:
+        ndarray: Array of shape (variables, variables) where [i, j] is the p-value of variable i
+                 Granger causing variable j. The diagonal is NaN.
+    """
+    n, neqs = data.shape
+    gram = var_cross_products(data, lag_order)
+    return conditional_pvalues_from_cross_products(gram, n - lag_order, neqs, lag_order)
+
+
+def conditional_pvalues_from_cross_products(gram, nobs, neqs, lag_order):
+    """
+    Compute the p-values of `conditional_granger_pvalues` from the cross-product matrix of the joint VAR,
+    laid out like `var_cross_products`, on nobs observations.
+    """
+    q = 1 + neqs * lag_order
+    df_resid = nobs - q
+
+    gram_inv = _inverse(gram[:q, :q])
+    params = gram_inv @ gram[:q, q:]
+    ssr = np.diag(gram[q:, q:] - gram[q:, :q] @ params)
+    sigma = ssr / df_resid
+
+    p_values = np.full((neqs, neqs), np.nan)
+    for causing in range(neqs):
+        columns = _lag_columns(causing, neqs, lag_order)
+        block = params[columns]
+        wald = np.einsum('ij,ik,jk->k', _inverse(gram_inv[np.ix_(columns, columns)]), block, block) / sigma
+        p_values[causing] = stats.f.sf(wald / lag_order, lag_order, neqs * df_resid)
+    np.fill_diagonal(p_values, np.nan)
+    return p_values
+
+
+def pairwise_granger_pvalues(data, lag_order):
+    """
+    Compute the bivariate SSR F-test p-value of every ordered pair of variables at the given lag order,
+    as `grangercausalitytests` computes for that lag on the pair alone.
+
+    The restricted and unrestricted regressions of every pair are solved from sub-blocks of the joint
+    cross-product matrix, so no pair needs its own pass over the data.
+
+    Parameters:
+        data (ndarray): Array of shape (observations, variables).
+        lag_order (int): The lag to test, at least 1.
+
+    Returns:
+        ndarray: Array of shape (variables, variables) where [i, j] is the p-value of variable i
+                 Granger causing variable j. The diagonal is NaN.
+    """
+    n, neqs = data.shape
+    gram = var_cross_products(data, lag_order)
+    return pairwise_pvalues_from_cross_products(gram, n - lag_order, neqs, lag_order)
+
+
+def pairwise_pvalues_from_cross_products(gram, nobs, neqs, lag_order):
+    """
+    Compute the p-values of `pairwise_granger_pvalues` from the cross-product matrix of the joint VAR,
+    laid out like `var_cross_products`, on nobs observations.
+    """
+    q = 1 + neqs * lag_order
+    df_resid = nobs - (2 * lag_order + 1)
+
+    def ssr(regressors, response):
+        cross = gram[np.ix_(regressors, regressors)]
+        try:
+            params = np.linalg.solve(cross, gram[regressors, response])
+        except np.linalg.LinAlgError:
+            params = _inverse(cross) @ gram[regressors, response]
+        return gram[response, response] - gram[response, regressors] @ params
+
+    p_values = np.full((neqs, neqs), np.nan)
+    for caused in range(neqs):
+        own = np.concatenate(([0], _lag_columns(caused, neqs, lag_order)))
+        ssr_own = ssr(own, q + caused)
+        for causing in range(neqs):
+            if causing == caused:
+                continue
+            ssr_joint = ssr(np.concatenate((own, _lag_columns(causing, neqs, lag_order))), q + caused)
+            f_stat = (ssr_own - ssr_joint) / ssr_joint / lag_order * df_resid
+            p_values[causing, caused] = stats.f.sf(f_stat, lag_order, df_resid)
+    return p_values
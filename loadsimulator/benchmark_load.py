@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script benchmarks the throughput of the load generator. It starts a local stub of the API,
+runs the user profiles headless against it with no wait time in the default, high-throughput and
+FastHttpUser modes, and reports the requests per second per generator core: the requests sent
+divided by the CPU time the Locust process used, so the stub's share of the machine does not count.
+
+    python benchmark_load.py --users 50 --duration 20
+
+When Locust imports this file as its locustfile, it only finds the benchmark user profile.
+
+Author: dhruvshetty213@gmail.com
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from locust import constant
+
+import user_profiles
+
+MODES = {
+    "default": {},
+    "high-throughput": {"LOAD_HIGH_THROUGHPUT": "1"},
+    "high-throughput-fasthttp": {"LOAD_HIGH_THROUGHPUT": "1", "LOAD_FAST_HTTP": "1"},
+}
+STUB_RESPONSE = json.dumps({"auth_ref": "stub-auth-ref", "access_token": "stub-access-token"}).encode()
+
+class BenchmarkUser(user_profiles.PrivateUser):
+    """PrivateUser without wait time, so every user sends requests as fast as the generator allows."""
+    wait_time = constant(0)
+
+def stub_app(environ, start_response):
+    """WSGI stub answering every API call of the user profiles."""
+    if environ["REQUEST_METHOD"] == "DELETE":
+        start_response("204 No Content", [])
+        return [b""]
+    start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(STUB_RESPONSE)))])
+    return [STUB_RESPONSE]
+
+def serve_stub(port):
+    from gevent.pywsgi import WSGIServer
+
+    WSGIServer(("127.0.0.1", port), stub_app, log=None).serve_forever()
+
+def run_mode(mode, host, users, spawn_rate, duration, output_dir):
+    """
+    Run Locust headless in a subprocess with the environment of the given mode.
+
+    Returns:
+        dict: The requests and failures sent, the wall time, the CPU time of the generator and the
+              requests per second overall and per generator core.
+    """
+    env = {key: value for key, value in os.environ.items() if key not in ("LOAD_HIGH_THROUGHPUT", "LOAD_FAST_HTTP")}
+    env.update(MODES[mode])
+    # The pool is generated on the first spawn, a larger one than the users need only adds start-up time
+    env["LOAD_IDENTITY_POOL_SIZE"] = str(users)
+    csv_prefix = os.path.join(output_dir, mode)
+    command = [sys.executable, "-m", "locust", "-f", os.path.abspath(__file__), "--headless", "--only-summary",
+               "--host", host, "-u", str(users), "-r", str(spawn_rate), "-t", f"{duration}s", "--csv", csv_prefix,
+               "--loglevel", "WARNING"]
+
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    subprocess.run(command, env=env, check=False, stdout=subprocess.DEVNULL)
+    wall_seconds = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_seconds = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    with open(f"{csv_prefix}_stats.csv") as f:
+        aggregated = next(row for row in csv.DictReader(f) if row["Name"] == "Aggregated")
+    requests = int(aggregated["Request Count"])
+
+    return {
+        "requests": requests,
+        "failures": int(aggregated["Failure Count"]),
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+        "requests_per_second": float(aggregated["Requests/s"]),
+        "requests_per_second_per_core": requests / cpu_seconds if cpu_seconds else float("nan"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the load generator against a local stub server.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--spawn-rate", type=float, default=50)
+    parser.add_argument("--duration", type=int, default=20, help="Seconds to run every mode")
+    parser.add_argument("--port", type=int, default=8189)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    stub = multiprocessing.Process(target=serve_stub, args=(args.port,), daemon=True)
+    stub.start()
+    time.sleep(0.5)
+
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            for mode in args.modes:
+                results[mode] = run_mode(mode, f"http://127.0.0.1:{args.port}", args.users, args.spawn_rate,
+                                         args.duration, output_dir)
+                print(f"{mode:>26}: {results[mode]['requests']} requests, "
+                      f"{results[mode]['requests_per_second']:.1f} req/s, "
+                      f"{results[mode]['requests_per_second_per_core']:.1f} req/s per generator core",
+                      file=sys.stderr)
+    finally:
+        stub.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,117 @@ This is a general helper function used to along with the other scripts part
 of the load generator for the Chaos Engineering experiments. This helper file
 has very generalized code and skips certain confidential methods.
 
+Fake users, profile updates and payment payloads come from a seeded FakeDataFactory, which generates
+them in bulk or lazily in chunks and hands them out from per-process pools. The same seed and worker
+index always hand out the same sequence, so a run can be replayed exactly. Run this file to measure
+the generation throughput and size the pools for a user count:
+
+    python helpers.py --users 500 --seed 42
+
 Author: dhruvshetty213@gmail.com
 """
+import os
+import time
+import argparse
+from collections import deque
 from faker import Faker
 
+DEFAULT_SEED = int(os.environ.get("LOAD_SEED", 0))
+DEFAULT_CHUNK_SIZE = 256
+
+class FakeDataFactory:
+    """
+    Seeded generator and pool of fake users, profile updates and payment payloads of one worker.
+
+    Every kind of data has its own Faker instance, seeded from the seed, the worker index and the kind,
+    so the n-th item of a kind is the same however the kinds are interleaved and however the pools are
+    filled. The pools are deques that are only appended to and popped from their ends, which is safe
+    without a lock, and every Locust worker process creates its own factory.
+    """
+
+    KINDS = ("user", "update", "payment")
+
+    def __init__(self, seed=DEFAULT_SEED, worker_index=0, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.seed = seed
+        self.worker_index = worker_index
+        self.chunk_size = chunk_size
+        self.fakers = {}
+        for kind in ("user", "update"):
+            self.fakers[kind] = Faker()
+            self.fakers[kind].seed_instance(f"{seed}-{worker_index}-{kind}")
+        self.pools = {kind: deque() for kind in self.KINDS}
+        self.generated = dict.fromkeys(self.KINDS, 0)
+
+    def generate_users(self, count) -> list:
+        fake = self.fakers["user"]
+        self.generated["user"] += count
+        return [{
+            "identifier": fake.uuid4(),
+            "currency": "XYZ",
+            "name": fake.name(),
+            "email": fake.email(),
+            "auth_ref": None,
+        } for _ in range(count)]
+
+    def generate_updates(self, count) -> list:
+        fake = self.fakers["update"]
+        self.generated["update"] += count
+        return [{"name": fake.name(), "email": fake.email()} for _ in range(count)]
+
+    def generate_payments(self, count, transfer=False) -> list:
+        self.generated["payment"] += count
+        return [generate_payment_payload(transfer) for _ in range(count)]
+
+    def prefill(self, users=0, updates=0, payments=0):
+        """Generate data ahead of time, so the pools only refill once more than this is handed out."""
+        self.pools["user"].extend(self.generate_users(users))
+        self.pools["update"].extend(self.generate_updates(updates))
+        self.pools["payment"].extend(self.generate_payments(payments))
+        return self
+
+    def take(self, kind) -> dict:
+        """Hand out the next item of a kind, generating another chunk when its pool is empty."""
+        pool = self.pools[kind]
+        if not pool:
+            pool.extend(getattr(self, f"generate_{kind}s")(self.chunk_size))
+        return pool.popleft()
+
+    def user(self) -> dict:
+        return self.take("user")
+
+    def update(self) -> dict:
+        return self.take("update")
+
+    def payment(self, transfer=False) -> dict:
+        if transfer:
+            return generate_payment_payload(transfer=True)
+        return self.take("payment")
+
+    def throughput(self, count=1000) -> dict:
+        """
+        Measure the generation rate of every kind of data on a separately seeded factory, so the
+        sequence of this factory is left untouched.
+
+        Returns:
+            dict: The number of items generated per second of every kind.
+        """
+        probe = FakeDataFactory(self.seed, self.worker_index + 1_000_000, self.chunk_size)
+        rates = {}
+        for kind in self.KINDS:
+            started = time.perf_counter()
+            getattr(probe, f"generate_{kind}s")(count)
+            rates[kind] = count / (time.perf_counter() - started)
+        return rates
+
+_factories = {}
+
+def get_factory(worker_index=0, seed=DEFAULT_SEED) -> FakeDataFactory:
+    """Returns the factory of a worker in this process, creating it on first use."""
+    factory = _factories.get((seed, worker_index))
+    if factory is None:
+        factory = _factories[(seed, worker_index)] = FakeDataFactory(seed, worker_index)
+    return factory
+
 def generate_user_data(update=False) -> dict:
     """
     Generate a fake user with necessary attributes or update the user's profile.
@@ -17,35 +124,14 @@ def generate_user_data(update=False) -> dict:
     Returns:
         dict: A dictionary with the user data.
     """
-    fake = Faker()
-
     if update:
         return update_user_data()
 
-    identifier = fake.uuid4()
-    name = fake.name()
-    email = fake.email()
-
-    user_data = {
-        "identifier": identifier,
-        "currency": "XYZ",
-        "name": name,
-        "email": email,
-        "auth_ref": None,
-    }
-
-    return user_data
+    return get_factory().user()
 
 def update_user_data():
     """Generate updated user data with name and email."""
-    fake = Faker()
-
-    updated_data = {
-        "name": fake.name(),
-        "email": fake.email()
-    }
-
-    return updated_data
+    return get_factory().update()
 
 def generate_payment_payload(transfer=False) -> dict:
     """
@@ -70,3 +156,22 @@ generic_test_card = {
     "card[cvc]": 123,
     "type": "card"
 }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the fake data generation throughput and size the pools.")
+    parser.add_argument("--users", type=int, default=100, help="Number of simulated users to size the pools for")
+    parser.add_argument("--updates-per-user", type=int, default=1)
+    parser.add_argument("--payments-per-user", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--count", type=int, default=1000, help="Items to generate per kind for the measurement")
+    args = parser.parse_args()
+
+    rates = FakeDataFactory(args.seed).throughput(args.count)
+    counts = {"user": args.users, "update": args.users * args.updates_per_user,
+              "payment": args.users * args.payments_per_user}
+    for kind in FakeDataFactory.KINDS:
+        print(f"{kind:>8}: {rates[kind]:>12.0f} per second, {counts[kind]:>8} for {args.users} users "
+              f"in {counts[kind] / rates[kind]:.3f} s")
+
+if __name__ == "__main__":
+    main()
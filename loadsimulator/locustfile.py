@@ -6,11 +6,20 @@ This script is the entry point of the Locust load simulator used as part of this
 A custom load shape is used to produce dynamic changes in user counts at random times to make
 the validity of the collected data stochastic.
 
+The whole user count and spawn rate timeline is precomputed from Config.SEED (LOAD_SEED) as a compact
+array, and tick() looks the current stage up by binary search on the run time. The same seed therefore
+replays the same shape, also in distributed runs where only the master evaluates it. Setting
+LOAD_SHAPE_DATASET to a dataset CSV replays its recorded 'traffic' column as the shape instead. With
+LOAD_SCALE_WITH_WORKERS=1 the user counts are multiplied by the number of connected workers over
+Config.REFERENCE_WORKERS, so every worker generates the load the schedule was made for.
+
 Author: dhruvshetty213@gmail.com
 """
 import os
+import csv
 import numpy as np
 from locust import events, LoadTestShape
+from locust.runners import MasterRunner
 
 class Config:
     INITIAL_USER_COUNT = 25
@@ -24,40 +33,100 @@ class Config:
     MIN_TIME_INTERVAL_SECONDS = 60
     MEAN_TIME_INTERVAL_SECONDS = 150
     MAX_TIME_INTERVAL_SECONDS = 240
+    SEED = int(os.environ.get('LOAD_SEED', 0))
+    DURATION_SECONDS = 24 * 60 * 60  # The last stage is held once the schedule runs out
+    TRAFFIC_DATASET = os.environ.get('LOAD_SHAPE_DATASET')
+    SAMPLE_SECONDS = 30  # Resolution of the recorded datasets
+    SCALE_WITH_WORKERS = os.environ.get('LOAD_SCALE_WITH_WORKERS') == '1'
+    REFERENCE_WORKERS = 1
+
+SCHEDULE_DTYPE = np.dtype([('start', np.float64), ('user_count', np.int32), ('spawn_rate', np.float32)])
+
+def build_schedule(config=Config, seed=None, duration=None):
+    """
+    Precompute the random shape of AutoLoadTestShape: Poisson user counts and spawn rates, held for
+    Poisson intervals, all clipped to the bounds of the config. All draws are made at once.
+
+    Returns:
+        ndarray: The stages as a structured array of start second, user count and spawn rate.
+    """
+    rng = np.random.default_rng(config.SEED if seed is None else seed)
+    duration = config.DURATION_SECONDS if duration is None else duration
+    n_stages = int(np.ceil(duration / config.MIN_TIME_INTERVAL_SECONDS)) + 1
+
+    intervals = np.clip(rng.poisson(config.MEAN_TIME_INTERVAL_SECONDS, n_stages),
+                        config.MIN_TIME_INTERVAL_SECONDS, config.MAX_TIME_INTERVAL_SECONDS)
+    user_counts = np.clip(rng.poisson(config.MEAN_USER_COUNT, n_stages),
+                          config.MIN_USER_COUNT, config.MAX_USER_COUNT)
+    spawn_rates = np.clip(rng.poisson(config.MEAN_SPAWN_RATE, n_stages),
+                          config.MIN_SPAWN_RATE, config.MAX_SPAWN_RATE)
+
+    schedule = np.empty(n_stages, dtype=SCHEDULE_DTYPE)
+    schedule['start'][0] = 0
+    schedule['start'][1:] = np.cumsum(intervals[:-1])
+    schedule['user_count'] = np.concatenate(([config.INITIAL_USER_COUNT], user_counts[:-1]))
+    schedule['spawn_rate'] = np.concatenate(([config.INITIAL_SPAWN_RATE], spawn_rates[:-1]))
+    return schedule[schedule['start'] < duration]
+
+def read_traffic(file_path):
+    """Returns the 'traffic' column of a dataset CSV."""
+    with open(file_path) as f:
+        return np.array([float(row['traffic']) for row in csv.DictReader(f)])
+
+def schedule_from_traffic(traffic, config=Config):
+    """
+    Turn a recorded traffic curve into a schedule with one stage per sample. The traffic is scaled
+    so its mean maps to MEAN_USER_COUNT, and every stage spawns fast enough to reach its user count
+    within one sample.
+
+    Returns:
+        ndarray: The stages in the format of build_schedule.
+    """
+    traffic = np.asarray(traffic, dtype=np.float64)
+    user_counts = np.maximum(np.rint(traffic / traffic.mean() * config.MEAN_USER_COUNT), 1).astype(np.int32)
+    changes = np.abs(np.diff(user_counts, prepend=user_counts[0]))
+
+    schedule = np.empty(len(traffic), dtype=SCHEDULE_DTYPE)
+    schedule['start'] = np.arange(len(traffic)) * config.SAMPLE_SECONDS
+    schedule['user_count'] = user_counts
+    schedule['spawn_rate'] = np.maximum(changes / config.SAMPLE_SECONDS, config.MIN_SPAWN_RATE)
+    return schedule
 
 class AutoLoadTestShape(LoadTestShape):
     """
-    A custom load test shape that generates random user counts and spawn rates at random time intervals.
+    A custom load test shape that generates random user counts and spawn rates at random time intervals,
+    from a schedule that is precomputed once from the seed or taken from a recorded traffic curve.
     """
 
-    def __init__(self, config=Config):
+    def __init__(self, config=Config, schedule=None):
         super().__init__()
-        self.user_count = config.INITIAL_USER_COUNT
-        self.spawn_rate = config.INITIAL_SPAWN_RATE
-        self.next_update_time = self.get_run_time() + self.get_random_interval(config)
+        if schedule is None:
+            schedule = schedule_from_traffic(read_traffic(config.TRAFFIC_DATASET), config) \
+                if config.TRAFFIC_DATASET else build_schedule(config)
+        self.config = config
+        self.schedule = schedule
+        self.stage = 0
 
-    def get_random_interval(self, config):
-        return np.clip(np.random.poisson(config.MEAN_TIME_INTERVAL_SECONDS), 
-                       config.MIN_TIME_INTERVAL_SECONDS, 
-                       config.MAX_TIME_INTERVAL_SECONDS)
+    def scale(self):
+        """The factor the user counts and spawn rates are multiplied with for the connected workers."""
+        if not self.config.SCALE_WITH_WORKERS or not isinstance(self.runner, MasterRunner):
+            return 1
+        return max(self.runner.worker_count, 1) / self.config.REFERENCE_WORKERS
 
-    def tick(self, config=Config):
+    def tick(self):
         """
-        Locust calls tick() approximately every second, and user count and spawn rate is adjusted if run time of locust test exceeds the next update time.
+        Locust calls tick() approximately every second, and the stage of the current run time is looked up in the schedule.
         """
-        current_run_time = self.get_run_time()
-
-        if current_run_time >= self.next_update_time:
-            self.user_count = np.clip(np.random.poisson(config.MEAN_USER_COUNT), 
-                                      config.MIN_USER_COUNT, 
-                                      config.MAX_USER_COUNT)
-            self.spawn_rate = np.clip(np.random.poisson(config.MEAN_SPAWN_RATE), 
-                                      config.MIN_SPAWN_RATE, 
-                                      config.MAX_SPAWN_RATE)
-            self.next_update_time = current_run_time + self.get_random_interval(config)
-            print("Next update time at {}s timestep".format(self.next_update_time))
-
-        return self.user_count, self.spawn_rate
+        stage = max(int(np.searchsorted(self.schedule['start'], self.get_run_time(), side='right')) - 1, 0)
+
+        if stage != self.stage:
+            self.stage = stage
+            if stage + 1 < len(self.schedule):
+                print("Next update time at {}s timestep".format(self.schedule['start'][stage + 1]))
+
+        scale = self.scale()
+        user_count, spawn_rate = self.schedule['user_count'][stage], self.schedule['spawn_rate'][stage]
+        return int(round(user_count * scale)), float(spawn_rate * scale)
 
 class EnvironmentVariables:
     APPLICATION_API_KEY = 'APPLICATION_API_KEY'
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This is a Locust plugin used by experiment_runner.py to sample the transaction metrics of a local
+experiment. It counts every request Locust makes and writes the running totals (requests, failures,
+summed response time and the Apdex satisfied and tolerating counts) as JSON to LOAD_METRICS_PATH every
+LOAD_METRICS_INTERVAL seconds, so the runner can difference two snapshots into the metrics of a sample window.
+
+    locust -f locustfile.py,user_profiles.py,metrics_probe.py --headless --host ...
+
+Author: dhruvshetty213@gmail.com
+"""
+import os
+import json
+import gevent
+from locust import events
+
+METRICS_PATH = os.environ.get("LOAD_METRICS_PATH")
+APDEX_T_SECONDS = float(os.environ.get("LOAD_APDEX_T", 0.5))
+WRITE_INTERVAL_SECONDS = float(os.environ.get("LOAD_METRICS_INTERVAL", 1))
+
+totals = {
+    "requests": 0,
+    "failures": 0,
+    "response_time_seconds": 0.0,
+    "satisfied": 0,
+    "tolerating": 0,
+}
+
+@events.request.add_listener
+def on_request(response_time, exception, **kwargs):
+    seconds = response_time / 1000
+    totals["requests"] += 1
+    totals["response_time_seconds"] += seconds
+    if exception is not None:
+        # Failed requests count as frustrated, like New Relic's apdex()
+        totals["failures"] += 1
+    elif seconds <= APDEX_T_SECONDS:
+        totals["satisfied"] += 1
+    elif seconds <= 4 * APDEX_T_SECONDS:
+        totals["tolerating"] += 1
+
+def write_totals():
+    tmp_path = METRICS_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(totals, f)
+    os.replace(tmp_path, METRICS_PATH)
+
+def write_loop():
+    while True:
+        write_totals()
+        gevent.sleep(WRITE_INTERVAL_SECONDS)
+
+@events.init.add_listener
+def on_locust_init(environment, **kwargs):
+    if METRICS_PATH:
+        gevent.spawn(write_loop)
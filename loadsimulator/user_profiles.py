@@ -7,11 +7,25 @@ of the load generator for the Chaos Engineering experiments. These show the most
 common user profiles and their interactions. For confidentiality reasons, the entire
 user profiles and access have been generalized.
 
+The fake identities come from the seeded data factory of helpers.py, one per Locust worker, so
+LOAD_SEED replays the identities of a run. When the load generator machine saturates before the
+system under test, set LOAD_HIGH_THROUGHPUT=1: the identity pool of each worker is then filled
+with LOAD_IDENTITY_POOL_SIZE identities before the first user starts, and users build their request
+headers once per access token instead of on every request. LOAD_FAST_HTTP=1 runs the profiles on
+Locust's FastHttpUser (geventhttpclient) instead of HttpUser (requests). See benchmark_load.py
+for the requests/sec per generator core of each mode.
+
 Author: dhruvshetty213@gmail.com
 """
-import requests
-from locust import HttpUser, task, between, tag
-from helpers import generate_user, generate_payment_payload, test_card
+import os
+from locust import HttpUser, FastHttpUser, task, between, tag
+from helpers import get_factory
+
+HIGH_THROUGHPUT = os.environ.get("LOAD_HIGH_THROUGHPUT") == "1"
+FAST_HTTP = os.environ.get("LOAD_FAST_HTTP") == "1"
+IDENTITY_POOL_SIZE = int(os.environ.get("LOAD_IDENTITY_POOL_SIZE", 1000))
+
+UserBase = FastHttpUser if FAST_HTTP else HttpUser
 
 # Generalize configurations
 API_ENDPOINTS = {
@@ -19,24 +33,36 @@ API_ENDPOINTS = {
     "AUTH_USER": "/account/user/auth",
     "PAYMENT_METHODS": "/account/user/payments/methods",
     "DELETE_USER": "/account/user",
-    ...
+    "QUERY_PROFILE": "/account/user/profile",
+    # ...
 }
 
 # General API configurations
 API_HEADERS = {
-    "CONTENT_TYPE": "application/json",
+    "CONTENT_TYPE": "Content-Type",
     "API_KEY": "X-Api-Key",
     "HOST": "api.dev.platform.cloud",
     "ACCESS_TOKEN": "X-User-AccessToken",
-    ...
+    # ...
 }
 
-class BasicUser(HttpUser):
+def worker_factory(environment):
+    """Returns the data factory of this Locust worker, prefilled in high-throughput mode."""
+    worker_index = getattr(environment.runner, "worker_index", 0) if environment.runner else 0
+    factory = get_factory(worker_index)
+    if HIGH_THROUGHPUT and not factory.generated["user"]:
+        factory.prefill(users=IDENTITY_POOL_SIZE)
+    return factory
+
+class BasicUser(UserBase):
     """BasicUser is the base class for all users in the load test."""
+    abstract = True
     timeout = 350
+    uses_public_api_key = False
 
     def on_start(self):
-        self.user_data = generate_user()
+        self.user_data = worker_factory(self.environment).user()
+        self.headers_cache = {}
         self.register_profile()
         self.authorize_user()
         self.register_user_card()
@@ -53,6 +79,7 @@ class BasicUser(HttpUser):
         response = self.client.post(
             API_ENDPOINTS["AUTH_USER"], json=self.user_data, headers=self.get_request_headers(init_call=True))
         self.access_token = response.json()["access_token"]
+        self.headers_cache = {}
 
     def register_user_card(self) -> None:
         self.client.post(API_ENDPOINTS["PAYMENT_METHODS"],
@@ -66,16 +93,28 @@ class BasicUser(HttpUser):
                 response.failure(f"{response.status_code} - {response.text}")
 
     def get_request_headers(self, init_call=False) -> dict:
+        """
+        Build the request headers. In high-throughput mode they are built once per access token and
+        reused, the HTTP clients copy the headers they are given so the cached dict is never modified.
+        """
+        if HIGH_THROUGHPUT:
+            headers = self.headers_cache.get(init_call)
+            if headers is None:
+                headers = self.headers_cache[init_call] = self.build_request_headers(init_call)
+            return headers
+        return self.build_request_headers(init_call)
+
+    def build_request_headers(self, init_call=False) -> dict:
         headers = {API_HEADERS["CONTENT_TYPE"]: 'application/json'}
         
         if init_call:
             headers.update({
-                API_HEADERS["API_KEY"]: self.environment.private_api_key,
+                API_HEADERS["API_KEY"]: getattr(self.environment, "private_api_key", None),
                 API_HEADERS["HOST"]: 'api-private.dev.platform.cloud',
             })
         else:
-            api_key = self.environment.public_api_key if isinstance(
-                self, PublicUser) else self.environment.private_api_key
+            api_key = getattr(self.environment, "public_api_key", None) if self.uses_public_api_key \
+                else getattr(self.environment, "private_api_key", None)
             headers.update({
                 API_HEADERS["API_KEY"]: api_key,
             })
@@ -83,7 +122,8 @@ class BasicUser(HttpUser):
         if hasattr(self, "access_token"):
             headers[API_HEADERS["ACCESS_TOKEN"]] = self.access_token
 
-        return headers
+        # Unset keys are left out, FastHttpUser cannot send None header values
+        return {name: value for name, value in headers.items() if value is not None}
         
     # ... rest of the user tasks ...
 
@@ -97,6 +137,6 @@ class PrivateUser(BasicUser):
 
     @task(4)
     def query_member_profile(self):
-        self.client.get(API_ENDPOINTS['QUERY_PROFILE'], headers=self.get_headers())
+        self.client.get(API_ENDPOINTS['QUERY_PROFILE'], headers=self.get_request_headers())
 
     # ... rest of the user tasks ...
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is a local stand-in for the New Relic GraphQL endpoint, so the metrics extractor can be
+run, benchmarked and regression-tested without a network. The time series are loaded from existing
+experiment datasets into one indexed store, and NRQL queries are answered in the
+`actor.account.nrql.results` shape of the real endpoint, one `nrql` field or several aliased ones
+per request.
+
+Only the NRQL subset the extractor uses is supported: `FROM <event type> SELECT <function>(...)
+[WHERE <condition> AND ...] SINCE <time> UNTIL <time> TIMESERIES <n> <unit>`, with the times in epoch
+milliseconds or quoted ISO 8601. A query is answered from the dataset column of the extractor signal
+with the same event type, function and set of WHERE conditions. Buckets coarser than the datasets
+sum counts and average the other functions, weighted by the traffic for Transaction events.
+Artificial latency can be added per request and per query:
+
+    python metrics_backend.py serve datasets/cpu_experiments datasets/io_experiments --latency 0.2
+    NEW_RELIC_ENDPOINT=http://127.0.0.1:8190/graphql python general_metrics_extractor.py ...
+
+    python metrics_backend.py check datasets/cpu_experiments --latency 0.05
+
+`check` exports every dataset window through the extractor from an in-process server and compares
+the result to the dataset, reporting the export time and the number of requests made.
+
+The series are served under the APP_NAME and OTHER_APP_NAME service names of the extractor, or under
+PLACEHOLDER_APP_NAMES when they are not set, so no production configuration is needed offline. An
+extractor run against `serve` must then set APP_NAME and OTHER_APP_NAME to the placeholders.
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+import dataset_cache
+import general_metrics_extractor as extractor
+
+MAX_BUCKETS = extractor.MAX_BUCKETS
+PORT = 8190
+CLAUSES = ['FROM', 'SELECT', 'WHERE', 'SINCE', 'UNTIL', 'TIMESERIES']
+CLAUSE_PATTERN = re.compile(r"\b(" + '|'.join(CLAUSES) + r")\b", re.IGNORECASE)
+AND_PATTERN = re.compile(r"\bAND\b", re.IGNORECASE)
+FUNCTION_PATTERN = re.compile(r"^(\w+)\s*\((.*)\)$", re.DOTALL)
+NRQL_FIELD_PATTERN = re.compile(r'(?:(\w+)\s*:\s*)?nrql\s*\(\s*query\s*:\s*("(?:[^"\\]|\\.)*")\s*\)')
+PLACEHOLDER_APP_NAMES = ('app', 'other-app')
+SIGNALS = extractor.build_signals(extractor.APP_NAME or PLACEHOLDER_APP_NAMES[0],
+                                  extractor.OTHER_APP_NAME or PLACEHOLDER_APP_NAMES[1])
+
+
+class NrqlError(ValueError):
+    pass
+
+
+def _top_level(text):
+    """
+    Returns for every character of the text whether it is outside parentheses and quotes.
+    """
+    depth, quote, flags = 0, None, []
+    for char in text:
+        flags.append(depth == 0 and quote is None)
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+    return flags
+
+
+def split_clauses(nrql):
+    """
+    Returns the clauses of a NRQL query as a dict from keyword to text. Keywords inside function
+    arguments, such as the WHERE of `percentage(count(*), where error is true)`, are not clauses.
+    """
+    top_level = _top_level(nrql)
+    matches = [match for match in CLAUSE_PATTERN.finditer(nrql) if top_level[match.start()]]
+    if not matches or matches[0].start() != 0 and nrql[:matches[0].start()].strip():
+        raise NrqlError(f"NRQL syntax error in '{nrql}'.")
+
+    clauses = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        keyword = match.group(1).upper()
+        if keyword in clauses:
+            raise NrqlError(f"Duplicate {keyword} clause in '{nrql}'.")
+        clauses[keyword] = nrql[match.end():following.start() if following else len(nrql)].strip()
+    return clauses
+
+
+def normalize(text):
+    return ' '.join(text.split())
+
+
+def where_conditions(where):
+    """
+    Returns the conditions of a WHERE clause joined by top level ANDs, as a set of normalized strings.
+    """
+    if not where:
+        return frozenset()
+    top_level = _top_level(where)
+    conditions, start = [], 0
+    for match in AND_PATTERN.finditer(where):
+        if top_level[match.start()]:
+            conditions.append(where[start:match.start()])
+            start = match.end()
+    conditions.append(where[start:])
+    return frozenset(normalize(condition) for condition in conditions)
+
+
+def series_key(event_type, select, where):
+    return event_type.lower(), normalize(select).lower(), where_conditions(where)
+
+
+def result_key(select):
+    """
+    Returns the key of the selected value in the results, e.g. 'average.duration' for average(duration).
+    """
+    match = FUNCTION_PATTERN.match(normalize(select))
+    if not match:
+        raise NrqlError(f"Unsupported SELECT '{select}'.")
+    function, argument = match.group(1).lower(), match.group(2).strip()
+    if function in ('average', 'sum', 'min', 'max', 'latest'):
+        return f"{function}.{argument}"
+    return 'score' if function == 'apdex' else function
+
+
+def parse_nrql_time(value):
+    """
+    Returns the epoch seconds of a SINCE or UNTIL value, in epoch milliseconds or quoted ISO 8601.
+    """
+    value = value.strip()
+    if value.isdigit():
+        return int(value) // 1000
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"":
+        try:
+            return int(extractor.parse_time(value[1:-1]).timestamp())
+        except ValueError:
+            pass
+    raise NrqlError(f"Unsupported time '{value}', use epoch milliseconds or a quoted ISO 8601 time.")
+
+
+class TimeSeriesStore:
+    """
+    The signals of experiment datasets merged into one timeline: sorted epoch seconds and a matrix
+    with a column per signal. Queries select their time range by binary search.
+    """
+
+    def __init__(self, signals=SIGNALS):
+        self.columns = [column for column, _, _, _, _ in signals]
+        self.series = {
+            series_key(event_type, metric, where): (column, result_key(metric))
+            for column, event_type, metric, _, where in signals
+        }
+        if len(self.series) != len(self.columns):
+            raise ValueError("Several signals have the same query, set distinct APP_NAME and OTHER_APP_NAME.")
+        self.times = np.empty(0, dtype=np.int64)
+        self.values = np.empty((0, len(self.columns)))
+
+    @classmethod
+    def from_folders(cls, folder_paths, signals=SIGNALS):
+        store = cls(signals)
+        store.load([f for folder_path in folder_paths for f in dataset_cache.list_experiment_files(folder_path)])
+        return store
+
+    def load(self, file_paths):
+        """
+        Add the rows of the given dataset files. Rows at the same time as loaded ones replace them.
+        """
+        frames = [pd.DataFrame(self.values, index=self.times, columns=self.columns)]
+        for file_path in file_paths:
+            df = dataset_cache.load_experiment(file_path)
+            df = df.reindex(columns=self.columns).astype('float64')
+            df.index = df.index.asi8 // 10 ** 9
+            frames.append(df)
+        merged = pd.concat(frames).sort_index(kind='stable')
+        merged = merged[~merged.index.duplicated(keep='last')]
+        self.times = merged.index.to_numpy(dtype=np.int64)
+        self.values = merged.to_numpy()
+
+    def query(self, nrql, max_buckets=MAX_BUCKETS):
+        """
+        Returns the TIMESERIES results of a NRQL query: one dict per bucket of [SINCE, UNTIL) with its
+        beginTimeSeconds, endTimeSeconds and the selected value, None for buckets without data.
+        """
+        clauses = split_clauses(nrql)
+        for keyword in ('FROM', 'SELECT', 'SINCE', 'UNTIL', 'TIMESERIES'):
+            if keyword not in clauses:
+                raise NrqlError(f"Missing {keyword} clause in '{nrql}', only TIMESERIES queries are supported.")
+
+        key = series_key(clauses['FROM'], clauses['SELECT'], clauses.get('WHERE'))
+        if key not in self.series:
+            where = f" WHERE {clauses['WHERE']}" if 'WHERE' in clauses else ''
+            raise NrqlError(f"No series for 'FROM {clauses['FROM']} SELECT {clauses['SELECT']}{where}'.")
+        column, value_key = self.series[key]
+
+        since, until = parse_nrql_time(clauses['SINCE']), parse_nrql_time(clauses['UNTIL'])
+        try:
+            step = extractor.parse_sample_rate(clauses['TIMESERIES'])
+        except ValueError as e:
+            raise NrqlError(str(e))
+        n_buckets = -(-(until - since) // step)
+        if n_buckets <= 0:
+            raise NrqlError(f"UNTIL must be after SINCE in '{nrql}'.")
+        if n_buckets > max_buckets:
+            raise NrqlError(f"{n_buckets} TIMESERIES buckets requested, at most {max_buckets} are supported.")
+
+        lo, hi = np.searchsorted(self.times, [since, until])
+        buckets = (self.times[lo:hi] - since) // step
+        values = self.values[lo:hi, self.columns.index(column)]
+        valid = ~np.isnan(values)
+        counts = np.bincount(buckets[valid], minlength=n_buckets)
+
+        if value_key == 'count':
+            aggregated = np.bincount(buckets[valid], values[valid], minlength=n_buckets)
+            has_value = np.ones(n_buckets, dtype=bool)  # Counts of empty buckets are 0
+        else:
+            weights = valid.astype(float)
+            if key[0] == 'transaction' and 'traffic' in self.columns:
+                traffic = self.values[lo:hi, self.columns.index('traffic')]
+                weights = np.where(valid & (traffic > 0), traffic, 0.0)
+            # Buckets whose values all have zero traffic fall back to the unweighted mean
+            total_weights = np.bincount(buckets, weights, minlength=n_buckets)
+            weights = np.where((total_weights == 0)[buckets] & valid, 1.0, weights)
+            total_weights = np.bincount(buckets, weights, minlength=n_buckets)
+            sums = np.bincount(buckets, weights * np.where(valid, values, 0.0), minlength=n_buckets)
+            aggregated = np.divide(sums, total_weights, out=np.zeros(n_buckets), where=total_weights > 0)
+            has_value = counts > 0
+
+        return [
+            {
+                'beginTimeSeconds': int(since + i * step),
+                'endTimeSeconds': int(min(since + (i + 1) * step, until)),
+                value_key: float(aggregated[i]) if has_value[i] else None,
+            }
+            for i in range(n_buckets)
+        ]
+
+
+class MetricsBackend:
+    """
+    Answers GraphQL requests of `nrql(query: "...") { results }` fields, aliased or not, from a
+    TimeSeriesStore. A request is delayed by latency_seconds, plus latency_per_query_seconds for each
+    of its queries, plus a uniform random jitter of up to jitter_seconds.
+    """
+
+    def __init__(self, store, latency_seconds=0.0, latency_per_query_seconds=0.0, jitter_seconds=0.0,
+                 max_buckets=MAX_BUCKETS, seed=None):
+        self.store = store
+        self.latency_seconds = latency_seconds
+        self.latency_per_query_seconds = latency_per_query_seconds
+        self.jitter_seconds = jitter_seconds
+        self.max_buckets = max_buckets
+        self.random = random.Random(seed)
+        self.requests_served = 0
+        self.queries_served = 0
+
+    def delay(self, n_queries):
+        return (self.latency_seconds + self.latency_per_query_seconds * n_queries
+                + self.random.uniform(0, self.jitter_seconds))
+
+    def parse_request(self, graphql):
+        """
+        Returns the (alias, NRQL) pairs of the nrql fields of a GraphQL query, the alias None if unaliased.
+        """
+        fields = [(alias or None, json.loads(nrql)) for alias, nrql in NRQL_FIELD_PATTERN.findall(graphql)]
+        if not fields:
+            raise NrqlError("The GraphQL query has no nrql(query: ...) field.")
+        return fields
+
+    def respond(self, graphql):
+        """
+        Returns the GraphQL response to a query. A failing NRQL query nulls its field and adds an error.
+        """
+        self.requests_served += 1
+        try:
+            fields = self.parse_request(graphql)
+        except (NrqlError, ValueError) as e:
+            return {'data': None, 'errors': [{'message': str(e)}]}
+
+        account, errors = {}, []
+        for alias, nrql in fields:
+            self.queries_served += 1
+            name = alias or 'nrql'
+            try:
+                account[name] = {'results': self.store.query(nrql, self.max_buckets)}
+            except NrqlError as e:
+                account[name] = None
+                errors.append({'message': str(e), 'path': ['actor', 'account', name]})
+
+        response = {'data': {'actor': {'account': account}}}
+        if errors:
+            response['errors'] = errors
+        return response
+
+    def execute(self, graphql):
+        """
+        Answer a query in process, sleeping for the artificial latency first.
+        """
+        time.sleep(self.delay(len(NRQL_FIELD_PATTERN.findall(graphql))))
+        return self.respond(graphql)
+
+    async def handle(self, request):
+        """
+        aiohttp handler of POST requests with a JSON body {"query": "..."}.
+        """
+        from aiohttp import web
+
+        try:
+            graphql = (await request.json())['query']
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'errors': [{'message': "Expected a JSON body with a 'query'."}]}, status=400)
+        await asyncio.sleep(self.delay(len(NRQL_FIELD_PATTERN.findall(graphql))))
+        return web.json_response(self.respond(graphql))
+
+    def application(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post('/graphql', self.handle)
+        return app
+
+
+class BackendServer:
+    """
+    Serves a MetricsBackend over HTTP from a background thread, on a free port by default:
+
+        with BackendServer(backend) as server:
+            collector = AsyncMetricsCollector(endpoint=server.url)
+    """
+
+    def __init__(self, backend, host='127.0.0.1', port=0):
+        self.backend = backend
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/graphql"
+
+    async def _start(self):
+        from aiohttp import web
+
+        self._runner = web.AppRunner(self.backend.application(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def dataset_windows(file_paths, sample_seconds):
+    """
+    Returns the (start, end, chaos_windows) export window of every dataset file, its chaos windows
+    being the runs of its marker column.
+    """
+    windows = []
+    for file_path in file_paths:
+        df = dataset_cache.load_experiment(file_path)
+        start = df.index[0].to_pydatetime()
+        end = df.index[-1].to_pydatetime() + pd.Timedelta(seconds=sample_seconds)
+        marker = next((column for column in ('cpu', 'io') if column in df.columns), None)
+        chaos_windows = []
+        if marker is not None:
+            active = df[marker].to_numpy() > 0
+            edges = np.flatnonzero(np.diff(np.concatenate([[False], active, [False]]).astype(int)))
+            for on, off in zip(edges[::2], edges[1::2]):
+                chaos_windows.append((df.index[on].to_pydatetime(),
+                                      df.index[on].to_pydatetime() + pd.Timedelta(seconds=sample_seconds * (off - on))))
+        windows.append((start, end, chaos_windows))
+    return windows
+
+
+def check(folder_path, experiment=None, sample_rate='30 second', **backend_options):
+    """
+    Export every dataset window of a folder through the extractor from a local server and compare
+    the exported datasets to the originals.
+
+    Returns:
+        dict: The files checked, the mismatching files, the largest absolute difference, the export
+              time and the GraphQL requests and queries served.
+    """
+    file_paths = dataset_cache.list_experiment_files(folder_path)
+    experiment = experiment or ('io' if all(os.path.basename(f).startswith('io_') for f in file_paths) else 'cpu')
+    store = TimeSeriesStore()
+    store.load(file_paths)
+    backend = MetricsBackend(store, **backend_options)
+
+    with BackendServer(backend) as server, tempfile.TemporaryDirectory() as output_dir:
+        windows = dataset_windows(file_paths, extractor.parse_sample_rate(sample_rate))
+        started = time.perf_counter()
+        exported = asyncio.run(extractor.export_windows(windows, output_dir, sample_rate, experiment,
+                                                        cache_path=None, endpoint=server.url, signals=SIGNALS))
+        export_seconds = time.perf_counter() - started
+
+        mismatches, max_difference = [], 0.0
+        for file_path, exported_path in zip(file_paths, exported):
+            expected = pd.read_csv(file_path, index_col=0)
+            actual = pd.read_csv(exported_path, index_col=0)
+            if not expected.index.equals(actual.index) or list(expected.columns) != list(actual.columns):
+                mismatches.append(os.path.basename(file_path))
+                continue
+            # The store holds the float32 values of the dataset cache
+            difference = np.abs(expected.to_numpy() - actual.to_numpy())
+            max_difference = max(max_difference, float(np.nanmax(difference, initial=0.0)))
+            if not np.allclose(expected.to_numpy(), actual.to_numpy(), rtol=1e-6, atol=1e-6, equal_nan=True):
+                mismatches.append(os.path.basename(file_path))
+
+    return {
+        'files': len(file_paths),
+        'mismatches': mismatches,
+        'max_difference': max_difference,
+        'export_seconds': export_seconds,
+        'requests': backend.requests_served,
+        'queries': backend.queries_served,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve experiment datasets as a local New Relic NRQL endpoint.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_backend_options(subparser):
+        subparser.add_argument('--latency', type=float, default=0.0, help="Seconds of latency per request")
+        subparser.add_argument('--latency-per-query', type=float, default=0.0,
+                               help="Seconds of latency per NRQL query of a request")
+        subparser.add_argument('--jitter', type=float, default=0.0, help="Seconds of random extra latency at most")
+        subparser.add_argument('--seed', type=int, default=None)
+
+    subparser = subparsers.add_parser('serve', help="Serve the datasets of folders over HTTP")
+    subparser.add_argument('folders', nargs='+')
+    subparser.add_argument('--host', default='127.0.0.1')
+    subparser.add_argument('--port', type=int, default=PORT)
+    add_backend_options(subparser)
+
+    subparser = subparsers.add_parser('check', help="Round-trip the datasets of a folder through the extractor")
+    subparser.add_argument('folder')
+    subparser.add_argument('--experiment', choices=['cpu', 'io'], default=None)
+    subparser.add_argument('--sample-rate', default='30 second')
+    add_backend_options(subparser)
+    args = parser.parse_args()
+
+    backend_options = {'latency_seconds': args.latency, 'latency_per_query_seconds': args.latency_per_query,
+                       'jitter_seconds': args.jitter, 'seed': args.seed}
+    if args.command == 'serve':
+        from aiohttp import web
+
+        backend = MetricsBackend(TimeSeriesStore.from_folders(args.folders), **backend_options)
+        print(f"{len(backend.store.times)} rows served at http://{args.host}:{args.port}/graphql")
+        web.run_app(backend.application(), host=args.host, port=args.port, print=None)
+    else:
+        result = check(args.folder, args.experiment, args.sample_rate, **backend_options)
+        print(f"{result['files']} files exported in {result['export_seconds']:.2f} s with {result['requests']} "
+              f"requests ({result['queries']} queries), largest difference {result['max_difference']:.2e}")
+        if result['mismatches']:
+            print(f"Mismatching exports: {', '.join(result['mismatches'])}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
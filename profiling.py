@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is the run-time switchable timing instrumentation of the analysis stages. Instrumented
+stages record their call count, wall time, CPU time and optionally their peak traced memory, per
+stage stack and per experiment file. Disabled, a stage costs a single flag check.
+
+Profiling is switched on with `enable()`, or for a whole run by setting CHAOS_PROFILE to the output
+path (`.json` for the JSON report, anything else for the collapsed stack format of flamegraph.pl,
+speedscope and similar tools), which is written when the process exits:
+
+    CHAOS_PROFILE=profile.folded python causality.py
+    CHAOS_PROFILE=profile.json CHAOS_PROFILE_MEMORY=1 python cli.py forecast datasets/cpu_experiments
+
+The stage stack is kept in a context variable, so concurrent asyncio tasks nest correctly. tracemalloc
+has a single peak for the whole process though, so the peak memory of a stage also counts what concurrent
+tasks allocated while it was open. Stages run in worker processes are recorded when the tasks are
+submitted with `submit` and collected with `result`.
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import json
+import time
+import atexit
+import inspect
+import functools
+import tracemalloc
+import multiprocessing
+import contextlib
+import contextvars
+
+ENABLED = False
+TRACE_MEMORY = False
+
+# (stage stack, file) -> [calls, wall seconds, CPU seconds, peak memory bytes above the start of the stage]
+_records = {}
+_stack = contextvars.ContextVar('profiling_stack', default=())
+_file = contextvars.ContextVar('profiling_file', default=None)
+# Peak traced memory of every open stage, of any task, up to the last reset of the tracemalloc peak
+_open_peaks = {}
+
+
+def enable(trace_memory=False):
+    """
+    Switch the instrumentation on. With trace_memory the peak memory of every stage is traced too,
+    which slows down allocation heavy code considerably.
+    """
+    global ENABLED, TRACE_MEMORY
+    ENABLED = True
+    TRACE_MEMORY = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    if TRACE_MEMORY and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    _records.clear()
+
+
+def _fold_peak():
+    # The tracemalloc peak is shared by the open stages of every task, so it is folded into all of them
+    # before a stage resets it
+    peak = tracemalloc.get_traced_memory()[1]
+    for key, open_peak in _open_peaks.items():
+        _open_peaks[key] = max(open_peak, peak)
+
+
+@contextlib.contextmanager
+def stage(name, file=None):
+    """
+    Record the enclosed block as the given stage, nested under the stages already open. The file,
+    if given, labels this stage and the stages nested in it.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    stack_token = _stack.set(_stack.get() + (name,))
+    file_token = _file.set(file) if file is not None else None
+    tracing = TRACE_MEMORY and tracemalloc.is_tracing()
+    if tracing:
+        memory_start = tracemalloc.get_traced_memory()[0]
+        _fold_peak()
+        tracemalloc.reset_peak()
+        peak_key = object()
+        _open_peaks[peak_key] = 0
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        peak = 0
+        if tracing:
+            _fold_peak()
+            peak = _open_peaks.pop(peak_key) - memory_start
+
+        record = _records.setdefault((_stack.get(), _file.get()), [0, 0.0, 0.0, 0])
+        record[0] += 1
+        record[1] += wall
+        record[2] += cpu
+        record[3] = max(record[3], peak)
+
+        if file_token is not None:
+            _file.reset(file_token)
+        _stack.reset(stack_token)
+
+
+def profiled(name=None, file_arg=None):
+    """
+    Decorator recording every call of a function as a stage, named after the function by default.
+    With file_arg, the argument of that name or position labels the stage with its experiment file.
+    Coroutine functions are recorded from the start of their first step to their return.
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+        code = func.__code__
+        arg_names = code.co_varnames[:code.co_argcount]
+
+        def file_of(args, kwargs):
+            if file_arg is None:
+                return None
+            if isinstance(file_arg, int):
+                return args[file_arg] if file_arg < len(args) else None
+            if file_arg in kwargs:
+                return kwargs[file_arg]
+            position = arg_names.index(file_arg)
+            return args[position] if position < len(args) else None
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await func(*args, **kwargs)
+                with stage(stage_name, file_of(args, kwargs)):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with stage(stage_name, file_of(args, kwargs)):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Returns a copy of the records as a list of (stage stack, file, calls, wall, CPU, peak memory) tuples.
+    """
+    return [(stack, file, *record) for (stack, file), record in _records.items()]
+
+
+def merge(records, parent=None):
+    """
+    Add records of another process, optionally nesting their stacks under the given parent stack.
+    """
+    parent = parent if parent is not None else _stack.get()
+    for stack, file, calls, wall, cpu, peak in records:
+        record = _records.setdefault((tuple(parent) + tuple(stack), file), [0, 0.0, 0.0, 0])
+        record[0] += calls
+        record[1] += wall
+        record[2] += cpu
+        record[3] = max(record[3], peak)
+
+
+def _call(enabled, trace_memory, func, *args):
+    if not enabled:
+        return func(*args), None
+    enable(trace_memory)
+    # A forked worker inherits the records and open stages of its parent
+    reset()
+    _stack.set(())
+    _file.set(None)
+    _open_peaks.clear()
+    try:
+        return func(*args), snapshot()
+    finally:
+        reset()
+
+
+def submit(executor, func, *args):
+    """
+    Submit a task to a process pool so the stages it runs in the worker are recorded when profiling.
+    The future must be collected with `result`.
+    """
+    return executor.submit(_call, ENABLED, TRACE_MEMORY, func, *args)
+
+
+def result(future):
+    """
+    Returns the result of a task submitted with `submit`, merging its records under the current stage.
+    """
+    value, records = future.result()
+    if records:
+        merge(records)
+    return value
+
+
+def stage_totals():
+    """
+    Returns the records summed over the files, as a dict from the ';' joined stage stack to its totals.
+    """
+    totals = {}
+    for (stack, file), (calls, wall, cpu, peak) in _records.items():
+        total = totals.setdefault(';'.join(stack), {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                   'peak_memory_bytes': 0})
+        total['calls'] += calls
+        total['wall_seconds'] += wall
+        total['cpu_seconds'] += cpu
+        total['peak_memory_bytes'] = max(total['peak_memory_bytes'], peak)
+    return totals
+
+
+def to_json():
+    return {
+        'trace_memory': TRACE_MEMORY,
+        'stages': stage_totals(),
+        'files': [{'stage': ';'.join(stack), 'file': file, 'calls': calls, 'wall_seconds': wall,
+                   'cpu_seconds': cpu, 'peak_memory_bytes': peak}
+                  for stack, file, calls, wall, cpu, peak in snapshot()],
+    }
+
+
+def to_collapsed():
+    """
+    Returns the records in the collapsed stack format, one 'stage;stage;stage microseconds' line per
+    stack, where the microseconds are the self time of the innermost stage.
+    """
+    totals = {tuple(stack.split(';')): total['wall_seconds'] for stack, total in stage_totals().items()}
+    self_times = dict(totals)
+    for stack, wall in totals.items():
+        if len(stack) > 1 and stack[:-1] in self_times:
+            self_times[stack[:-1]] -= wall
+    return ''.join(f"{';'.join(stack)} {max(int(round(wall * 1e6)), 0)}\n"
+                   for stack, wall in sorted(self_times.items()))
+
+
+def save(path):
+    """
+    Write the records to the given path, as JSON if it ends in '.json' and as collapsed stacks otherwise.
+    """
+    with open(path, 'w') as f:
+        if path.endswith('.json'):
+            json.dump(to_json(), f, indent=2)
+        else:
+            f.write(to_collapsed())
+
+
+def report():
+    """
+    Returns a table of the stages sorted by wall time.
+    """
+    lines = [f"{'calls':>8} {'wall s':>10} {'cpu s':>10} {'peak MiB':>9}  stage"]
+    for stack, total in sorted(stage_totals().items(), key=lambda item: -item[1]['wall_seconds']):
+        lines.append(f"{total['calls']:>8} {total['wall_seconds']:>10.4f} {total['cpu_seconds']:>10.4f} "
+                     f"{total['peak_memory_bytes'] / 2 ** 20:>9.2f}  {stack}")
+    return '\n'.join(lines)
+
+
+# Worker processes inherit the variable, their records are collected by `result` instead
+if os.environ.get('CHAOS_PROFILE') and multiprocessing.parent_process() is None:
+    enable(trace_memory=os.environ.get('CHAOS_PROFILE_MEMORY') == '1')
+    atexit.register(save, os.environ['CHAOS_PROFILE'])
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module puts uncertainty on the campaign results of correlation.py and causality.py by
+resampling the experiments, and corrects the significance counts for the many (file, column)
+tests they make.
+
+- Correlations: every experiment is resampled with the moving block bootstrap, which keeps the
+  autocorrelation within blocks. The correlations of a resample are averaged over the files like
+  `CorrelationAggregate.mean`, giving percentile confidence intervals of the campaign mean and a
+  bootstrap p-value of a zero mean, corrected over the features.
+- Granger causality: the null distribution of the minimum SSR F-test p-value of every (file, column)
+  pair of `causality.evaluate_columns` is drawn by permuting the blocks of the second series of the
+  pair, the one whose Granger causality is tested. That breaks the dependence between the series but
+  keeps their own short-range structure. The permutation p-values, which also account for taking
+  the minimum over the lags, are corrected over all pairs of the campaign before they are counted.
+
+Resamples are drawn as index arrays and evaluated for a chunk of them at once. Every file is a task
+of a process pool, and its random streams are seeded from the seed and its content hash, so the results
+do not depend on the number of workers or on the order of the files. Every Granger pair of a file has
+its own stream, spawned from that of the file, so the null distributions of its pairs are independent.
+
+    python cli.py significance datasets/cpu_experiments --test granger --resamples 2000
+
+Author: dhruvshetty213@gmail.com
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from statsmodels.stats.multitest import multipletests
+
+import causality
+import change_points
+import correlation
+import dataset_cache
+import granger_kernel
+import profiling
+
+N_RESAMPLES = 2000
+CHUNK_SIZE = 250
+CONFIDENCE = 0.95
+CORRECTION = 'fdr_bh'  # Any method of statsmodels' multipletests, e.g. 'holm' or 'bonferroni'
+SEED = 0
+
+
+def default_block_length(n):
+    return max(1, int(round(n ** (1 / 3))))
+
+
+def file_rng(file_path, seed, chunk):
+    """
+    Returns the random generator of a chunk of resamples of a file, seeded from its content hash.
+    """
+    return np.random.default_rng([seed, int(dataset_cache.content_hash(file_path)[:16], 16), chunk])
+
+
+def pair_rngs(file_path, seed, n_pairs):
+    """
+    Returns independent random generators for the pairs of a file, spawned from its seed and content hash.
+    """
+    sequence = np.random.SeedSequence([seed, int(dataset_cache.content_hash(file_path)[:16], 16)])
+    return [np.random.default_rng(child) for child in sequence.spawn(n_pairs)]
+
+
+def block_bootstrap_indices(n, n_resamples, block_length, rng):
+    """
+    Returns the row indices of circular moving block bootstrap resamples, shape (n_resamples, n).
+    """
+    n_blocks = -(-n // block_length)
+    starts = rng.integers(0, n, size=(n_resamples, n_blocks))
+    return ((starts[:, :, None] + np.arange(block_length)) % n).reshape(n_resamples, -1)[:, :n]
+
+
+def block_permutation_indices(n, n_resamples, block_length, rng):
+    """
+    Returns the row indices of random permutations of the consecutive blocks of n rows, shape (n_resamples, n).
+    """
+    n_blocks = -(-n // block_length)
+    order = np.argsort(rng.random((n_resamples, n_blocks)), axis=1)
+    indices = (order[:, :, None] * block_length + np.arange(block_length)).reshape(n_resamples, -1)
+    # Every row keeps the n indices left after dropping the overhang of the last block
+    return indices[indices < n].reshape(n_resamples, n)
+
+
+def resampled_correlations(values, target, indices):
+    """
+    Returns the Pearson and Spearman correlations of every column with the target column in every
+    resample, as two arrays of shape (resamples, columns).
+    """
+    resamples, n = indices.shape
+    columns = values.shape[1]
+    resampled = values[indices]
+
+    def pearson(data):
+        centered = data - data.mean(axis=1, keepdims=True)
+        centered_target = centered[:, :, target]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (np.einsum('rnk,rn->rk', centered, centered_target)
+                    / (np.linalg.norm(centered, axis=1) * np.linalg.norm(centered_target, axis=1)[:, None]))
+
+    # Ranking all resamples at once, a resample's columns sit side by side in one 2-D array
+    ranks = correlation.rank_columns(resampled.transpose(1, 0, 2).reshape(n, resamples * columns))
+    return pearson(resampled), pearson(ranks.reshape(n, resamples, columns).transpose(1, 0, 2))
+
+
+@profiling.profiled('bootstrap_file', file_arg='file_path')
+def _bootstrap_file_task(file_path, metric, columns_to_exclude, n_resamples, block_length, seed, phases=None):
+    data = change_points.load_phases(file_path, phases).drop(columns_to_exclude, axis=1)
+    values = data.to_numpy(dtype=np.float64)
+    target = data.columns.get_loc(metric)
+    n = len(values)
+    block_length = block_length or default_block_length(n)
+
+    pearson, spearman = [], []
+    for chunk, start in enumerate(range(0, n_resamples, CHUNK_SIZE)):
+        indices = block_bootstrap_indices(n, min(CHUNK_SIZE, n_resamples - start), block_length,
+                                          file_rng(file_path, seed, chunk))
+        chunk_pearson, chunk_spearman = resampled_correlations(values, target, indices)
+        pearson.append(chunk_pearson)
+        spearman.append(chunk_spearman)
+    return list(data.columns), np.vstack(pearson), np.vstack(spearman)
+
+
+@profiling.profiled()
+def correlation_intervals(file_paths, metric, columns_to_exclude, n_resamples=N_RESAMPLES, block_length=None,
+                          confidence=CONFIDENCE, correction=CORRECTION, seed=SEED, max_workers=None, phases=None):
+    """
+    Block bootstrap confidence intervals of the mean correlations of a metric with every feature over the files.
+
+    Parameters:
+        file_paths (list): The locations of the CSV files containing the time series data.
+        metric (str): The metric to correlate the features with.
+        columns_to_exclude (list): The columns to leave out, as in correlation.py.
+        n_resamples (int): The number of bootstrap resamples of every file.
+        block_length (int): The length of the bootstrap blocks, the cube root of the rows by default.
+        confidence (float): The coverage of the percentile intervals.
+        correction (str): The multiple comparison correction of the p-values over the features and methods.
+        seed (int): The seed of the resamples.
+        max_workers (int): The number of worker processes, defaults to the number of CPUs.
+        phases (list): The phases of the experiments to resample (see change_points.py), defaults to all rows.
+
+    Returns:
+        DataFrame: One row per (method, feature) with the mean correlation over the files, the interval
+                   bounds ('ci_low', 'ci_high'), the bootstrap p-value of a zero mean ('p_value'), the
+                   corrected one ('p_corrected') and whether it is significant at causality.SIGNIFICANCE_LEVEL.
+    """
+    aggregate = correlation.aggregate_file_correlations(file_paths, metric, columns_to_exclude, phases)
+    sums = {'pearson': 0.0, 'spearman': 0.0}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [profiling.submit(executor, _bootstrap_file_task, file_path, metric, columns_to_exclude,
+                                    n_resamples, block_length, seed, phases)
+                   for file_path in file_paths]
+        for future in futures:
+            columns, pearson, spearman = profiling.result(future)
+            if columns != aggregate.features:
+                raise ValueError(f"Columns {columns} do not match the columns of the previous files.")
+            sums['pearson'] = sums['pearson'] + pearson
+            sums['spearman'] = sums['spearman'] + spearman
+
+    alpha = 1 - confidence
+    rows = []
+    for method, total in sums.items():
+        means = total / len(file_paths)
+        low, high = np.nanpercentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        valid = np.sum(~np.isnan(means), axis=0)
+        # Two-sided: twice the smaller share of resampled means on either side of zero
+        p_values = np.minimum(1.0, 2 * np.minimum(
+            (np.sum(means <= 0, axis=0) + 1) / (valid + 1), (np.sum(means >= 0, axis=0) + 1) / (valid + 1)))
+        for feature, mean, ci_low, ci_high, p_value in zip(
+                aggregate.features, aggregate.mean(method), low, high, p_values):
+            rows.append((method, feature, mean, ci_low, ci_high, p_value))
+
+    intervals = pd.DataFrame(rows, columns=['method', 'feature', 'mean', 'ci_low', 'ci_high', 'p_value'])
+    # The metric is perfectly correlated with itself in every resample and is not a test
+    tested = intervals['feature'] != metric
+    intervals.loc[~tested, 'p_value'] = np.nan
+    intervals['p_corrected'] = np.nan
+    intervals.loc[tested, 'p_corrected'] = correct(intervals.loc[tested, 'p_value'], correction)
+    intervals['significant'] = intervals['p_corrected'] < causality.SIGNIFICANCE_LEVEL
+    return intervals
+
+
+def permuted_min_p_values(pair, k_ar, indices):
+    """
+    Returns the minimum rounded SSR F-test p-value over lags 1 to k_ar of every resample of a
+    (column, apdex) pair whose apdex rows are reordered by the given indices.
+    """
+    resamples = np.empty((len(indices),) + pair.shape)
+    resamples[:, :, 0] = pair[:, 0]
+    resamples[:, :, 1] = pair[indices, 1]
+    return np.round(granger_kernel.granger_ssr_ftest_pvalues(resamples, k_ar), 4).min(axis=1)
+
+
+@profiling.profiled('permutation_file', file_arg='file_path')
+def _permutation_file_task(file_path, columns, n_resamples, block_length, seed, phases=None):
+    data = change_points.load_phases(file_path, phases)
+    pair_results = causality.evaluate_columns(data, columns)
+    data = data.astype(np.float64)
+
+    results = {}
+    for (column, pair_result), rng in zip(pair_results.items(), pair_rngs(file_path, seed, len(pair_results))):
+        result = dict(pair_result, permutation_p_value=None)
+        if pair_result['min_p_value'] is not None:
+            pair = data[[column, 'apdex']].to_numpy()
+            if pair_result['differenced']:
+                pair = np.diff(pair, axis=0)
+            n = len(pair)
+            exceeded = 0
+            for start in range(0, n_resamples, CHUNK_SIZE):
+                indices = block_permutation_indices(n, min(CHUNK_SIZE, n_resamples - start),
+                                                    block_length or default_block_length(n), rng)
+                null = permuted_min_p_values(pair, pair_result['k_ar'], indices)
+                exceeded += int(np.sum(null <= pair_result['min_p_value']))
+            result['permutation_p_value'] = (exceeded + 1) / (n_resamples + 1)
+        results[column] = result
+    return file_path, results
+
+
+def correct(p_values, method=CORRECTION):
+    """
+    Returns the p-values corrected for multiple comparisons, NaN where a p-value is missing.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    corrected = np.full(p_values.shape, np.nan)
+    valid = ~np.isnan(p_values)
+    if valid.any():
+        corrected[valid] = multipletests(p_values[valid], method=method)[1]
+    return corrected
+
+
+@profiling.profiled()
+def granger_significance(file_paths, columns_to_exclude, n_resamples=N_RESAMPLES, block_length=None,
+                         correction=CORRECTION, seed=SEED, max_workers=None, phases=None):
+    """
+    Permutation p-values of the Granger Causality tests of every (file, column) pair against 'apdex',
+    corrected for multiple comparisons over all pairs of the campaign.
+
+    Parameters:
+        file_paths (list): The locations of the CSV files containing the time series data.
+        columns_to_exclude (list): The list of column names to exclude from the data before performing tests.
+        n_resamples (int): The number of block permutations of every pair.
+        block_length (int): The length of the permuted blocks, the cube root of the rows by default.
+        correction (str): The multiple comparison correction, any method of statsmodels' multipletests.
+        seed (int): The seed of the permutations.
+        max_workers (int): The number of worker processes, defaults to the number of CPUs.
+        phases (list): The phases of the experiments to test on (see change_points.py), defaults to all rows.
+
+    Returns:
+        DataFrame: One row per (file, column) pair with the result of `causality.evaluate_columns`, the
+                   permutation p-value, and the parametric and permutation p-values corrected over all pairs.
+                   Pairs without a selected lag have no p-values.
+    """
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [profiling.submit(executor, _permutation_file_task, file_path,
+                                    list(dataset_cache.experiment_columns(file_path).drop(columns_to_exclude).drop('apdex')),
+                                    n_resamples, block_length, seed, phases)
+                   for file_path in file_paths]
+        for future in futures:
+            file_path, results = profiling.result(future)
+            rows.extend({'file': file_path, 'column': column, **result} for column, result in results.items())
+
+    table = pd.DataFrame(rows, columns=['file', 'column', 'differenced', 'k_ar', 'min_p_value', 'permutation_p_value'])
+    table['min_p_corrected'] = correct(table['min_p_value'], correction)
+    table['permutation_p_corrected'] = correct(table['permutation_p_value'], correction)
+    return table
+
+
+def significance_counts(table, p_value_column='permutation_p_corrected', significance_level=None):
+    """
+    Returns the number of files in which every column is significant by the given p-value column of
+    `granger_significance`, like the counts of `causality.run_granger_causality_batch`.
+    """
+    significance_level = causality.SIGNIFICANCE_LEVEL if significance_level is None else significance_level
+    significant = table[table[p_value_column] < significance_level]
+    return significant.groupby('column', sort=False).size().to_dict()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This module is the out-of-core mode of the analysis scripts, for experiments too long to hold in a
+DataFrame, such as multi-day runs sampled every second across many services. Instead of loading an
+experiment and chaining `astype`, `diff` and `copy` on it, the experiment is streamed in chunks of
+CHUNK_ROWS rows from its memory-mapped cache (dataset_cache.py), and every analysis only keeps the
+sufficient statistics it needs:
+
+- Pearson correlations: the counts, means and co-moments of every column with the metric
+  (PairwiseMoments), merged chunk by chunk.
+- ADF differencing decisions: the cross-products of the ADF regression of every column (StreamedADF),
+  from which the AIC lag selection and the test statistic of `adfuller` are solved.
+- VAR lag order selection and Granger Causality tests: the cross-product matrix of the lagged design of
+  the VAR (LaggedCrossProducts), which the `*_from_cross_products` functions of granger_kernel.py take.
+
+Differenced series are produced chunk by chunk as well (ChunkDifferencer). The memory then depends on
+the chunk size and the number of columns and lags, not on the length of the experiment, and the
+results match the in-memory path up to floating point round-off. Spearman correlations are the
+exception: ranks need a whole column, so correlation.py ranks one column at a time (`column_values`).
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import numpy as np
+from statsmodels.tsa.adfvalues import mackinnonp
+
+import change_points
+import dataset_cache
+import granger_kernel
+
+CHUNK_ROWS = 100000
+RANK_TOLERANCE = 1e-12  # Relative eigenvalue below which a direction of scaled cross-products is rank deficient
+
+
+def row_ranges(file_path, n_rows, phases=None):
+    """
+    Returns the (start, stop) row ranges of the given phases of an experiment of n_rows rows, in order,
+    as `change_points.phase_mask` selects them. Without phases the whole experiment is one range.
+    """
+    if phases is None:
+        return [(0, n_rows)]
+    mask = change_points.phase_mask(change_points.load_segment_index(file_path), n_rows, phases)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def count_rows(file_path, phases=None):
+    """
+    Returns the number of rows of the given phases of an experiment, without reading its metrics.
+    """
+    _, metrics, _ = dataset_cache.load_arrays(file_path)
+    return sum(stop - start for start, stop in row_ranges(file_path, len(metrics), phases))
+
+
+def iter_chunks(file_path, columns=None, phases=None, chunk_rows=CHUNK_ROWS):
+    """
+    Yields the metrics of an experiment in order, as float64 arrays of at most chunk_rows rows.
+
+    Parameters:
+        file_path (str): The location of the CSV file containing the time series data.
+        columns (list): The metric columns to read, defaults to all of them.
+        phases (list): The phases of the experiment to read (see change_points.py), defaults to all rows.
+        chunk_rows (int): The largest number of rows of a chunk.
+    """
+    _, metrics, meta = dataset_cache.load_arrays(file_path)
+    selection = slice(None) if columns is None else [meta['columns'].index(column) for column in columns]
+    for start, stop in row_ranges(file_path, len(metrics), phases):
+        for chunk_start in range(start, stop, chunk_rows):
+            yield metrics[chunk_start:min(chunk_start + chunk_rows, stop), selection].astype(np.float64)
+
+
+def column_values(file_path, column, phases=None):
+    """
+    Returns one column of an experiment as a float64 array, read from its memory-mapped cache.
+    """
+    _, metrics, meta = dataset_cache.load_arrays(file_path)
+    index = meta['columns'].index(column)
+    ranges = row_ranges(file_path, len(metrics), phases)
+    return np.concatenate([metrics[start:stop, index] for start, stop in ranges]).astype(np.float64)
+
+
+class PairwiseMoments:
+    """
+    Streamed counts, means and centered second moments of every column and a target column, over the
+    rows where both are present, like the pairwise complete observations of pandas' `corrwith`. The
+    moments of every chunk are merged with the update of Chan, Golub and LeVeque, which does not suffer
+    from the cancellation of raw sums of squares.
+    """
+
+    def __init__(self, n_columns):
+        self.count = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.target_mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.target_m2 = np.zeros(n_columns)
+        self.comoment = np.zeros(n_columns)
+
+    def update(self, values, target):
+        """
+        Add the rows of a chunk of shape (rows, columns) and of its target column of shape (rows,).
+        """
+        present = ~np.isnan(values) & ~np.isnan(target)[:, None]
+        count = present.sum(axis=0)
+        merged = count > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(present, values, 0.0).sum(axis=0) / count
+            target_mean = np.where(present, target[:, None], 0.0).sum(axis=0) / count
+            deviations = np.where(present, values - mean, 0.0)
+            target_deviations = np.where(present, target[:, None] - target_mean, 0.0)
+
+        total = self.count + count
+        weight = np.divide(count, total, out=np.zeros_like(total), where=merged)
+        delta = np.where(merged, mean - self.mean, 0.0)
+        target_delta = np.where(merged, target_mean - self.target_mean, 0.0)
+        between = self.count * weight
+
+        self.m2 += np.sum(deviations ** 2, axis=0) + delta ** 2 * between
+        self.target_m2 += np.sum(target_deviations ** 2, axis=0) + target_delta ** 2 * between
+        self.comoment += np.sum(deviations * target_deviations, axis=0) + delta * target_delta * between
+        self.mean += delta * weight
+        self.target_mean += target_delta * weight
+        self.count = total
+
+    def correlation(self):
+        """
+        Returns the Pearson correlation of every column with the target, NaN for constant columns.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.comoment / np.sqrt(self.m2 * self.target_m2)
+
+
+class LaggedCrossProducts:
+    """
+    Streamed cross-product matrix of the rows [1, exog_t, y_t-1, ..., y_t-L, y_t] of a lagged regression
+    of the series y, over t >= L = max_lag. The lag columns are ordered like granger_kernel.lag_matrix,
+    and the optional exogenous columns, such as the level of an ADF regression, are aligned with y.
+
+    The first max_lag rows are kept, so the cross-products of any lag order on a sample starting at or
+    before max_lag are completed without another pass over the data. The values are shifted by the first
+    row, which leaves every regression with a constant unchanged but keeps the sums from cancelling, and
+    the means and variances of y are kept to standardize the matrix like granger_kernel.var_cross_products.
+
+        cross_products = LaggedCrossProducts(neqs, max_lag)
+        for chunk in iter_chunks(file_path, columns):
+            cross_products.update(chunk)
+        gram = cross_products.standardized(lag_order, lag_order)
+    """
+
+    def __init__(self, neqs, max_lag, n_exog=0):
+        self.neqs = neqs
+        self.max_lag = max_lag
+        self.n_exog = n_exog
+        self.gram = np.zeros((1 + n_exog + neqs * (max_lag + 1),) * 2)
+        self.head = np.empty((0, n_exog + neqs))
+        self.tail = np.empty((0, n_exog + neqs))
+        self.shift = None
+        self.n_rows = 0
+        self.mean = np.zeros(neqs)
+        self.m2 = np.zeros(neqs)
+
+    def update(self, y, exog=None):
+        """
+        Add the rows of a chunk of the series, of shape (rows, neqs), and of its exogenous columns.
+        """
+        rows = np.asarray(y, dtype=float) if exog is None else np.hstack([exog, y]).astype(float)
+        if not len(rows):
+            return
+        if self.shift is None:
+            self.shift = rows[0].copy()
+        rows = rows - self.shift
+
+        if len(self.head) < self.max_lag:
+            self.head = np.vstack([self.head, rows[:self.max_lag - len(self.head)]])
+
+        values = rows[:, self.n_exog:]
+        count = len(values)
+        mean = values.mean(axis=0)
+        delta = mean - self.mean
+        total = self.n_rows + count
+        self.m2 += np.sum((values - mean) ** 2, axis=0) + delta ** 2 * self.n_rows * count / total
+        self.mean += delta * count / total
+        self.n_rows = total
+
+        # The carried rows of the previous chunk provide the lags of the first rows of this one
+        window = np.vstack([self.tail, rows])
+        self.gram += self._cross_products(window, self.max_lag, self.max_lag)
+        self.tail = window[max(len(window) - self.max_lag, 0):]
+
+    def _cross_products(self, window, lag_order, start):
+        # Products of the column blocks of the design, without materializing its lagged copies
+        n = len(window)
+        size = 1 + self.n_exog + (lag_order + 1) * (window.shape[1] - self.n_exog)
+        if n <= start:
+            return np.zeros((size, size))
+        y = window[:, self.n_exog:]
+        blocks = [np.ones((n - start, 1)), window[start:, :self.n_exog]]
+        blocks += [y[start - lag:n - lag] for lag in range(1, lag_order + 1)] + [y[start:]]
+
+        offsets = np.cumsum([0] + [block.shape[1] for block in blocks])
+        gram = np.empty((size, size))
+        for i, block in enumerate(blocks):
+            for j in range(i, len(blocks)):
+                product = block.T @ blocks[j]
+                gram[offsets[i]:offsets[i + 1], offsets[j]:offsets[j + 1]] = product
+                gram[offsets[j]:offsets[j + 1], offsets[i]:offsets[i + 1]] = product.T
+        return gram
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.n_rows)
+
+    def nobs(self, start=None):
+        """
+        Returns the number of regression rows of a sample starting at the given row, max_lag by default.
+        """
+        return self.n_rows - (self.max_lag if start is None else start)
+
+    def cross_products(self, lag_order=None, start=None, variables=None):
+        """
+        Returns the cross-product matrix of [1, exog, lags 1 to lag_order, responses] of the given variables,
+        over the rows from start on. The lag order defaults to max_lag, and start to max_lag.
+        """
+        lag_order = self.max_lag if lag_order is None else lag_order
+        start = self.max_lag if start is None else start
+        if not 0 <= lag_order <= start <= self.max_lag:
+            raise ValueError(f"Expected 0 <= lag order ({lag_order}) <= start ({start}) <= max_lag ({self.max_lag}).")
+        if self.n_rows <= self.max_lag:
+            raise ValueError(f"Insufficient observations for {self.max_lag} lags, got {self.n_rows}.")
+
+        variables = np.arange(self.neqs) if variables is None else np.asarray(variables)
+        base = 1 + self.n_exog
+        columns = np.concatenate([np.arange(base)] + [base + (lag - 1) * self.neqs + variables
+                                                      for lag in range(1, lag_order + 1)]
+                                 + [base + self.max_lag * self.neqs + variables])
+        gram = self.gram[np.ix_(columns, columns)]
+        if start < self.max_lag:
+            head = np.hstack([self.head[:, :self.n_exog], self.head[:, self.n_exog + variables]])
+            gram = gram + self._cross_products(head, lag_order, start)
+        return gram
+
+    def standardized(self, lag_order=None, start=None, variables=None):
+        """
+        Returns `cross_products` with the series standardized by their mean and standard deviation over all
+        rows, equal to granger_kernel.var_cross_products of the series without exogenous columns.
+        """
+        gram = self.cross_products(lag_order, start, variables)
+        variables = np.arange(self.neqs) if variables is None else np.asarray(variables)
+        std = self.std[variables]
+        base = 1 + self.n_exog
+
+        # Maps every row of the design to its standardized row, the constant absorbs the means
+        transform = np.eye(len(gram))
+        series_columns = np.arange(base, len(gram))
+        transform[series_columns, series_columns] = np.tile(1 / std, len(series_columns) // len(variables))
+        transform[series_columns, 0] = np.tile(-self.mean[variables] / std, len(series_columns) // len(variables))
+        return transform @ gram @ transform.T
+
+
+def aic_by_lag_order(cross_products, variables=None):
+    """
+    Returns the VAR AIC of every lag order from 0 to max_lag of the given variables of the streamed
+    series, as granger_kernel.aic_by_lag_order computes it on the series.
+    """
+    variables = np.arange(cross_products.neqs) if variables is None else np.asarray(variables)
+    gram = cross_products.standardized(variables=variables)
+    aic = granger_kernel.aic_from_cross_products(gram, cross_products.nobs(), len(variables), cross_products.max_lag)
+    # The AIC of the standardized series differs by the log-determinant of the scaling
+    return aic + 2 * np.sum(np.log(cross_products.std[variables]))
+
+
+def select_lag_order(cross_products, variables=None):
+    """
+    Select the VAR lag order of the given variables of the streamed series minimizing the AIC, as
+    granger_kernel.select_lag_order does on the series.
+    """
+    return int(np.argmin(aic_by_lag_order(cross_products, variables)))
+
+
+def adf_max_lag(n_rows):
+    """
+    Returns the largest lag of the autolag search of `adfuller(x, regression='c')` on n_rows observations.
+    """
+    max_lag = int(np.ceil(12.0 * np.power(n_rows / 100.0, 1 / 4.0)))
+    return min(n_rows // 2 - 2, max_lag)
+
+
+def _pseudo_inverse(matrix):
+    """
+    Invert a symmetric positive semi-definite block of a cross-product matrix, scaled to a unit diagonal first.
+    Directions with a relative eigenvalue below RANK_TOLERANCE, as constant or collinear lags produce, are
+    dropped, which yields the minimum norm solution like lstsq instead of amplified round-off.
+
+    Returns:
+        tuple: The (pseudo-)inverse and the numerical rank of the matrix.
+    """
+    scale = np.sqrt(np.diag(matrix))
+    scale[scale == 0] = 1.0
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix / np.outer(scale, scale))
+    kept = eigenvalues > eigenvalues.max(initial=0) * RANK_TOLERANCE
+    inverse = (eigenvectors[:, kept] / eigenvalues[kept]) @ eigenvectors[:, kept].T
+    return inverse / np.outer(scale, scale), int(kept.sum())
+
+
+def _least_squares(gram, k):
+    # Regression of the last column of a cross-product matrix on its first k columns, dropping directions
+    # the regressors do not span like the pinv of statsmodels' OLS, which also reports the rank
+    inverse, rank = _pseudo_inverse(gram[:k, :k])
+    params = inverse @ gram[:k, -1]
+    ssr = max(gram[-1, -1] - gram[:k, -1] @ params, 0.0)
+    return params, ssr, inverse, rank
+
+
+class StreamedADF:
+    """
+    Augmented Dickey-Fuller test with a constant and AIC lag selection, as `adfuller(x)` computes it, on
+    a series of n_rows observations streamed in chunks. The differences are regressed on the level and
+    the lagged differences, and all the regressions of the lag search are solved from one cross-product
+    matrix of that design.
+    """
+
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self.max_lag = adf_max_lag(n_rows)
+        if self.max_lag < 0:
+            raise ValueError("sample size is too short to use selected regression component")
+        self.cross_products = LaggedCrossProducts(1, self.max_lag, n_exog=1)
+        self.previous = None
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        if not len(x):
+            return
+        self.minimum = min(self.minimum, np.nanmin(x, initial=np.inf))
+        self.maximum = max(self.maximum, np.nanmax(x, initial=-np.inf))
+        levels = x if self.previous is None else np.concatenate(([self.previous], x))
+        self.previous = x[-1]
+        # The difference from row t to t + 1 is explained by the level of row t
+        self.cross_products.update(np.diff(levels)[:, None], levels[:-1, None])
+
+    @property
+    def constant(self):
+        # Missing values are skipped like pandas' std() does, so an empty series is constant too
+        return not self.maximum > self.minimum
+
+    def statistic(self):
+        """
+        Returns the ADF test statistic and the selected lag.
+        """
+        if self.constant:
+            raise ValueError("Invalid input, x is constant")
+
+        # Every lag order is compared on the same sample, like statsmodels' _autolag
+        gram = self.cross_products.cross_products()
+        nobs = self.cross_products.nobs()
+        aic = []
+        for lag in range(self.max_lag + 1):
+            k = 2 + lag
+            _, ssr, _, rank = _least_squares(gram[np.ix_([*range(k), -1], [*range(k), -1])], k)
+            with np.errstate(divide='ignore'):
+                llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+            aic.append(-2 * llf + 2 * rank)
+        best_lag = int(np.argmin(aic))
+
+        # The selected lag is refitted on all the rows it can use
+        k = 2 + best_lag
+        params, ssr, inverse, rank = _least_squares(self.cross_products.cross_products(best_lag, best_lag), k)
+        sigma2 = ssr / (self.cross_products.nobs(best_lag) - rank)
+        return params[1] / np.sqrt(sigma2 * inverse[1, 1]), best_lag
+
+    def pvalue(self):
+        """
+        Returns the MacKinnon approximate p-value of the test, `adfuller(x)[1]`.
+        """
+        return mackinnonp(self.statistic()[0], regression='c', N=1)
+
+
+def adf_tests(chunks, n_columns, n_rows):
+    """
+    Streams the given chunks of shape (rows, n_columns) through one StreamedADF per column.
+
+    Returns:
+        list: The StreamedADF of every column.
+    """
+    tests = [StreamedADF(n_rows) for _ in range(n_columns)]
+    for chunk in chunks:
+        for test, column in zip(tests, chunk.T):
+            test.update(column)
+    return tests
+
+
+class ChunkDifferencer:
+    """
+    Differences the given columns of streamed chunks, carrying the last row of every chunk into the
+    next one. The first row of the series has no difference and is dropped from all columns, unless no
+    column is differenced and drop_first is False.
+    """
+
+    def __init__(self, differenced, drop_first=None):
+        self.differenced = np.asarray(differenced, dtype=bool)
+        self.drop_first = bool(self.differenced.any()) if drop_first is None else drop_first
+        if self.differenced.any() and not self.drop_first:
+            raise ValueError("The first row of differenced columns has to be dropped.")
+        self.previous = None
+
+    def apply(self, chunk):
+        if not len(chunk):
+            return chunk
+        levels = chunk if self.previous is None else np.vstack([self.previous, chunk])
+        first_chunk = self.previous is None
+        self.previous = chunk[-1:]
+        if first_chunk and not self.drop_first:
+            return chunk
+        values = levels[1:].copy()
+        values[:, self.differenced] -= levels[:-1, self.differenced]
+        return values
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script generates synthetic chaos experiment datasets with the columns, value ranges
+and file names of the recorded ones in datasets/, at any number of rows and files. The
+chaos marker switches on and off in bursts after a fault-free baseline, and the injected
+fault drives the metrics through a configurable lagged causal structure, so the analysis
+scripts have known causes to recover.
+
+    python synthetic_datasets.py /tmp/synthetic --files 100 --rows 2000 --experiment io
+
+Author: dhruvshetty213@gmail.com
+"""
+
+import os
+import argparse
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+COLUMNS = ['errors', 'latency', 'traffic', 'average.cpuPercent_x', 'average.cpuPercent_y',
+           'average.memoryUsedPercent_x', 'average.memoryUsedPercent_y', 'tsr', 'apdex']
+
+# Mean and standard deviation of each metric, close to the recorded CPU experiments
+LEVELS = {
+    'errors': (0.0, 0.05),
+    'latency': (1.0, 0.3),
+    'traffic': (170.0, 25.0),
+    'average.cpuPercent_x': (45.0, 8.0),
+    'average.cpuPercent_y': (17.0, 5.0),
+    'average.memoryUsedPercent_x': (43.0, 1.0),
+    'average.memoryUsedPercent_y': (31.0, 1.0),
+    'tsr': (100.0, 0.1),
+    'apdex': (0.85, 0.05),
+}
+
+# (cause, effect, lag in steps, strength in standard deviations of the effect per standard deviation of the cause)
+DEFAULT_CAUSAL_EDGES = [
+    ('chaos', 'average.cpuPercent_x', 1, 2.5),
+    ('traffic', 'average.cpuPercent_x', 1, 0.4),
+    ('average.cpuPercent_x', 'latency', 1, 0.8),
+    ('traffic', 'latency', 2, 0.3),
+    ('latency', 'apdex', 1, -0.9),
+    ('average.cpuPercent_x', 'average.cpuPercent_y', 2, 0.3),
+]
+
+SAMPLE_SECONDS = 30
+BASELINE_ROWS = 10
+BURST_ROWS = 4
+AUTOREGRESSION = 0.6
+
+
+def chaos_marker(n_rows, baseline_rows=BASELINE_ROWS, burst_rows=BURST_ROWS):
+    """
+    Returns the chaos marker column: off for the baseline, then alternating on and off bursts.
+    """
+    steps = np.arange(n_rows) - baseline_rows
+    return np.where((steps >= 0) & (steps // burst_rows % 2 == 0), 1.0, 0.0)
+
+
+def generate_experiment(n_rows, experiment='cpu', causal_edges=DEFAULT_CAUSAL_EDGES, seed=None,
+                        start=datetime(2023, 6, 27, 8, 49, tzinfo=timezone.utc)):
+    """
+    Generate one synthetic chaos experiment.
+
+    Every metric is an AR(1) process in standardized units plus the lagged effects of its causes,
+    which are applied in the order of causal_edges. The 'chaos' cause is the chaos marker.
+
+    Parameters:
+        n_rows (int): The number of 30 second samples.
+        experiment (str): The name of the chaos marker column, 'cpu' or 'io'.
+        causal_edges (list): The (cause, effect, lag, strength) edges of the causal structure.
+        seed (int): The seed of the random generator.
+        start (datetime): The timestamp of the first sample.
+
+    Returns:
+        DataFrame: The experiment indexed by 'timestamp', with the columns of the recorded datasets.
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal((n_rows, len(COLUMNS)))
+    autoregressive = lfilter([1.0], [1.0, -AUTOREGRESSION], noise, axis=0)
+    standardized = {column: autoregressive[:, i] for i, column in enumerate(COLUMNS)}
+
+    standardized['chaos'] = chaos_marker(n_rows)
+    for cause, effect, lag, strength in causal_edges:
+        shifted = np.zeros(n_rows)
+        shifted[lag:] = standardized[cause][:n_rows - lag]
+        standardized[effect] = standardized[effect] + strength * shifted
+
+    data = {}
+    for column in COLUMNS:
+        mean, std = LEVELS[column]
+        data[column] = mean + std * standardized[column]
+
+    data['errors'] = np.clip(data['errors'], 0.0, None)
+    data['latency'] = np.clip(data['latency'], 0.05, None)
+    data['traffic'] = np.clip(np.round(data['traffic']), 1, None)
+    for column in ('average.cpuPercent_x', 'average.cpuPercent_y',
+                   'average.memoryUsedPercent_x', 'average.memoryUsedPercent_y'):
+        data[column] = np.clip(data[column], 0.0, 100.0)
+    data['tsr'] = np.clip(data['tsr'], 0.0, 100.0)
+    data['apdex'] = np.clip(np.round(data['apdex'], 2), 0.0, 1.0)
+    data[experiment] = standardized['chaos']
+
+    timestamps = pd.date_range(start, periods=n_rows, freq=f'{SAMPLE_SECONDS}s')
+    df = pd.DataFrame(data, index=timestamps.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    df.index.name = 'timestamp'
+    return df
+
+
+def experiment_file_name(experiment, start, n_rows):
+    end = start + timedelta(seconds=SAMPLE_SECONDS * n_rows)
+    return f"{experiment}_chaos_{start:%Y-%m-%dT%H:%M:%SZ}_{end:%Y-%m-%dT%H:%M:%SZ}_30 second.csv"
+
+
+def generate_campaign(folder_path, n_files, n_rows, experiment='cpu', causal_edges=DEFAULT_CAUSAL_EDGES, seed=0):
+    """
+    Write n_files synthetic experiments of n_rows samples each into the given folder,
+    named like the recorded datasets. File i uses the seed seed + i.
+
+    Returns:
+        list: The paths of the written files.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    start = datetime(2023, 6, 27, 8, 49, tzinfo=timezone.utc)
+    file_paths = []
+    for i in range(n_files):
+        file_start = start + timedelta(seconds=SAMPLE_SECONDS * (n_rows + 2) * i)
+        df = generate_experiment(n_rows, experiment, causal_edges, seed + i, file_start)
+        file_path = os.path.join(folder_path, experiment_file_name(experiment, file_start, n_rows))
+        df.to_csv(file_path)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic chaos experiment datasets.")
+    parser.add_argument('folder', help="Folder to write the datasets to")
+    parser.add_argument('--files', type=int, default=28)
+    parser.add_argument('--rows', type=int, default=75)
+    parser.add_argument('--experiment', choices=['cpu', 'io'], default='cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    file_paths = generate_campaign(args.folder, args.files, args.rows, args.experiment, seed=args.seed)
+    print(f"Wrote {len(file_paths)} files to {args.folder}")
+
+
+if __name__ == "__main__":
+    main()
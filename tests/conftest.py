@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dataset_cache  # noqa: E402
+
+DATASETS = os.path.join(ROOT, 'datasets')
+LOADSIMULATOR = os.path.join(ROOT, 'loadsimulator')
+EXPERIMENTS = ('cpu', 'io')
+METRICS = ['latency', 'traffic', 'average.cpuPercent_x', 'average.cpuPercent_y',
+           'average.memoryUsedPercent_x', 'average.memoryUsedPercent_y']
+
+
+def experiment_files(experiment):
+    return dataset_cache.list_experiment_files(os.path.join(DATASETS, f'{experiment}_experiments'))
+
+
+def dataset_path(experiment, start):
+    """
+    Returns the shipped dataset of the given experiment whose chaos window starts at start, e.g. '07:48'.
+    """
+    return next(f for f in experiment_files(experiment) if dataset_id(f) == f'{experiment}-{start}')
+
+
+def dataset_id(file_path):
+    experiment, _, start = os.path.basename(file_path).split('_')[:3]
+    return f'{experiment}-{start[11:16]}'
+
+
+def run_in_load_simulator(code, **env):
+    """
+    Runs code in a fresh interpreter in the load simulator folder, with the given LOAD_* environment
+    variables only, and returns the JSON it prints last. Importing Locust monkey patches the standard
+    library with gevent, so the load simulator modules are never imported by the test process.
+    """
+    environ = {key: value for key, value in os.environ.items() if not key.startswith('LOAD_')}
+    result = subprocess.run([sys.executable, '-c', textwrap.dedent(code)], cwd=LOADSIMULATOR, capture_output=True,
+                            text=True, env={**environ, **env})
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.fixture(params=[f for experiment in EXPERIMENTS for f in experiment_files(experiment)], ids=dataset_id)
+def dataset(request):
+    return request.param
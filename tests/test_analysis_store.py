@@ -0,0 +1,117 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis_store
+import correlation
+import forecast
+from conftest import dataset_path
+
+SOURCE_FILES = [dataset_path('cpu', '08:49'), dataset_path('cpu', '09:19'), dataset_path('cpu', '11:24')]
+COLUMN_EXCLUSION = ['tsr', 'errors', 'cpu']
+
+
+@pytest.fixture
+def file_paths(tmp_path):
+    folder = tmp_path / 'datasets'
+    folder.mkdir()
+    return [shutil.copy(file_path, folder) for file_path in SOURCE_FILES]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / 'store.sqlite')
+
+
+def change_file(file_path):
+    """Doubles the latency of the first sample of an experiment file."""
+    data = pd.read_csv(file_path, index_col=0)
+    data.iloc[0, data.columns.get_loc('latency')] *= 2
+    data.to_csv(file_path)
+
+
+def record_calls(monkeypatch, module, name):
+    """Records the file paths every call of module.name is given."""
+    calls = []
+    function = getattr(module, name)
+
+    def record(file_paths, *args, **kwargs):
+        calls.append(list(file_paths))
+        return function(file_paths, *args, **kwargs)
+
+    monkeypatch.setattr(module, name, record)
+    return calls
+
+
+def test_outputs_are_kept_per_fingerprint(store_path):
+    with analysis_store.AnalysisStore(store_path) as store:
+        key = store.register('forecast', {'phases': None})
+        other_key = store.register('forecast', {'phases': ['in-fault']})
+        assert key != other_key and store.register('forecast', {'phases': None}) == key
+
+        hashes = [f'{i:016x}' for i in range(analysis_store.MAX_QUERY_VARIABLES + 10)]
+        store.put('forecast', key, [(file_hash, '', {'row': i, 'values': np.arange(2)})
+                                    for i, file_hash in enumerate(hashes)])
+        store.put('forecast', other_key, [(hashes[0], 'apdex', 1.5)])
+
+    with analysis_store.AnalysisStore(store_path) as store:
+        stored = store.get('forecast', key, hashes + ['missing'])
+        assert len(stored) == len(hashes)
+        assert stored[(hashes[-1], '')] == {'row': len(hashes) - 1, 'values': [0, 1]}
+        assert store.get('forecast', other_key, hashes) == {(hashes[0], 'apdex'): 1.5}
+        assert store.get('correlation', key, hashes) == {}
+
+
+def test_forecasts_are_only_recomputed_for_changed_files(file_paths, store_path, tmp_path, monkeypatch):
+    forecast_calls = record_calls(monkeypatch, forecast, 'forecast_experiments_batched')
+
+    def run(run_name, phases=None):
+        results_path = str(tmp_path / f'{run_name}.csv')
+        forecast.main(file_paths, 1, results_path, phases=phases, column_exclusion=COLUMN_EXCLUSION, batched=True,
+                      store_path=store_path)
+        return forecast.load_results(results_path).set_index('file')
+
+    first = run('first')
+    assert forecast_calls == [file_paths]
+
+    # Unchanged files are read from the store, with the same metrics
+    second = run('second')
+    assert forecast_calls[1:] == [[]]
+    columns = [column for column in forecast.RESULT_COLUMNS if column not in ('file', 'run_started')]
+    pd.testing.assert_frame_equal(second.loc[file_paths, columns], first.loc[file_paths, columns])
+
+    change_file(file_paths[1])
+    third = run('third')
+    assert forecast_calls[2:] == [[file_paths[1]]]
+    expected = forecast.forecast_experiment(file_paths[1], column_exclusion=COLUMN_EXCLUSION)
+    assert third.loc[file_paths[1], 'train_r2'] == pytest.approx(expected['train_r2'])
+    assert sorted(third.index) == sorted(file_paths)
+
+    # Other parameters have their own outputs
+    run('in-fault', ['in-fault'])
+    assert forecast_calls[3:] == [file_paths]
+
+
+def test_correlations_are_only_recomputed_for_changed_files(file_paths, store_path, monkeypatch):
+    correlate_calls = record_calls(monkeypatch, correlation, 'correlate_files')
+
+    def load():
+        return correlation.load_partials(file_paths, 'apdex', COLUMN_EXCLUSION, 1, store_path)
+
+    first = load()
+    assert correlate_calls == [file_paths]
+    second = load()
+    assert correlate_calls[1:] == [[]]
+    for (features, pearson, spearman), stored in zip(first, second):
+        assert stored[0] == features
+        np.testing.assert_allclose(stored[1], pearson)
+        np.testing.assert_allclose(stored[2], spearman)
+
+    change_file(file_paths[2])
+    third = load()
+    assert correlate_calls[2:] == [[file_paths[2]]]
+    expected = correlation.file_correlations(file_paths[2], 'apdex', COLUMN_EXCLUSION)
+    np.testing.assert_allclose(third[2][1], expected[1])
+    assert not np.allclose(third[2][1], first[2][1])
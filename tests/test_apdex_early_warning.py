@@ -0,0 +1,45 @@
+import io
+import json
+
+import numpy as np
+
+import apdex_early_warning
+import forecast
+from conftest import dataset_path
+
+LAG_ZERO_FILE = dataset_path('io', '07:48')
+
+
+def test_replay_refits_match_the_var_forecast():
+    stage = apdex_early_warning.ApdexEarlyWarning()
+    apdex = apdex_early_warning.FEATURES.index('apdex')
+    refit_orders = []
+
+    with open(LAG_ZERO_FILE) as stream:
+        for timestamp, sample in apdex_early_warning.read_samples(stream):
+            result = stage.ingest('io', timestamp, sample)
+            forecaster = stage.services['io']
+            if result is None or forecaster.samples_since_refit:
+                continue
+
+            # Just refit: the folded forecast map must reproduce the recursive VAR forecast
+            values = forecaster.buffer.to_array()
+            lag_order = forecaster.lag_order
+            model = forecast.IncrementalVAR(lag_order, values.shape[1]).fit(values, lag_order, len(values))
+            expected = model.forecast(values, forecast.TEST_SIZE)[:, apdex]
+            np.testing.assert_allclose(result['forecast'], expected, rtol=1e-9, atol=1e-12)
+            refit_orders.append(lag_order)
+
+    assert 0 in refit_orders and max(refit_orders) > 0
+
+
+def test_replay_emits_a_forecast_per_sample_after_warm_up():
+    output = io.StringIO()
+    with open(LAG_ZERO_FILE) as stream:
+        apdex_early_warning.run(stream, 'io', output=output)
+
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    with open(LAG_ZERO_FILE) as stream:
+        n_samples = sum(1 for _ in stream) - 1
+    assert len(lines) == n_samples - forecast.MIN_TRAIN_SIZE + 1
+    assert all(len(line['forecast']) == forecast.TEST_SIZE for line in lines)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.api import VAR
+
+import batched_var
+import forecast
+from conftest import dataset_id, dataset_path, experiment_files
+
+LAG_ZERO_FILES = [dataset_path('io', '13:03'), dataset_path('io', '08:27')]
+LAG_ZERO_COLUMNS = ['latency', 'apdex']
+
+
+def train_sets(experiment, columns=None):
+    file_paths = experiment_files(experiment)
+    trains = [forecast.prepare_experiment(file_path, None, ['tsr', 'errors', experiment])[1]
+              for file_path in file_paths]
+    return file_paths, [(train if columns is None else train[columns]).to_numpy() for train in trains]
+
+
+def assert_matches_statsmodels(results, index, values, maxlags):
+    expected = VAR(values).fit(maxlags, ic='aic')
+    lag_order = expected.k_ar
+    assert results.k_ar[index] == lag_order
+
+    size = 1 + values.shape[1] * lag_order
+    np.testing.assert_allclose(results.params[index, :size], expected.params, rtol=1e-6, atol=1e-8)
+    assert not results.params[index, size:].any()
+    np.testing.assert_allclose(results.sigma_u[index], expected.sigma_u, rtol=1e-6, atol=1e-10)
+    np.testing.assert_allclose(results.fittedvalues[index, lag_order:], expected.fittedvalues, rtol=1e-6, atol=1e-8)
+
+    steps = forecast.TEST_SIZE
+    if lag_order:
+        expected_forecast = expected.forecast(values[-lag_order:], steps)
+    else:
+        expected_forecast = np.tile(expected.params[0], (steps, 1))  # statsmodels cannot forecast a VAR(0)
+    np.testing.assert_allclose(results.forecast(steps)[index], expected_forecast, rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize('experiment', ['cpu', 'io'])
+def test_batches_match_statsmodels(experiment):
+    file_paths, values = train_sets(experiment)
+    batches = {}
+    for position, train in enumerate(values):
+        batches.setdefault(train.shape, []).append(position)
+
+    for (n_obs, neqs), positions in batches.items():
+        results = batched_var.BatchedVAR(len(positions), n_obs, neqs, forecast.TEST_SIZE).fit(
+            np.stack([values[position] for position in positions]))
+        for index, position in enumerate(positions):
+            try:
+                assert_matches_statsmodels(results, index, values[position], forecast.TEST_SIZE)
+            except AssertionError as e:
+                raise AssertionError(f"{dataset_id(file_paths[position])}: {e}") from e
+
+
+def test_lag_zero_files_match_statsmodels():
+    file_paths, values = train_sets('io', LAG_ZERO_COLUMNS)
+    positions = [file_paths.index(file_path) for file_path in LAG_ZERO_FILES]
+    n_obs = min(len(values[position]) for position in positions)
+    data = np.stack([values[position][-n_obs:] for position in positions])
+
+    results = batched_var.fit_batch(data, forecast.TEST_SIZE)
+    assert not results.k_ar.any()
+    for index in range(len(positions)):
+        assert_matches_statsmodels(results, index, data[index], forecast.TEST_SIZE)
+        assert not np.isnan(results.fittedvalues[index]).any()
+
+
+def test_mixed_lag_orders_in_one_batch():
+    _, values = train_sets('io', LAG_ZERO_COLUMNS)
+    n_obs = min(len(train) for train in values)
+    data = np.stack([train[-n_obs:] for train in values])
+
+    results = batched_var.fit_batch(data, forecast.TEST_SIZE)
+    assert 0 in results.k_ar and results.k_ar.max() > 0
+    for index in range(len(data)):
+        assert_matches_statsmodels(results, index, data[index], forecast.TEST_SIZE)
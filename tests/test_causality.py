@@ -0,0 +1,116 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import causality
+import change_points
+import dataset_cache
+from conftest import METRICS, dataset_path, experiment_files
+
+NO_RECOVERY_FILE = dataset_path('cpu', '11:52')
+SHORT_RECOVERY_FILE = dataset_path('cpu', '09:57')
+
+
+@pytest.mark.parametrize('chunk_rows', [None, 7])
+@pytest.mark.parametrize('file_path', [NO_RECOVERY_FILE, SHORT_RECOVERY_FILE], ids=['empty', 'one-row'])
+def test_short_phases_are_skipped(file_path, chunk_rows, caplog):
+    with caplog.at_level(logging.WARNING):
+        counts = causality.perform_granger_causality_tests(file_path, ['tsr', 'errors', 'cpu'], ['recovery'],
+                                                           chunk_rows)
+    assert counts == {}
+    assert 'Skipping the Granger Causality tests of' in caplog.text
+
+    graph = causality._causal_graph_task(file_path, ['cpu'], ['recovery'], chunk_rows)
+    assert graph['k_ar'] == 0 and graph['conditional'] is None and graph['pairwise'] is None
+
+
+def test_constant_pairs_are_skipped(caplog):
+    data = change_points.load_phases(experiment_files('cpu')[0])
+    data['flat'] = 1.0
+
+    with caplog.at_level(logging.WARNING):
+        pair_results = causality.evaluate_columns(data, METRICS + ['flat'])
+    assert list(pair_results) == METRICS + ['flat']
+    assert pair_results['flat'] == causality.SKIPPED_PAIR
+    assert "'flat' is constant" in caplog.text
+
+    data['apdex'] = 1.0
+    pair_results = causality.evaluate_columns(data, METRICS)
+    assert all(pair_result == causality.SKIPPED_PAIR for pair_result in pair_results.values())
+
+
+def test_phases_of_at_least_min_rows_are_tested():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(size=(causality.MIN_ROWS, 2)), columns=['latency', 'apdex'])
+    assert causality.evaluate_columns(data, ['latency'])['latency']['differenced'] is not None
+
+
+def test_batch_runs_every_phase():
+    file_paths = experiment_files('cpu')
+    for phase in change_points.PHASES:
+        counts = causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu'], max_workers=2,
+                                                       cache_path=None, phases=[phase])
+        assert all(count <= len(file_paths) for count in counts.values())
+
+
+@pytest.fixture
+def evaluated_files(monkeypatch):
+    """Runs the batch workers in threads and records the (file name, columns) each one evaluates."""
+    calls = []
+    evaluate_file_task = causality._evaluate_file_task
+
+    def record(file_path, columns, *args):
+        calls.append((os.path.basename(file_path), tuple(columns)))
+        return evaluate_file_task(file_path, columns, *args)
+
+    monkeypatch.setattr(causality, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(causality, '_evaluate_file_task', record)
+    return calls
+
+
+def test_batch_counts_match_the_serial_tests():
+    file_paths = experiment_files('io')
+    columns_to_exclude = ['tsr', 'errors', 'io']
+    expected = {}
+    for file_path in file_paths:
+        for column, count in causality.perform_granger_causality_tests(file_path, columns_to_exclude).items():
+            expected[column] = expected.get(column, 0) + count
+
+    counts = causality.run_granger_causality_batch(file_paths, columns_to_exclude, max_workers=2, cache_path=None)
+    assert counts == expected
+
+
+def test_batch_only_evaluates_new_pairs(tmp_path, evaluated_files):
+    for file_path in experiment_files('cpu')[:3]:
+        shutil.copy(file_path, tmp_path)
+    file_paths = dataset_cache.list_experiment_files(str(tmp_path))
+    names = [os.path.basename(file_path) for file_path in file_paths]
+    store_path = str(tmp_path / 'store.sqlite')
+    columns = tuple(causality._tested_columns(file_paths[0], ['tsr', 'errors', 'cpu']))
+
+    counts = causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu', 'traffic'], 2, store_path)
+    assert sorted(evaluated_files) == [(name, tuple(c for c in columns if c != 'traffic')) for name in names]
+
+    evaluated_files.clear()
+    assert counts == causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu', 'traffic'], 2,
+                                                           store_path)
+    assert evaluated_files == []
+
+    # Previously excluded columns of unchanged files are the only new pairs
+    counts = causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu'], 2, store_path)
+    assert sorted(evaluated_files) == [(name, ('traffic',)) for name in names]
+    assert counts == causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu'], 2, None)
+
+    # A changed file is evaluated again, the others are read from the store
+    data = pd.read_csv(file_paths[1], index_col=0)
+    data.iloc[20, data.columns.get_loc('apdex')] = 0.1
+    data.to_csv(file_paths[1])
+    evaluated_files.clear()
+    counts = causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu'], 2, store_path)
+    assert evaluated_files == [(names[1], columns)]
+    assert counts == causality.run_granger_causality_batch(file_paths, ['tsr', 'errors', 'cpu'], 2, None)
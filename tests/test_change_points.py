@@ -0,0 +1,20 @@
+import numpy as np
+
+import change_points
+import dataset_cache
+
+
+def test_segments_are_at_least_min_segment_size(dataset):
+    values = dataset_cache.load_experiment(dataset)['apdex'].to_numpy()
+    bounds = [0] + change_points.load_segment_index(dataset)['apdex_change_points'] + [len(values)]
+    assert min(np.diff(bounds)) >= change_points.MIN_SEGMENT_SIZE
+
+
+def test_short_dips_are_not_regimes():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([np.full(30, 0.9), np.full(45, 0.7)]) + rng.normal(0, 0.03, 75)
+    for start in range(5, 70, 8):
+        values[start:start + 2] -= 0.15  # Dips after every chaos burst
+    found = change_points.pelt(values)
+    assert any(abs(change_point - 30) <= 1 for change_point in found)
+    assert 3 * len(found) < len(change_points.pelt(values, min_size=2))
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import change_points
+import cli
+import forecast
+from conftest import DATASETS, ROOT, experiment_files
+
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'statsmodels', 'sklearn']
+
+
+def imported_modules(*argv):
+    """Runs the CLI in a fresh interpreter and returns which of HEAVY_MODULES it imported."""
+    code = (f"import sys, cli\n"
+            f"try:\n    cli.main({list(argv)!r})\nexcept SystemExit:\n    pass\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return [module for module in output.splitlines()[-1].split(',') if module]
+
+
+@pytest.mark.parametrize('argv', [
+    ['--help'],
+    ['forecast', '--help'],
+    ['list', os.path.join(DATASETS, 'cpu_experiments')],
+], ids=['help', 'subcommand-help', 'list'])
+def test_help_and_listing_import_no_heavy_modules(argv):
+    assert imported_modules(*argv) == []
+
+
+def test_phases_mirror_change_points():
+    assert cli.PHASES == list(change_points.PHASES)
+
+
+def test_experiment_and_exclusion_defaults():
+    assert cli.infer_experiment(experiment_files('io')) == 'io'
+    assert cli.infer_experiment(experiment_files('cpu') + experiment_files('io')) == 'cpu'
+
+    args = cli.build_parser().parse_args(['forecast', 'folder', '--experiment', 'io'])
+    assert cli.exclusion(args, ['tsr', 'errors']) == ['tsr', 'errors', 'io']
+    args = cli.build_parser().parse_args(['forecast', 'folder', '--experiment', 'io', '--exclude', 'traffic'])
+    assert cli.exclusion(args, ['tsr', 'errors']) == ['traffic', 'io']
+
+
+def test_list(capsys):
+    cli.main(['list', os.path.join(DATASETS, 'io_experiments')])
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == len(experiment_files('io'))
+    assert all(' io ' in line for line in lines)
+
+
+def test_forecast_subcommand(tmp_path, capsys):
+    results_path = str(tmp_path / 'results.csv')
+    cli.main(['forecast', os.path.join(DATASETS, 'io_experiments'), '--no-store', '--batched',
+              '--results', results_path, '--phases', 'in-fault'])
+    results = forecast.load_results(results_path)
+    assert sorted(results['file']) == experiment_files('io')
+    assert 'Apdex VAR Test R^2' in capsys.readouterr().out
+
+
+def test_unknown_arguments_are_rejected():
+    with pytest.raises(SystemExit):
+        cli.main(['list', DATASETS, '--batched'])
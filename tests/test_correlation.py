@@ -0,0 +1,53 @@
+import logging
+import pickle
+
+import pandas as pd
+import pytest
+
+import correlation
+from conftest import dataset_path, experiment_files
+
+IO_FILE = experiment_files('io')[0]
+
+
+def test_missing_metric_raises_metric_not_found():
+    with pytest.raises(correlation.MetricNotFoundError) as excinfo:
+        correlation.file_correlations(IO_FILE, 'throughput', ['io'])
+    assert excinfo.value.file_path == IO_FILE
+    assert 'apdex' in excinfo.value.columns
+
+    # Worker processes send the error back pickled
+    error = pickle.loads(pickle.dumps(excinfo.value))
+    assert (error.file_path, error.columns) == (excinfo.value.file_path, excinfo.value.columns)
+
+
+def test_other_key_errors_are_not_taken_for_a_missing_metric(monkeypatch):
+    monkeypatch.setitem(correlation.config, 'store_path', None)
+    monkeypatch.setitem(correlation.config, 'metrics_to_exclude', ['tsr', 'apdex', 'cpu'])  # 'cpu' is not in io data
+    with pytest.raises(KeyError) as excinfo:
+        correlation.calculate_correlation([IO_FILE], 'apdex')
+    assert not isinstance(excinfo.value, correlation.MetricNotFoundError)
+
+
+def test_missing_metric_is_logged(monkeypatch, caplog):
+    monkeypatch.setitem(correlation.config, 'store_path', None)
+    monkeypatch.setitem(correlation.config, 'metrics_to_exclude', ['throughput', 'io'])
+    with caplog.at_level(logging.ERROR):
+        assert correlation.calculate_correlation([IO_FILE], 'throughput') is None
+    assert "Metric 'throughput' not found" in caplog.text
+
+
+@pytest.mark.parametrize('chunk_rows', [None, 7])
+def test_files_with_empty_phases_are_left_out(chunk_rows, tmp_path, caplog):
+    file_paths = [dataset_path('cpu', '11:52'), dataset_path('cpu', '09:57'), dataset_path('cpu', '09:19')]
+    with caplog.at_level(logging.WARNING):
+        partials = correlation.load_partials(file_paths, 'apdex', ['tsr', 'cpu'], 1, str(tmp_path / 'store.sqlite'),
+                                             ['recovery'], chunk_rows)
+    assert partials[0] is None and partials[1] is None
+    assert caplog.text.count('out of the correlations') == 2
+
+    aggregate = correlation.aggregate_partials(file_paths, partials)
+    assert aggregate.count == 1
+    features, pearson, _ = partials[2]
+    pd.testing.assert_series_equal(aggregate.mean('pearson'), pd.Series(pearson, index=features))
+    assert pd.notna(aggregate.mean('pearson')['latency'])
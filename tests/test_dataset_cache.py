@@ -0,0 +1,72 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_cache
+from conftest import dataset_path
+
+
+@pytest.fixture
+def file_path(tmp_path):
+    return shutil.copy(dataset_path('cpu', '08:49'), tmp_path)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Records the files whose cache entry is (re)built."""
+    built = []
+    build_cache_entry = dataset_cache.build_cache_entry
+
+    def record(file_path):
+        built.append(file_path)
+        return build_cache_entry(file_path)
+
+    monkeypatch.setattr(dataset_cache, 'build_cache_entry', record)
+    return built
+
+
+def test_load_experiment_matches_read_csv(file_path):
+    expected = pd.read_csv(file_path, index_col=0, parse_dates=True)
+    loaded = dataset_cache.load_experiment(file_path)
+    assert loaded.index.equals(expected.index) and loaded.index.name == expected.index.name
+    np.testing.assert_array_equal(loaded.to_numpy(), expected.to_numpy(dtype=dataset_cache.METRICS_DTYPE))
+    assert list(loaded.columns) == list(expected.columns)
+
+    assert os.path.isdir(dataset_cache.cache_entry_dir(file_path))
+    assert list(dataset_cache.load_experiment(file_path, ['apdex', 'latency']).columns) == ['apdex', 'latency']
+
+
+def test_unchanged_files_are_not_rebuilt(file_path, builds):
+    dataset_cache.load_experiment(file_path)
+    dataset_cache.load_experiment(file_path)
+    assert builds == [file_path]
+
+    # Touching the file only costs a hash check
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    dataset_cache.load_experiment(file_path)
+    assert builds == [file_path]
+
+
+@pytest.mark.parametrize('same_size', [True, False])
+def test_changed_files_are_rebuilt(file_path, builds, same_size):
+    before = dataset_cache.load_experiment(file_path)['apdex'].copy()
+    old_hash = dataset_cache.content_hash(file_path)
+
+    with open(file_path) as f:
+        lines = f.read().splitlines(keepends=True)
+    lines[1] = lines[1].replace(',0.94,', ',0.91,' if same_size else ',0.5,')
+    stat = os.stat(file_path)
+    with open(file_path, 'w') as f:
+        f.writelines(lines)
+    # A rewrite within the same mtime tick must still be noticed by its size or content hash
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    after = dataset_cache.load_experiment(file_path)['apdex']
+    assert len(builds) == 2
+    assert dataset_cache.content_hash(file_path) != old_hash
+    assert after.iloc[0] == pytest.approx(0.91 if same_size else 0.5)
+    pd.testing.assert_series_equal(after.iloc[1:], before.iloc[1:])
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_cache
+import experiment_runner
+import synthetic_datasets
+
+N_ROWS = 6
+BASELINE_ROWS = 2
+BURST_ROWS = 2
+# Stands in for Locust and the metrics probe: every step adds 10 requests, of which 1 fails, 8 are satisfied
+# and 1 tolerating, each taking 0.2 seconds, to the totals at the metrics path
+STUB_LOAD = textwrap.dedent("""
+    import json, os, sys, time
+    metrics_path, lifetime = sys.argv[1], float(sys.argv[2])
+    totals = {'requests': 0, 'failures': 0, 'response_time_seconds': 0.0, 'satisfied': 0, 'tolerating': 0}
+    deadline = time.monotonic() + lifetime
+    try:
+        while time.monotonic() < deadline:
+            totals['requests'] += 10
+            totals['failures'] += 1
+            totals['response_time_seconds'] += 10 * 0.2
+            totals['satisfied'] += 8
+            totals['tolerating'] += 1
+            with open(metrics_path + '.tmp', 'w') as f:
+                json.dump(totals, f)
+            os.replace(metrics_path + '.tmp', metrics_path)
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    sys.exit(3)
+""")
+
+
+class StubInjector:
+    """Records the fault state of every sample window instead of burning the CPU."""
+    instances = []
+
+    def __init__(self, kind, workers=None, io_dir=None):
+        self.kind = kind
+        self.states = []
+        self.active = False
+        StubInjector.instances.append(self)
+
+    def set(self, active):
+        self.active = active
+        self.states.append(active)
+
+    def stop(self):
+        self.active = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@pytest.fixture
+def stub_load(monkeypatch):
+    """Replaces Locust and the fault processes, returns the started loads and the injectors."""
+    loads = []
+    StubInjector.instances = []
+
+    def start_load(host, metrics_path, locustfiles=experiment_runner.LOCUSTFILES, extra_args=()):
+        lifetime = extra_args[0] if extra_args else '60'
+        loads.append(subprocess.Popen([sys.executable, '-c', STUB_LOAD, metrics_path, lifetime]))
+        return loads[-1]
+
+    monkeypatch.setattr(experiment_runner, 'start_load', start_load)
+    monkeypatch.setattr(experiment_runner, 'FaultInjector', StubInjector)
+    return loads, StubInjector.instances
+
+
+def run_experiment(folder_path, locust_args=()):
+    return experiment_runner.run_experiment(
+        'cpu', str(folder_path), 'http://localhost', n_rows=N_ROWS, sample_seconds=1, baseline_rows=BASELINE_ROWS,
+        burst_rows=BURST_ROWS, warmup_seconds=0.2, locust_args=locust_args)
+
+
+def test_experiment_dataset(tmp_path, stub_load):
+    loads, injectors = stub_load
+    file_path = run_experiment(tmp_path)
+
+    assert os.listdir(tmp_path) == [os.path.basename(file_path)]
+    assert dataset_cache.list_experiment_files(str(tmp_path)) == [file_path]
+    assert file_path.endswith('_1 second.csv')
+
+    dataset = pd.read_csv(file_path, index_col=0, parse_dates=True)
+    assert list(dataset.columns) == synthetic_datasets.COLUMNS + ['cpu']
+    assert len(dataset) == N_ROWS
+    assert (dataset.index[1:] - dataset.index[:-1] == pd.Timedelta(seconds=1)).all()
+
+    marker = synthetic_datasets.chaos_marker(N_ROWS, BASELINE_ROWS, BURST_ROWS)
+    np.testing.assert_array_equal(dataset['cpu'], marker)
+    assert injectors[0].states == list(marker > 0) and not injectors[0].active
+
+    assert (dataset['traffic'] > 0).all()
+    np.testing.assert_allclose(dataset['errors'], 10)
+    np.testing.assert_allclose(dataset['tsr'], 90)
+    np.testing.assert_allclose(dataset['latency'], 0.2)
+    np.testing.assert_allclose(dataset['apdex'], 0.85)
+    assert loads[0].poll() is not None
+
+
+def test_load_exiting_aborts_the_experiment(tmp_path, stub_load):
+    _, injectors = stub_load
+    with pytest.raises(RuntimeError, match='Locust exited with code 3'):
+        run_experiment(tmp_path, locust_args=['2'])
+
+    assert not injectors[0].active
+    assert dataset_cache.list_experiment_files(str(tmp_path)) == []
+    partial_files = os.listdir(tmp_path)
+    assert len(partial_files) == 1 and partial_files[0].endswith('.csv.partial')
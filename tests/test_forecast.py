@@ -0,0 +1,145 @@
+import logging
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.api import VAR
+
+import change_points
+import forecast
+from conftest import dataset_path
+
+LAG_ZERO_FILE = dataset_path('io', '07:48')
+COLUMN_EXCLUSION = ['tsr', 'errors', 'io']
+
+
+@pytest.fixture
+def values():
+    return forecast.read_and_preprocess(LAG_ZERO_FILE, column_exclusion=COLUMN_EXCLUSION).to_numpy()
+
+
+@pytest.mark.parametrize('lag_order', [0, 1, 2])
+def test_incremental_var_matches_statsmodels(values, lag_order):
+    start, stop = 10, 50
+    model = forecast.IncrementalVAR(lag_order, values.shape[1]).fit(values, start, stop)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = VAR(values[start - lag_order:stop]).fit(lag_order, trend='c')
+    np.testing.assert_allclose(model.params, expected.params, rtol=1e-6, atol=1e-10)
+
+    # statsmodels cannot forecast without lags, a VAR(0) forecasts its intercept at every step
+    expected_forecast = expected.forecast(values[:stop], 3) if lag_order else np.tile(expected.params[0], (3, 1))
+    np.testing.assert_allclose(model.forecast(values[:stop], 3), expected_forecast, rtol=1e-6, atol=1e-10)
+
+
+@pytest.mark.parametrize('window', [None, 20])
+def test_walk_forward_forecast_with_lag_order_zero(window):
+    df = forecast.read_and_preprocess(LAG_ZERO_FILE, column_exclusion=COLUMN_EXCLUSION)
+    predictions, matrix = forecast.walk_forward_forecast(df, window=window)
+
+    lag_zero = predictions[predictions['Lag Order'] == 0]
+    assert len(lag_zero) > 0
+    assert np.isfinite(predictions.filter(like='Pred Apdex').to_numpy()).all()
+    # Without lags every step forecasts the mean Apdex of the sample
+    assert (lag_zero.filter(like='Pred Apdex').nunique(axis=1) == 1).all()
+    assert matrix.sum() == len(predictions)
+
+
+PHASE_FILES = [dataset_path('cpu', '11:52'), dataset_path('cpu', '09:19')]  # cpu 11:52 has no recovery phase
+
+
+@pytest.mark.parametrize('phase', change_points.PHASES)
+def test_every_phase_is_forecast_or_skipped(phase, caplog):
+    column_exclusion = ['tsr', 'errors', 'cpu']
+    n_rows = [len(change_points.load_phases(file_path, [phase])) for file_path in PHASE_FILES]
+    min_rows = forecast.MIN_TRAIN_SIZE + forecast.TEST_SIZE
+    forecastable = [file_path for file_path, n in zip(PHASE_FILES, n_rows) if n >= min_rows]
+
+    with caplog.at_level(logging.WARNING), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        rows = [forecast.forecast_experiment(file_path, phases=[phase], column_exclusion=column_exclusion)
+                for file_path in PHASE_FILES]
+        batched_rows = forecast.forecast_experiments_batched(PHASE_FILES, phases=[phase],
+                                                             column_exclusion=column_exclusion)
+    assert [row['file'] for row in rows if row is not None] == forecastable
+    assert [row['file'] for row in batched_rows] == forecastable
+    assert caplog.text.count('Skipping the forecast') == 2 * (len(PHASE_FILES) - len(forecastable))
+
+    forecast_rows = [(row, n) for row, n in zip(rows, n_rows) if row is not None]
+    for (row, n), batched_row in zip(forecast_rows, batched_rows):
+        assert row['lag_order'] == batched_row['lag_order'] <= forecast.max_lag_order(n - forecast.TEST_SIZE, 7)
+        assert row['test_r2'] == pytest.approx(batched_row['test_r2'], abs=1e-6)
+
+    for file_path, n in zip(PHASE_FILES, n_rows):
+        df = forecast.read_and_preprocess(file_path, [phase], column_exclusion)
+        if not forecast.is_forecastable(df):
+            continue
+        predictions, matrix = forecast.walk_forward_forecast(df)
+        assert len(predictions) == n - min_rows + 1
+        assert matrix.sum() == len(predictions)
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_main_without_forecastable_files(batched, tmp_path, capsys):
+    file_paths = [dataset_path('cpu', '11:52')]
+    forecast.main(file_paths, 1, str(tmp_path / 'results.csv'), phases=['recovery'], batched=batched, store_path=None)
+    forecast.walk_forward_main(file_paths, ['recovery'], predictions_dir=str(tmp_path))
+    assert capsys.readouterr().out.splitlines() == ['[[0 0]', ' [0 0]]'] * 2
+
+
+@pytest.mark.parametrize('plot, batched', [(False, False), (True, False), (False, True)],
+                         ids=['workers', 'interactive-plot', 'batched'])
+def test_main_appends_every_forecast_to_the_results_table(plot, batched, tmp_path, monkeypatch):
+    monkeypatch.setattr(forecast, 'plot_data', lambda *args, **kwargs: None)
+    file_paths = [dataset_path('cpu', '09:19'), dataset_path('cpu', '11:24')]
+    results_path = str(tmp_path / 'results.csv')
+    forecast.main(file_paths, 2, results_path, plot, None, column_exclusion=['tsr', 'errors', 'cpu'], batched=batched,
+                  store_path=None)
+
+    results = forecast.load_results(results_path)
+    assert list(results.columns) == forecast.RESULT_COLUMNS
+    assert sorted(results['file']) == sorted(file_paths)
+    assert results['run_started'].nunique() == 1
+
+
+def test_walk_forward_predictions_line_up_with_the_test_rows(tmp_path):
+    predictions = forecast.walk_forward_main([LAG_ZERO_FILE], column_exclusion=COLUMN_EXCLUSION,
+                                             predictions_dir=str(tmp_path))[LAG_ZERO_FILE]
+    saved = pd.read_csv(tmp_path / os.path.basename(LAG_ZERO_FILE), index_col=0, parse_dates=True)
+    pd.testing.assert_frame_equal(saved, predictions, check_index_type=False, check_freq=False)
+
+    df = forecast.read_and_preprocess(LAG_ZERO_FILE, column_exclusion=COLUMN_EXCLUSION)
+    first_forecasts = df.index[forecast.MIN_TRAIN_SIZE:len(df) - forecast.TEST_SIZE + 1]
+    assert list(predictions.index) == list(first_forecasts)
+    for timestamp, row in predictions.iterrows():
+        # Each origin forecasts the TEST_SIZE rows starting at its index
+        test_rows = df.loc[timestamp:].iloc[:forecast.TEST_SIZE]
+        assert len(test_rows) == forecast.TEST_SIZE
+        assert row['True Breach'] == int((test_rows['apdex'] < forecast.THRESHOLD).any())
+
+
+def test_parallel_forecasts_match_the_serial_ones(tmp_path):
+    file_paths = [dataset_path('io', '07:48'), dataset_path('io', '13:03'), dataset_path('io', '18:18')]
+    results_path = str(tmp_path / 'results.csv')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = [forecast.forecast_experiment(file_path, column_exclusion=COLUMN_EXCLUSION)
+                    for file_path in file_paths]
+    for run_started in ['2024-01-01T00:00:00Z', '2024-01-02T00:00:00Z']:
+        results, matrix = forecast.run_forecasts(file_paths, 2, results_path, column_exclusion=COLUMN_EXCLUSION,
+                                                 run_started=run_started)
+
+    columns = [column for column in forecast.RESULT_COLUMNS if column not in ('run_started', 'fit_seconds')]
+    pd.testing.assert_frame_equal(results[columns], pd.DataFrame(expected)[columns])
+    assert matrix.sum() == len(file_paths)
+
+    # The table is appended to, with a single header
+    with open(results_path) as f:
+        assert f.readline().strip().split(',') == forecast.RESULT_COLUMNS
+    table = forecast.load_results(results_path)
+    assert len(table) == 2 * len(file_paths)
+    latest = forecast.load_results(results_path, latest_run_only=True)
+    assert list(latest['run_started'].unique()) == ['2024-01-02T00:00:00Z']
+    pd.testing.assert_frame_equal(latest[columns].reset_index(drop=True), results[columns])
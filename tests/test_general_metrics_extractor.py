@@ -0,0 +1,121 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import general_metrics_extractor as extractor
+import metrics_backend
+from conftest import dataset_path
+
+DATASET = dataset_path('cpu', '08:49')
+
+QUERY = extractor.signal_query_key('Transaction', 'count(*)', "appName = 'checkout'")
+RESULTS = [{'beginTimeSeconds': 0, 'count': 1}]
+
+
+def test_query_result_cache_is_keyed_by_account(tmp_path):
+    cache = extractor.QueryResultCache(str(tmp_path / 'cache.sqlite'))
+    cache.put([(1, QUERY, '30 second', 0, RESULTS)])
+
+    assert cache.get(1, QUERY, '30 second', [0]) == {0: RESULTS}
+    assert cache.get(2, QUERY, '30 second', [0]) == {}
+    cache.close()
+
+
+def test_truncate_to_last_complete_row(tmp_path):
+    file_path = tmp_path / 'dataset.csv'
+    file_path.write_bytes(b'timestamp,apdex\n2023-06-27T08:49:00Z,0.9\n2023-06-27T08:49:30Z,0.')
+
+    last = extractor.truncate_to_last_complete_row(str(file_path))
+    assert extractor.format_timestamp(last) == '2023-06-27T08:49:00Z'
+    assert file_path.read_bytes() == b'timestamp,apdex\n2023-06-27T08:49:00Z,0.9\n'
+
+    file_path.write_bytes(b'timestamp,apdex\n')
+    assert extractor.truncate_to_last_complete_row(str(file_path)) is None
+
+
+class FlakyBackend(metrics_backend.MetricsBackend):
+    """Answers the first requests with the given HTTP error statuses."""
+
+    def __init__(self, store, statuses=()):
+        super().__init__(store)
+        self.statuses = list(statuses)
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        if self.statuses:
+            self.requests_served += 1
+            return web.json_response({'errors': []}, status=self.statuses.pop(0))
+        return await super().handle(request)
+
+
+@pytest.fixture(scope='module')
+def store():
+    store = metrics_backend.TimeSeriesStore()
+    store.load([DATASET])
+    return store
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record(delay, *args, **kwargs):
+        if delay:  # The backoffs, the local server and aiohttp only yield with sleep(0)
+            delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(extractor.asyncio, 'sleep', record)
+    return delays
+
+
+def fetch(backend, **collector_options):
+    start, end, chaos_windows = metrics_backend.dataset_windows([DATASET], 30)[0]
+
+    async def run():
+        async with extractor.AsyncMetricsCollector(endpoint=server.url, account_id=1, signals=metrics_backend.SIGNALS,
+                                                   **collector_options) as collector:
+            return await collector.fetch_window(start, end, '30 second', 'cpu', chaos_windows), collector.requests_made
+
+    with metrics_backend.BackendServer(backend) as server:
+        return asyncio.run(run())
+
+
+@pytest.mark.parametrize('queries_per_request, max_buckets', [(1, 366), (3, 20), (10, 366)])
+def test_queries_are_batched_into_requests(store, queries_per_request, max_buckets):
+    backend = metrics_backend.MetricsBackend(store)
+    df, requests_made = fetch(backend, queries_per_request=queries_per_request, max_buckets=max_buckets)
+
+    start, end, _ = metrics_backend.dataset_windows([DATASET], 30)[0]
+    n_queries = len(metrics_backend.SIGNALS) * len(extractor.split_window(start, end, '30 second', max_buckets))
+    assert backend.queries_served == n_queries
+    assert requests_made == backend.requests_served == -(-n_queries // queries_per_request)
+
+    expected = pd.read_csv(DATASET, index_col=0)
+    assert list(df.columns) == list(expected.columns)
+    np.testing.assert_allclose(df.to_numpy(dtype=float), expected.to_numpy(), rtol=1e-6, atol=1e-6)
+
+
+def test_rate_limits_and_server_errors_are_retried(store, backoffs):
+    backend = FlakyBackend(store, [429, 503, 500])
+    df, requests_made = fetch(backend, queries_per_request=len(metrics_backend.SIGNALS))
+    assert requests_made == backend.requests_served == 4
+    assert backoffs == [0.5, 1.0, 2.0]
+    assert len(df) == len(pd.read_csv(DATASET))
+
+
+@pytest.mark.parametrize('statuses, requests_made', [
+    ([400], 1),
+    ([503] * (extractor.MAX_RETRIES + 1), extractor.MAX_RETRIES + 1),
+], ids=['client-error', 'retries-exhausted'])
+def test_failed_requests_raise(store, backoffs, statuses, requests_made):
+    import aiohttp
+
+    backend = FlakyBackend(store, statuses)
+    with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        fetch(backend, queries_per_request=len(metrics_backend.SIGNALS))
+    assert excinfo.value.status == statuses[-1]
+    assert backend.requests_served == requests_made
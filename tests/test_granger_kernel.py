@@ -0,0 +1,92 @@
+import warnings
+
+import numpy as np
+import pytest
+from statsmodels.tsa.api import VAR
+from statsmodels.tsa.stattools import grangercausalitytests
+
+import dataset_cache
+import granger_kernel
+from conftest import METRICS
+
+MAX_LAGS = 6
+TEST_LAGS = (1, 2)
+
+
+@pytest.fixture(autouse=True)
+def quiet_statsmodels():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def pairs_with_apdex(file_path):
+    data = dataset_cache.load_experiment(file_path)
+    return np.stack([data[[column, 'apdex']].to_numpy(dtype=float) for column in METRICS])
+
+
+def joint_series(file_path):
+    return dataset_cache.load_experiment(file_path, METRICS + ['apdex']).to_numpy(dtype=float)
+
+
+def test_select_lag_order_matches_var(dataset):
+    stacked = pairs_with_apdex(dataset)
+    expected = [VAR(pair).fit(maxlags=MAX_LAGS, ic='aic').k_ar for pair in stacked]
+    np.testing.assert_array_equal(granger_kernel.select_lag_order(stacked, MAX_LAGS), expected)
+
+
+def test_ssr_ftest_matches_grangercausalitytests(dataset):
+    stacked = pairs_with_apdex(dataset)
+    p_values = granger_kernel.granger_ssr_ftest_pvalues(stacked, max(TEST_LAGS))
+    for pair, pair_p_values in zip(stacked, p_values):
+        result = grangercausalitytests(pair, maxlag=max(TEST_LAGS), verbose=False)
+        expected = [result[lag][0]['ssr_ftest'][1] for lag in range(1, max(TEST_LAGS) + 1)]
+        np.testing.assert_allclose(pair_p_values, expected, rtol=1e-6, atol=1e-10)
+
+
+def test_min_granger_p_values_matches_reference(dataset):
+    stacked = pairs_with_apdex(dataset)
+    k_ar, min_p_values = granger_kernel.min_granger_p_values(stacked, MAX_LAGS)
+    for pair, pair_k_ar, min_p_value in zip(stacked, k_ar, min_p_values):
+        if pair_k_ar == 0:
+            assert np.isnan(min_p_value)
+            continue
+        result = grangercausalitytests(pair, maxlag=int(pair_k_ar), verbose=False)
+        assert min_p_value == min(round(result[lag][0]['ssr_ftest'][1], 4) for lag in range(1, pair_k_ar + 1))
+
+
+@pytest.mark.parametrize('lag_order', TEST_LAGS)
+def test_conditional_pvalues_match_test_causality(dataset, lag_order):
+    values = joint_series(dataset)
+    results = VAR(values).fit(lag_order, trend='c')
+    p_values = granger_kernel.conditional_granger_pvalues(values, lag_order)
+    for causing in range(values.shape[1]):
+        for caused in range(values.shape[1]):
+            if causing != caused:
+                expected = results.test_causality(caused, [causing], kind='f').pvalue
+                assert p_values[causing, caused] == pytest.approx(expected, rel=1e-6, abs=1e-10)
+
+
+@pytest.mark.parametrize('lag_order', TEST_LAGS)
+def test_pairwise_pvalues_match_grangercausalitytests(dataset, lag_order):
+    values = joint_series(dataset)
+    p_values = granger_kernel.pairwise_granger_pvalues(values, lag_order)
+    for causing in range(values.shape[1]):
+        for caused in range(values.shape[1]):
+            if causing != caused:
+                result = grangercausalitytests(values[:, [caused, causing]], maxlag=[lag_order], verbose=False)
+                expected = result[lag_order][0]['ssr_ftest'][1]
+                assert p_values[causing, caused] == pytest.approx(expected, rel=1e-6, abs=1e-10)
+
+
+def test_collinear_series_fall_back_to_minimum_norm_solution(dataset):
+    values = joint_series(dataset)
+    duplicated = np.column_stack([values, values[:, 0]])
+    p_values = granger_kernel.pairwise_granger_pvalues(duplicated, 1)
+
+    # A copy of a series adds nothing to its own lags, the other tests are unaffected
+    assert p_values[-1, 0] == pytest.approx(1.0)
+    np.testing.assert_allclose(p_values[:-1, :-1], granger_kernel.pairwise_granger_pvalues(values, 1),
+                               rtol=1e-6, atol=1e-10)
+    conditional = granger_kernel.conditional_granger_pvalues(duplicated, 1)[1:-1, 1:-1]
+    assert np.isfinite(conditional[~np.eye(len(conditional), dtype=bool)]).all()
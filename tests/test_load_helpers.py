@@ -0,0 +1,59 @@
+import sys
+
+import pytest
+
+from conftest import LOADSIMULATOR
+
+sys.path.append(LOADSIMULATOR)
+import helpers  # noqa: E402  Only imports Faker, not Locust
+
+
+def take(factory, kind, count):
+    return [factory.take(kind) for _ in range(count)]
+
+
+def test_sequences_depend_only_on_seed_and_worker():
+    expected = helpers.FakeDataFactory(seed=7, worker_index=1)
+    users, updates = take(expected, 'user', 300), take(expected, 'update', 20)
+
+    # Other chunk sizes, a prefill and interleaved kinds hand out the same sequences
+    factory = helpers.FakeDataFactory(seed=7, worker_index=1, chunk_size=16).prefill(users=5, updates=3, payments=2)
+    interleaved = [(factory.user(), factory.update()) for _ in range(20)]
+    assert [user for user, _ in interleaved] == users[:20]
+    assert [update for _, update in interleaved] == updates
+    assert take(factory, 'user', 280) == users[20:]
+
+    assert take(helpers.FakeDataFactory(seed=8, worker_index=1), 'user', 10) != users[:10]
+    assert take(helpers.FakeDataFactory(seed=7, worker_index=2), 'user', 10) != users[:10]
+
+
+def test_identities_are_unique():
+    identifiers = [user['identifier'] for user in take(helpers.FakeDataFactory(seed=0), 'user', 1000)]
+    assert len(set(identifiers)) == len(identifiers)
+
+
+def test_throughput_leaves_the_sequence_untouched():
+    factory = helpers.FakeDataFactory(seed=3)
+    first = factory.user()
+    rates = factory.throughput(count=50)
+    assert set(rates) == set(helpers.FakeDataFactory.KINDS) and all(rate > 0 for rate in rates.values())
+
+    expected = helpers.FakeDataFactory(seed=3)
+    assert [first, factory.user()] == take(expected, 'user', 2)
+
+
+def test_workers_get_their_own_factory(monkeypatch):
+    monkeypatch.setattr(helpers, '_factories', {})
+    assert helpers.get_factory(0, seed=5) is helpers.get_factory(0, seed=5)
+    assert helpers.get_factory(1, seed=5) is not helpers.get_factory(0, seed=5)
+
+    expected = helpers.FakeDataFactory(helpers.DEFAULT_SEED)
+    assert helpers.generate_user_data() == expected.user()
+    assert helpers.generate_user_data(update=True) == expected.update()
+
+
+@pytest.mark.parametrize('transfer', [False, True])
+def test_payments(transfer):
+    payment = helpers.FakeDataFactory().payment(transfer)
+    assert payment['amount'] == 3
+    assert ('receiver_id' in payment) == transfer
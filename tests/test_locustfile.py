@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from conftest import dataset_path, run_in_load_simulator
+
+SHAPES = '''
+import json
+
+import numpy as np
+
+from locustfile import AutoLoadTestShape, Config, build_schedule, read_traffic
+
+DURATION = 3 * 60 * 60
+
+
+def loop_shape(seed, duration, config=Config):
+    """
+    The shape tick() computed in a loop before the schedule was precomputed: the stage changes once the run
+    time reaches the next update time. It is given the random draws of build_schedule, in the same order.
+    """
+    rng = np.random.default_rng(seed)
+    n_stages = int(np.ceil(duration / config.MIN_TIME_INTERVAL_SECONDS)) + 1
+    intervals = np.clip(rng.poisson(config.MEAN_TIME_INTERVAL_SECONDS, n_stages),
+                        config.MIN_TIME_INTERVAL_SECONDS, config.MAX_TIME_INTERVAL_SECONDS)
+    user_counts = np.clip(rng.poisson(config.MEAN_USER_COUNT, n_stages), config.MIN_USER_COUNT, config.MAX_USER_COUNT)
+    spawn_rates = np.clip(rng.poisson(config.MEAN_SPAWN_RATE, n_stages), config.MIN_SPAWN_RATE, config.MAX_SPAWN_RATE)
+
+    user_count, spawn_rate = config.INITIAL_USER_COUNT, config.INITIAL_SPAWN_RATE
+    next_update_time, stage = intervals[0], 0
+    shape = []
+    for run_time in range(duration):
+        if run_time >= next_update_time:
+            user_count, spawn_rate = user_counts[stage], spawn_rates[stage]
+            stage += 1
+            next_update_time = run_time + intervals[stage]
+        shape.append([int(user_count), float(spawn_rate)])
+    return shape
+
+
+def ticks(shape, run_times):
+    result = []
+    for run_time in run_times:
+        shape.get_run_time = lambda: run_time
+        result.append(list(shape.tick()))
+    return result
+
+
+seconds = range(DURATION)
+schedule = build_schedule(seed=11, duration=DURATION)
+traffic = read_traffic(Config.TRAFFIC_DATASET)
+print(json.dumps({
+    'loop': loop_shape(11, DURATION),
+    'ticks': ticks(AutoLoadTestShape(schedule=schedule), seconds),
+    'ticks_between_seconds': ticks(AutoLoadTestShape(schedule=schedule), [t + 0.5 for t in seconds]),
+    'same_seed': bool((build_schedule(seed=11, duration=DURATION) == schedule).all()),
+    'other_seed': bool(np.array_equal(build_schedule(seed=12, duration=DURATION), schedule)),
+    'traffic': traffic.tolist(),
+    'traffic_ticks': ticks(AutoLoadTestShape(), [Config.SAMPLE_SECONDS * k + 1 for k in range(len(traffic))]),
+    'mean_user_count': Config.MEAN_USER_COUNT,
+}))
+'''
+
+
+@pytest.fixture(scope='module')
+def shapes():
+    return run_in_load_simulator(SHAPES, LOAD_SHAPE_DATASET=dataset_path('cpu', '08:49'))
+
+
+def test_schedule_replays_the_loop_based_shape(shapes):
+    assert shapes['ticks'] == shapes['loop']
+    assert shapes['ticks_between_seconds'] == shapes['loop']
+    assert len({tuple(stage) for stage in shapes['loop']}) > 10
+    assert shapes['same_seed'] and not shapes['other_seed']
+
+
+def test_traffic_schedule_follows_the_recorded_traffic(shapes):
+    user_counts = np.array([user_count for user_count, _ in shapes['traffic_ticks']])
+    traffic = np.array(shapes['traffic'])
+    expected = np.maximum(np.rint(traffic / traffic.mean() * shapes['mean_user_count']), 1)
+    np.testing.assert_array_equal(user_counts, expected)
+    assert abs(user_counts.mean() - shapes['mean_user_count']) < 1
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+import general_metrics_extractor as extractor
+import metrics_backend
+from conftest import DATASETS
+
+
+def test_placeholder_app_names_without_environment():
+    with pytest.raises(ValueError):
+        metrics_backend.TimeSeriesStore(extractor.build_signals(None, None))
+    metrics_backend.TimeSeriesStore(extractor.build_signals(*metrics_backend.PLACEHOLDER_APP_NAMES))
+
+
+@pytest.mark.parametrize('experiment', ['cpu', 'io'])
+def test_check_round_trips_the_datasets(experiment):
+    result = metrics_backend.check(os.path.join(DATASETS, f'{experiment}_experiments'))
+    assert result['files'] > 0
+    assert result['mismatches'] == []
+    assert result['max_difference'] < 1e-5
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+import profiling
+
+MIB = 2 ** 20
+
+
+@pytest.fixture
+def traced():
+    profiling.reset()
+    profiling.enable(trace_memory=True)
+    yield
+    profiling.disable()
+    profiling.reset()
+
+
+def peaks():
+    return {stack: total['peak_memory_bytes'] for stack, total in profiling.stage_totals().items()}
+
+
+def test_nested_stages_hand_their_peak_up(traced):
+    with profiling.stage('outer'):
+        with profiling.stage('inner'):
+            block = bytearray(8 * MIB)
+            del block
+        with profiling.stage('after'):
+            pass
+
+    stage_peaks = peaks()
+    assert stage_peaks['outer;inner'] >= 8 * MIB
+    assert stage_peaks['outer'] >= 8 * MIB
+    assert stage_peaks['outer;after'] < MIB
+
+
+def test_concurrent_tasks_keep_their_own_stacks_and_peaks(traced):
+    events = []
+
+    async def allocate_then_wait(started, release):
+        with profiling.stage('allocate'):
+            block = bytearray(8 * MIB)
+            del block
+            started.set()
+            await release.wait()
+            events.append('allocate')
+
+    async def wait_then_stage(started, release):
+        await started.wait()
+        # Opens and resets the peak while the other task's stage is open, then closes after it
+        with profiling.stage('wait'):
+            with profiling.stage('nested'):
+                release.set()
+                await asyncio.sleep(0)
+                await asyncio.sleep(0)
+            events.append('wait')
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+        with profiling.stage('run'):
+            await asyncio.gather(allocate_then_wait(started, release), wait_then_stage(started, release))
+
+    asyncio.run(run())
+
+    assert events == ['allocate', 'wait']
+    stage_peaks = peaks()
+    assert set(stage_peaks) == {'run', 'run;allocate', 'run;wait', 'run;wait;nested'}
+    assert stage_peaks['run;allocate'] >= 8 * MIB
+    assert stage_peaks['run'] >= 8 * MIB
+    assert stage_peaks['run;wait;nested'] < MIB
+    assert profiling._open_peaks == {}
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import resampling
+from conftest import METRICS, dataset_path
+
+FILE_PATH = dataset_path('cpu', '08:49')
+N_RESAMPLES = 40
+
+
+@pytest.fixture
+def permutations(monkeypatch):
+    """Records the indices of every block permutation drawn."""
+    drawn = []
+    block_permutation_indices = resampling.block_permutation_indices
+
+    def record(*args):
+        indices = block_permutation_indices(*args)
+        drawn.append(indices)
+        return indices
+
+    monkeypatch.setattr(resampling, 'block_permutation_indices', record)
+    monkeypatch.setattr(resampling, 'CHUNK_SIZE', 16)
+    return drawn
+
+
+def test_pairs_are_permuted_independently(permutations):
+    _, results = resampling._permutation_file_task(FILE_PATH, METRICS, N_RESAMPLES, None, resampling.SEED)
+
+    tested = [column for column, result in results.items() if result['min_p_value'] is not None]
+    chunks = -(-N_RESAMPLES // resampling.CHUNK_SIZE)
+    assert len(tested) > 1 and len(permutations) == chunks * len(tested)
+    pair_indices = [np.vstack(permutations[i:i + chunks]) for i in range(0, len(permutations), chunks)]
+    for i, indices in enumerate(pair_indices):
+        assert len(indices) == N_RESAMPLES
+        assert len(np.unique(indices, axis=0)) > 1
+        for other in pair_indices[i + 1:]:
+            assert indices.shape != other.shape or not np.array_equal(indices, other)
+
+
+def test_permutations_depend_on_the_seed_only():
+    _, results = resampling._permutation_file_task(FILE_PATH, METRICS, N_RESAMPLES, None, resampling.SEED)
+    _, repeated = resampling._permutation_file_task(FILE_PATH, METRICS, N_RESAMPLES, None, resampling.SEED)
+    assert repeated == results
+
+    _, reseeded = resampling._permutation_file_task(FILE_PATH, METRICS, N_RESAMPLES, None, resampling.SEED + 1)
+    p_values = [result['permutation_p_value'] for result in results.values()]
+    assert [result['permutation_p_value'] for result in reseeded.values()] != p_values
+    assert all(p_value is None or 1 / (N_RESAMPLES + 1) <= p_value <= 1 for p_value in p_values)
@@ -0,0 +1,87 @@
+import pytest
+
+from conftest import run_in_load_simulator
+
+SESSION = '''
+import itertools
+import json
+
+from gevent.pywsgi import WSGIServer
+from locust.env import Environment
+
+import helpers
+import user_profiles
+
+requests = []
+tokens = itertools.count(1)
+
+
+def stub_app(environ, start_response):
+    """Answers every API call, with a new access token on every authorization."""
+    requests.append([environ['REQUEST_METHOD'], environ['PATH_INFO'], environ.get('HTTP_X_API_KEY'),
+                     environ.get('HTTP_X_USER_ACCESSTOKEN')])
+    if environ['REQUEST_METHOD'] == 'DELETE':
+        start_response('204 No Content', [])
+        return [b'']
+    token = f'token-{next(tokens)}' if environ['PATH_INFO'].endswith('/auth') else None
+    body = json.dumps({'auth_ref': 'auth-ref', 'access_token': token}).encode()
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body]
+
+
+server = WSGIServer(('127.0.0.1', 0), stub_app, log=None)
+server.start()
+
+
+class User(user_profiles.PrivateUser):
+    host = f'http://127.0.0.1:{server.server_port}'
+
+
+environment = Environment(user_classes=[User])
+environment.private_api_key = 'private-key'
+user = User(environment)
+user.on_start()
+user.query_member_profile()
+headers_reused = user.get_request_headers() is user.get_request_headers()
+user.login_user()
+user.query_member_profile()
+user.on_stop()
+
+print(json.dumps({
+    'user_base': user_profiles.UserBase.__name__,
+    'client': type(user.client).__name__,
+    'headers_reused': headers_reused,
+    'identities_generated': helpers.get_factory().generated['user'],
+    'first_identity': user.user_data['identifier'] == helpers.FakeDataFactory(0, 0).user()['identifier'],
+    'requests': requests,
+}))
+'''
+
+# Every mode sends the same requests: the private key throughout, and the latest token once authorized
+EXPECTED_REQUESTS = [
+    ['POST', '/account/user', 'private-key', None],
+    ['POST', '/account/user/auth', 'private-key', None],
+    ['POST', '/account/user/payments/methods', 'private-key', 'token-1'],
+    ['GET', '/account/user/profile', 'private-key', 'token-1'],
+    ['POST', '/account/user/auth', 'private-key', 'token-1'],
+    ['GET', '/account/user/profile', 'private-key', 'token-2'],
+    ['DELETE', '/account/user', 'private-key', 'token-2'],
+]
+
+
+@pytest.mark.parametrize('env, user_base, client, headers_reused, identities_generated', [
+    ({}, 'HttpUser', 'HttpSession', False, 256),
+    ({'LOAD_FAST_HTTP': '1'}, 'FastHttpUser', 'FastHttpSession', False, 256),
+    ({'LOAD_HIGH_THROUGHPUT': '1', 'LOAD_IDENTITY_POOL_SIZE': '5'}, 'HttpUser', 'HttpSession', True, 5),
+    ({'LOAD_HIGH_THROUGHPUT': '1', 'LOAD_FAST_HTTP': '1', 'LOAD_IDENTITY_POOL_SIZE': '5'},
+     'FastHttpUser', 'FastHttpSession', True, 5),
+], ids=['default', 'fast-http', 'high-throughput', 'high-throughput-fast-http'])
+def test_user_modes_send_the_same_requests(env, user_base, client, headers_reused, identities_generated):
+    session = run_in_load_simulator(SESSION, **env)
+    assert session['user_base'] == user_base
+    assert session['client'] == client
+    assert session['headers_reused'] == headers_reused
+    # The default chunk of identities is generated lazily, the high-throughput pool before the first user
+    assert session['identities_generated'] == identities_generated
+    assert session['first_identity']
+    assert session['requests'] == EXPECTED_REQUESTS